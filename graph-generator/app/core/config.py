@@ -11,11 +11,87 @@ class Settings:
     # MongoDB settings
     MONGO_URI: str = os.getenv("MONGO_URI")
     MONGO_DB: str = os.getenv("MONGO_DB")
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+
+    # Raw Jaeger traces are optional: graph building reads the compact trace_spans store
+    STORE_RAW_TRACES: bool = os.getenv("STORE_RAW_TRACES", "True") == "True"
+    RAW_TRACE_COMPRESSOR: str = os.getenv("RAW_TRACE_COMPRESSOR", "zstd")
 
     # Neo4j settings
     NEO4J_URI: str = os.getenv("NEO4J_URI")
     NEO4J_USER: str = os.getenv("NEO4J_USER")
     NEO4J_PASSWORD: str = os.getenv("NEO4J_PASSWORD")
+    NEO4J_WRITE_BATCH_SIZE: int = int(os.getenv("NEO4J_WRITE_BATCH_SIZE", "1000"))
+    NEO4J_MAX_POOL_SIZE: int = int(os.getenv("NEO4J_MAX_POOL_SIZE", "100"))
+
+    # Jaeger collector settings
+    JAEGER_BASE_URL: str = os.getenv("JAEGER_BASE_URL", "http://localhost:16686/api")
+    COLLECTOR_CONCURRENCY: int = int(os.getenv("COLLECTOR_CONCURRENCY", "16"))
+    COLLECTOR_TIMEOUT_SECONDS: float = float(os.getenv("COLLECTOR_TIMEOUT_SECONDS", "30"))
+    COLLECTOR_MAX_RETRIES: int = int(os.getenv("COLLECTOR_MAX_RETRIES", "3"))
+    COLLECTOR_BACKOFF_SECONDS: float = float(os.getenv("COLLECTOR_BACKOFF_SECONDS", "0.5"))
+    # Adaptive fetch windows: a window that fills a Jaeger page is bisected down to the minimum
+    # size, and sparse windows are widened up to the maximum; the size is kept per service
+    COLLECTOR_PAGE_LIMIT: int = int(os.getenv("COLLECTOR_PAGE_LIMIT", "100"))
+    COLLECTOR_INITIAL_WINDOW_SECONDS: float = float(os.getenv("COLLECTOR_INITIAL_WINDOW_SECONDS", "300"))
+    COLLECTOR_MIN_WINDOW_SECONDS: float = float(os.getenv("COLLECTOR_MIN_WINDOW_SECONDS", "1"))
+    COLLECTOR_MAX_WINDOW_SECONDS: float = float(os.getenv("COLLECTOR_MAX_WINDOW_SECONDS", "3600"))
+    # Per-service collection cadence: busy or lagging services are swept more often, quiet
+    # ones back off towards the maximum interval
+    COLLECTOR_DISCOVERY_INTERVAL_SECONDS: float = float(os.getenv("COLLECTOR_DISCOVERY_INTERVAL_SECONDS", "60"))
+    COLLECTOR_MIN_INTERVAL_SECONDS: float = float(os.getenv("COLLECTOR_MIN_INTERVAL_SECONDS", "15"))
+    COLLECTOR_MAX_INTERVAL_SECONDS: float = float(os.getenv("COLLECTOR_MAX_INTERVAL_SECONDS", "300"))
+    COLLECTOR_TARGET_TRACES_PER_RUN: int = int(os.getenv("COLLECTOR_TARGET_TRACES_PER_RUN", "500"))
+    COLLECTOR_JITTER_RATIO: float = float(os.getenv("COLLECTOR_JITTER_RATIO", "0.1"))
+    COLLECTOR_MAX_IN_FLIGHT: int = int(os.getenv("COLLECTOR_MAX_IN_FLIGHT", "4"))
+    # Replica coordination: replicas heartbeat into MongoDB and split services between the live
+    # ones; a replica silent for COLLECTOR_REPLICA_TIMEOUT_SECONDS is presumed dead and its services
+    # move. Each sweep and singleton job holds a lease that lapses COLLECTOR_LEASE_SECONDS after its
+    # holder's last renewal. The replica id defaults to hostname and process id.
+    COLLECTOR_REPLICA_ID: str = os.getenv("COLLECTOR_REPLICA_ID", "")
+    COLLECTOR_HEARTBEAT_INTERVAL_SECONDS: float = float(os.getenv("COLLECTOR_HEARTBEAT_INTERVAL_SECONDS", "10"))
+    COLLECTOR_REPLICA_TIMEOUT_SECONDS: float = float(os.getenv("COLLECTOR_REPLICA_TIMEOUT_SECONDS", "30"))
+    COLLECTOR_LEASE_SECONDS: float = float(os.getenv("COLLECTOR_LEASE_SECONDS", "60"))
+    # Memory ceiling of the recently stored traceID filter in front of trace upserts; 0 disables it
+    TRACE_FILTER_MAX_MB: float = float(os.getenv("TRACE_FILTER_MAX_MB", "32"))
+
+    # Push ingest settings: payloads are parsed into batches of INGEST_BATCH_SIZE traces and queued
+    # for INGEST_WORKERS writers; a full queue answers 429 after INGEST_ENQUEUE_TIMEOUT_SECONDS
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "200"))
+    INGEST_QUEUE_MAX_BATCHES: int = int(os.getenv("INGEST_QUEUE_MAX_BATCHES", "64"))
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "4"))
+    INGEST_ENQUEUE_TIMEOUT_SECONDS: float = float(os.getenv("INGEST_ENQUEUE_TIMEOUT_SECONDS", "1"))
+    INGEST_MAX_BODY_MB: float = float(os.getenv("INGEST_MAX_BODY_MB", "64"))
+
+    # Graph sync settings
+    GRAPH_SYNC_BATCH_SIZE: int = int(os.getenv("GRAPH_SYNC_BATCH_SIZE", "1000"))
+    # Traces younger than this are left for the next sync, so writes that reserved an
+    # earlier ingest sequence number have time to land before the checkpoint passes them
+    GRAPH_SYNC_SETTLE_SECONDS: float = float(os.getenv("GRAPH_SYNC_SETTLE_SECONDS", "10"))
+
+    # Full graph rebuild settings
+    GRAPH_BUILD_WORKERS: int = int(os.getenv("GRAPH_BUILD_WORKERS", str(os.cpu_count() or 1)))
+    GRAPH_BUILD_SHARD_SIZE: int = int(os.getenv("GRAPH_BUILD_SHARD_SIZE", "2000"))
+
+    # Edge rollup settings
+    ROLLUP_MINUTE_RETENTION_HOURS: int = int(os.getenv("ROLLUP_MINUTE_RETENTION_HOURS", "24"))
+    ROLLUP_COMPACTION_INTERVAL_SECONDS: int = int(os.getenv("ROLLUP_COMPACTION_INTERVAL_SECONDS", "600"))
+
+    # Retention: raw traces and span store documents older than these many hours (by trace start
+    # time) are deleted by TTL indexes; span store traces are folded into the durable edge archive
+    # first. Hourly rollups older than ROLLUP_HOUR_RETENTION_DAYS are deleted. 0 keeps data forever.
+    RAW_TRACE_RETENTION_HOURS: float = float(os.getenv("RAW_TRACE_RETENTION_HOURS", "72"))
+    SPAN_STORE_RETENTION_HOURS: float = float(os.getenv("SPAN_STORE_RETENTION_HOURS", "168"))
+    ROLLUP_HOUR_RETENTION_DAYS: float = float(os.getenv("ROLLUP_HOUR_RETENTION_DAYS", "0"))
+    RETENTION_INTERVAL_SECONDS: int = int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+
+    # Anti-pattern detection thresholds
+    ANTI_PATTERN_CHATTY_CALLS_PER_TRACE: float = float(os.getenv("ANTI_PATTERN_CHATTY_CALLS_PER_TRACE", "10"))
+    ANTI_PATTERN_HUB_FAN_IN: int = int(os.getenv("ANTI_PATTERN_HUB_FAN_IN", "10"))
+    ANTI_PATTERN_HUB_FAN_OUT: int = int(os.getenv("ANTI_PATTERN_HUB_FAN_OUT", "10"))
+    ANTI_PATTERN_CHAIN_HOPS: int = int(os.getenv("ANTI_PATTERN_CHAIN_HOPS", "5"))
 
 
 settings = Settings()
@@ -1,9 +1,14 @@
 import certifi
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, MongoClient
 from pymongo.errors import ConnectionFailure, CollectionInvalid
-from neo4j import GraphDatabase
+from neo4j import AsyncGraphDatabase, GraphDatabase
 from app.core.config import settings
 
+NEO4J_SCHEMA = [
+    # Backs every MERGE on Service.name with an index instead of a label scan
+    "CREATE CONSTRAINT service_name_unique IF NOT EXISTS FOR (s:Service) REQUIRE s.name IS UNIQUE",
+]
+
 
 class DatabaseManager:
     def __init__(self):
@@ -12,9 +17,33 @@ class DatabaseManager:
         self.trace_collection = None
         self.trace_updates = None
         self.trace_collection_updates = None
+        self.counters = None
+        self.edge_rollups = None
+        self.trace_spans = None
+        self.service_registry = None
+        self.edge_archive = None
+        self.collector_replicas = None
+        self.collection_leases = None
+        self.graph_deltas = None
+        self.operation_edges = None
+        self.operation_edge_archive = None
+
+        # Async MongoDB client for the event loop (API routes and the collector); the sync
+        # client above serves batch jobs that run in worker threads and processes
+        self.async_mongo_client = None
+        self.async_trace_collection = None
+        self.async_trace_updates = None
+        self.async_trace_collection_updates = None
+        self.async_counters = None
+        self.async_edge_rollups = None
+        self.async_trace_spans = None
+        self.async_service_registry = None
+        self.async_collector_replicas = None
+        self.async_collection_leases = None
 
-        # Neo4j driver
+        # Neo4j drivers
         self.neo4j_driver = None
+        self.async_neo4j_driver = None
 
     async def initialize_mongo(self):
         """
@@ -22,22 +51,69 @@ class DatabaseManager:
         """
         try:
             # Connect to MongoDB
-            self.mongo_client = MongoClient(settings.MONGO_URI, tlsCAFile=certifi.where())
+            pool_options = {"maxPoolSize": settings.MONGO_MAX_POOL_SIZE, "minPoolSize": settings.MONGO_MIN_POOL_SIZE}
+            self.mongo_client = MongoClient(settings.MONGO_URI, tlsCAFile=certifi.where(), **pool_options)
             self.mongo_client.admin.command("ping")
+            self.async_mongo_client = AsyncMongoClient(settings.MONGO_URI, tlsCAFile=certifi.where(), **pool_options)
+            await self.async_mongo_client.admin.command("ping")
             db = self.mongo_client[settings.MONGO_DB]
 
             # Explicitly check or create collections
             if "traces" not in db.list_collection_names():
-                db.create_collection("traces")
+                # Raw traces are rarely read back; store them with heavier block compression
+                db.create_collection("traces", storageEngine={
+                    "wiredTiger": {"configString": f"block_compressor={settings.RAW_TRACE_COMPRESSOR}"}
+                })
             if "trace_updates" not in db.list_collection_names():
                 db.create_collection("trace_updates")
             if "trace_collection_updates" not in db.list_collection_names():
                 db.create_collection("trace_collection_updates")
+            if "counters" not in db.list_collection_names():
+                db.create_collection("counters")
+            if "edge_rollups" not in db.list_collection_names():
+                db.create_collection("edge_rollups")
+            if "trace_spans" not in db.list_collection_names():
+                db.create_collection("trace_spans")
+            if "service_registry" not in db.list_collection_names():
+                db.create_collection("service_registry")
+            if "edge_archive" not in db.list_collection_names():
+                db.create_collection("edge_archive")
+            if "collector_replicas" not in db.list_collection_names():
+                db.create_collection("collector_replicas")
+            if "collection_leases" not in db.list_collection_names():
+                db.create_collection("collection_leases")
+            if "graph_deltas" not in db.list_collection_names():
+                db.create_collection("graph_deltas")
+            if "operation_edges" not in db.list_collection_names():
+                db.create_collection("operation_edges")
+            if "operation_edge_archive" not in db.list_collection_names():
+                db.create_collection("operation_edge_archive")
 
             # Assign collections
             self.trace_collection = db["traces"]
             self.trace_updates = db["trace_updates"]
             self.trace_collection_updates = db["trace_collection_updates"]
+            self.counters = db["counters"]
+            self.edge_rollups = db["edge_rollups"]
+            self.trace_spans = db["trace_spans"]
+            self.service_registry = db["service_registry"]
+            self.edge_archive = db["edge_archive"]
+            self.collector_replicas = db["collector_replicas"]
+            self.collection_leases = db["collection_leases"]
+            self.graph_deltas = db["graph_deltas"]
+            self.operation_edges = db["operation_edges"]
+            self.operation_edge_archive = db["operation_edge_archive"]
+
+            async_db = self.async_mongo_client[settings.MONGO_DB]
+            self.async_trace_collection = async_db["traces"]
+            self.async_trace_updates = async_db["trace_updates"]
+            self.async_trace_collection_updates = async_db["trace_collection_updates"]
+            self.async_counters = async_db["counters"]
+            self.async_edge_rollups = async_db["edge_rollups"]
+            self.async_trace_spans = async_db["trace_spans"]
+            self.async_service_registry = async_db["service_registry"]
+            self.async_collector_replicas = async_db["collector_replicas"]
+            self.async_collection_leases = async_db["collection_leases"]
 
             print(f"MongoDB connected successfully. Collections initialized: "
                   f"trace_collection={self.trace_collection}, trace_updates={self.trace_updates}")
@@ -51,6 +127,8 @@ class DatabaseManager:
         """
         if self.mongo_client is not None:
             self.mongo_client.close()
+            if self.async_mongo_client is not None:
+                await self.async_mongo_client.close()
             print("MongoDB connection closed.")
         else:
             print("MongoDB client was not initialized.")
@@ -63,7 +141,8 @@ class DatabaseManager:
             # Connect to Neo4j
             self.neo4j_driver = GraphDatabase.driver(
                 settings.NEO4J_URI,
-                auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD)
+                auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
+                max_connection_pool_size=settings.NEO4J_MAX_POOL_SIZE,
             )
             self.neo4j_driver.verify_connectivity()
             print("Neo4j connected successfully.")
@@ -71,6 +150,34 @@ class DatabaseManager:
             print(f"Neo4j connection failed: {e}")
             raise e
 
+    async def initialize_async_neo4j(self):
+        """
+        Initialize the async Neo4j driver used by API routes.
+        """
+        try:
+            self.async_neo4j_driver = AsyncGraphDatabase.driver(
+                settings.NEO4J_URI,
+                auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
+                max_connection_pool_size=settings.NEO4J_MAX_POOL_SIZE,
+            )
+            await self.async_neo4j_driver.verify_connectivity()
+            print("Async Neo4j driver connected successfully.")
+        except Exception as e:
+            print(f"Async Neo4j connection failed: {e}")
+            raise e
+
+    def ensure_neo4j_schema(self):
+        """
+        Create the Neo4j constraints and indexes the graph writer relies on.
+        """
+        try:
+            with self.neo4j_driver.session() as session:
+                for statement in NEO4J_SCHEMA:
+                    session.run(statement).consume()
+            print("Neo4j schema ensured.")
+        except Exception as e:
+            print(f"Failed to ensure Neo4j schema: {e}")
+
     def close_neo4j(self):
         """
         Close Neo4j connection.
@@ -81,6 +188,14 @@ class DatabaseManager:
         else:
             print("Neo4j driver was not initialized.")
 
+    async def close_async_neo4j(self):
+        """
+        Close the async Neo4j driver.
+        """
+        if self.async_neo4j_driver is not None:
+            await self.async_neo4j_driver.close()
+            print("Async Neo4j driver closed.")
+
     def get_trace_collection(self):
         """
         Get MongoDB 'traces' collection.
@@ -105,6 +220,167 @@ class DatabaseManager:
             raise RuntimeError("MongoDB 'trace_collection_updates' collection is not initialized.")
         return self.trace_collection_updates
 
+    def get_counters_collection(self):
+        """
+        Get MongoDB 'counters' collection.
+        """
+        if self.counters is None:
+            raise RuntimeError("MongoDB 'counters' collection is not initialized.")
+        return self.counters
+
+    def get_edge_rollups_collection(self):
+        """
+        Get MongoDB 'edge_rollups' collection.
+        """
+        if self.edge_rollups is None:
+            raise RuntimeError("MongoDB 'edge_rollups' collection is not initialized.")
+        return self.edge_rollups
+
+
+    def get_trace_spans_collection(self):
+        """
+        Get MongoDB 'trace_spans' collection.
+        """
+        if self.trace_spans is None:
+            raise RuntimeError("MongoDB 'trace_spans' collection is not initialized.")
+        return self.trace_spans
+
+    def get_service_registry_collection(self):
+        """
+        Get MongoDB 'service_registry' collection.
+        """
+        if self.service_registry is None:
+            raise RuntimeError("MongoDB 'service_registry' collection is not initialized.")
+        return self.service_registry
+
+    def get_edge_archive_collection(self):
+        """
+        Get MongoDB 'edge_archive' collection.
+        """
+        if self.edge_archive is None:
+            raise RuntimeError("MongoDB 'edge_archive' collection is not initialized.")
+        return self.edge_archive
+
+    def get_collector_replicas_collection(self):
+        """
+        Get MongoDB 'collector_replicas' collection.
+        """
+        if self.collector_replicas is None:
+            raise RuntimeError("MongoDB 'collector_replicas' collection is not initialized.")
+        return self.collector_replicas
+
+    def get_collection_leases_collection(self):
+        """
+        Get MongoDB 'collection_leases' collection.
+        """
+        if self.collection_leases is None:
+            raise RuntimeError("MongoDB 'collection_leases' collection is not initialized.")
+        return self.collection_leases
+
+    def get_graph_deltas_collection(self):
+        """
+        Get MongoDB 'graph_deltas' collection.
+        """
+        if self.graph_deltas is None:
+            raise RuntimeError("MongoDB 'graph_deltas' collection is not initialized.")
+        return self.graph_deltas
+
+    def get_operation_edges_collection(self):
+        """
+        Get MongoDB 'operation_edges' collection.
+        """
+        if self.operation_edges is None:
+            raise RuntimeError("MongoDB 'operation_edges' collection is not initialized.")
+        return self.operation_edges
+
+    def get_operation_edge_archive_collection(self):
+        """
+        Get MongoDB 'operation_edge_archive' collection.
+        """
+        if self.operation_edge_archive is None:
+            raise RuntimeError("MongoDB 'operation_edge_archive' collection is not initialized.")
+        return self.operation_edge_archive
+
+    def get_async_trace_collection(self):
+        """
+        Get the async MongoDB 'traces' collection.
+        """
+        if self.async_trace_collection is None:
+            raise RuntimeError("Async MongoDB 'traces' collection is not initialized.")
+        return self.async_trace_collection
+
+    def get_async_trace_updates_collection(self):
+        """
+        Get the async MongoDB 'trace_updates' collection.
+        """
+        if self.async_trace_updates is None:
+            raise RuntimeError("Async MongoDB 'trace_updates' collection is not initialized.")
+        return self.async_trace_updates
+
+    def get_async_trace_collection_updates_collection(self):
+        """
+        Get the async MongoDB 'trace_collection_updates' collection.
+        """
+        if self.async_trace_collection_updates is None:
+            raise RuntimeError("Async MongoDB 'trace_collection_updates' collection is not initialized.")
+        return self.async_trace_collection_updates
+
+    def get_async_counters_collection(self):
+        """
+        Get the async MongoDB 'counters' collection.
+        """
+        if self.async_counters is None:
+            raise RuntimeError("Async MongoDB 'counters' collection is not initialized.")
+        return self.async_counters
+
+    def get_async_edge_rollups_collection(self):
+        """
+        Get the async MongoDB 'edge_rollups' collection.
+        """
+        if self.async_edge_rollups is None:
+            raise RuntimeError("Async MongoDB 'edge_rollups' collection is not initialized.")
+        return self.async_edge_rollups
+
+    def get_async_trace_spans_collection(self):
+        """
+        Get the async MongoDB 'trace_spans' collection.
+        """
+        if self.async_trace_spans is None:
+            raise RuntimeError("Async MongoDB 'trace_spans' collection is not initialized.")
+        return self.async_trace_spans
+
+    def get_async_service_registry_collection(self):
+        """
+        Get the async MongoDB 'service_registry' collection.
+        """
+        if self.async_service_registry is None:
+            raise RuntimeError("Async MongoDB 'service_registry' collection is not initialized.")
+        return self.async_service_registry
+
+    def get_async_collector_replicas_collection(self):
+        """
+        Get the async MongoDB 'collector_replicas' collection.
+        """
+        if self.async_collector_replicas is None:
+            raise RuntimeError("Async MongoDB 'collector_replicas' collection is not initialized.")
+        return self.async_collector_replicas
+
+    def get_async_collection_leases_collection(self):
+        """
+        Get the async MongoDB 'collection_leases' collection.
+        """
+        if self.async_collection_leases is None:
+            raise RuntimeError("Async MongoDB 'collection_leases' collection is not initialized.")
+        return self.async_collection_leases
+
+    def get_async_neo4j_driver(self):
+        """
+        Get the async Neo4j driver.
+        """
+        if self.async_neo4j_driver is None:
+            raise RuntimeError("Async Neo4j driver is not initialized.")
+        return self.async_neo4j_driver
+
 
 # Instantiate a global DatabaseManager
 db_manager = DatabaseManager()
@@ -0,0 +1,125 @@
+import asyncio
+import functools
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Latency buckets in seconds, from sub-millisecond Mongo writes to multi-second Jaeger pages
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+JOB_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+WINDOW_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+TRACE_COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+JAEGER_REQUEST_SECONDS = Histogram(
+    "jaeger_request_seconds", "Latency of Jaeger query API requests, including retries.",
+    ["endpoint", "status"], buckets=LATENCY_BUCKETS,
+)
+COLLECTOR_WINDOW_SECONDS = Histogram(
+    "collector_window_seconds", "Size of the time windows fetched from Jaeger.", buckets=WINDOW_BUCKETS,
+)
+COLLECTOR_TRACES_PER_WINDOW = Histogram(
+    "collector_traces_per_window", "Traces returned by Jaeger per fetch window.", buckets=TRACE_COUNT_BUCKETS,
+)
+COLLECTOR_WINDOW_SPLITS_TOTAL = Counter(
+    "collector_window_splits_total", "Fetch windows bisected because Jaeger returned a full page.",
+)
+COLLECTOR_TRUNCATED_WINDOWS_TOTAL = Counter(
+    "collector_truncated_windows_total", "Minimum-size fetch windows that still returned a full page.",
+)
+TRACE_UPSERT_SECONDS = Histogram(
+    "trace_upsert_seconds", "Latency of one bulk trace upsert into MongoDB.", buckets=LATENCY_BUCKETS,
+)
+TRACES_STORED_TOTAL = Counter(
+    "traces_stored_total", "Traces written by the collector, by result.", ["result"],
+)
+TRACE_FILTER_LOOKUPS_TOTAL = Counter(
+    "trace_filter_lookups_total", "Fetched traces checked against the recently stored filter, by result.", ["result"],
+)
+INGEST_TRACES_TOTAL = Counter(
+    "ingest_traces_total", "Traces accepted by the push ingest endpoint, by payload format.", ["format"],
+)
+INGEST_REJECTED_TOTAL = Counter(
+    "ingest_rejected_total", "Push ingest requests, or malformed traces in them, rejected by reason.", ["reason"],
+)
+INGEST_QUEUE_BATCHES = Gauge(
+    "ingest_queue_batches", "Trace batches waiting in the push ingest queue.",
+)
+INGEST_LAG_SECONDS = Gauge(
+    "ingest_lag_seconds", "Seconds between now and the service's last fetched end time.", ["service"],
+)
+GRAPH_BUILD_SECONDS = Histogram(
+    "graph_build_seconds", "Time to build a dependency graph from traces.", ["mode"], buckets=LATENCY_BUCKETS,
+)
+NEO4J_WRITE_SECONDS = Histogram(
+    "neo4j_write_seconds", "Time to write a dependency graph to Neo4j.", buckets=LATENCY_BUCKETS,
+)
+SCHEDULER_JOB_SECONDS = Histogram(
+    "scheduler_job_seconds", "Duration of scheduled job runs.", ["job"], buckets=JOB_BUCKETS,
+)
+SCHEDULER_JOB_OVERRUNS_TOTAL = Counter(
+    "scheduler_job_overruns_total", "Scheduled job runs that took longer than their interval.", ["job"],
+)
+SCHEDULER_JOB_SKIPPED_TOTAL = Counter(
+    "scheduler_job_skipped_total", "Scheduled job runs skipped by the scheduler.", ["job", "reason"],
+)
+
+# Last fetched end time per service; lag is derived from it only when /metrics is scraped
+_ingest_checkpoints_us = {}
+
+
+def record_ingest_checkpoint(service_name, checkpoint_us):
+    """
+    Record how far a service has been collected. The lag gauge is computed lazily at
+    scrape time, so the collector only pays for a dictionary write.
+    """
+    if service_name not in _ingest_checkpoints_us:
+        INGEST_LAG_SECONDS.labels(service_name).set_function(
+            lambda: time.time() - _ingest_checkpoints_us[service_name] / 1e6
+        )
+    _ingest_checkpoints_us[service_name] = checkpoint_us
+
+
+def record_job_run(job_id, elapsed, interval_seconds=None):
+    """
+    Record one scheduled job run's duration, counting it as an overrun when it outlasted its interval.
+    """
+    SCHEDULER_JOB_SECONDS.labels(job_id).observe(elapsed)
+    if interval_seconds and elapsed > interval_seconds:
+        SCHEDULER_JOB_OVERRUNS_TOTAL.labels(job_id).inc()
+        print(f"Scheduled job {job_id} took {elapsed:.1f}s, longer than its {interval_seconds}s interval.")
+
+
+def instrument_job(job_id, func, interval_seconds=None):
+    """
+    Wrap a scheduled job (sync or coroutine) so each run records its duration and overruns.
+    Args:
+        job_id (str): Scheduler job id, used as the metric label.
+        func (callable): The job function.
+        interval_seconds (float): The job's trigger interval; runs longer than this count as overruns.
+    """
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                record_job_run(job_id, time.perf_counter() - started, interval_seconds)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_job_run(job_id, time.perf_counter() - started, interval_seconds)
+    return wrapper
+
+
+def render_metrics():
+    """
+    Render every registered metric in the Prometheus text exposition format.
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
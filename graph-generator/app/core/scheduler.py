@@ -1,23 +1,111 @@
+from datetime import datetime, timezone
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from app.services.data_collector import fetch_and_store_traces_for_all_services
+from app.core.config import settings
+from app.core.metrics import SCHEDULER_JOB_SKIPPED_TOTAL, instrument_job
+from app.services.collection_scheduler import SERVICE_COLLECTOR_JOB, CollectionScheduler
+from app.services.replica_coordinator import GRAPH_WRITE_LEASE, LeaseLostError, ReplicaCoordinator
+from app.services.retention import apply_retention
+from app.services.rollups import compact_edge_rollups
 
 scheduler = AsyncIOScheduler()
+replica_coordinator = ReplicaCoordinator()
+collection_scheduler = CollectionScheduler(scheduler, replica_coordinator)
+
+
+def record_skipped_job(event):
+    """
+    Count job runs the scheduler skipped, either because the previous run was still going
+    (max instances reached) or because the run time was missed entirely.
+    """
+    reason = "max_instances" if event.code == EVENT_JOB_MAX_INSTANCES else "missed"
+    # Per-service collection jobs share one metric label; per-service counts are in the scheduler stats
+    job_label = SERVICE_COLLECTOR_JOB if collection_scheduler.record_skip(event.job_id, reason) else event.job_id
+    SCHEDULER_JOB_SKIPPED_TOTAL.labels(job_label, reason).inc()
+
+
+def run_on_one_replica(job_id, func, lease=None):
+    """
+    Wrap a sync job so that only the replica holding its lease runs it, in a worker thread.
+    The lease defaults to one of its own; jobs that must not overlap with others share one.
+    `func` takes a `lease_held` callable and stops between batches once the lease is lost.
+    """
+    async def run():
+        try:
+            ran, _ = await replica_coordinator.run_in_thread_with_lease(lease or f"job:{job_id}", func)
+        except LeaseLostError as e:
+            print(f"Stopped {job_id}: {e}")
+            return
+        if not ran:
+            print(f"Skipping {job_id}: another replica is running it.")
+    return run
 
 
 def start_scheduler():
     """
-    Start the scheduler and schedule the trace fetching job.
+    Start the scheduler and schedule service discovery, which gives each service its own collection job.
+    Replicas split the services between them through heartbeats; the maintenance jobs run on
+    whichever replica takes their lease.
     """
-    # Schedule the task to run every 30 seconds
     scheduler.add_job(
-        fetch_and_store_traces_for_all_services,
-        trigger=IntervalTrigger(seconds=60),
-        id="trace_fetcher",
+        instrument_job(
+            "replica_heartbeat", collection_scheduler.heartbeat, settings.COLLECTOR_HEARTBEAT_INTERVAL_SECONDS
+        ),
+        trigger=IntervalTrigger(seconds=settings.COLLECTOR_HEARTBEAT_INTERVAL_SECONDS),
+        id="replica_heartbeat",
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now(timezone.utc),
         replace_existing=True,
     )
 
-    print("Scheduler started. Fetching traces every 60 seconds.")
+    # Discover services right away, then periodically; the job is a coroutine and runs on the event loop
+    scheduler.add_job(
+        instrument_job(
+            "service_discovery", collection_scheduler.discover_services, settings.COLLECTOR_DISCOVERY_INTERVAL_SECONDS
+        ),
+        trigger=IntervalTrigger(seconds=settings.COLLECTOR_DISCOVERY_INTERVAL_SECONDS),
+        id="service_discovery",
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now(timezone.utc),
+        replace_existing=True,
+    )
+
+    # Fold old 1-minute edge rollups into hourly buckets, in a worker thread
+    scheduler.add_job(
+        instrument_job(
+            "rollup_compactor", run_on_one_replica("rollup_compactor", compact_edge_rollups),
+            settings.ROLLUP_COMPACTION_INTERVAL_SECONDS,
+        ),
+        trigger=IntervalTrigger(seconds=settings.ROLLUP_COMPACTION_INTERVAL_SECONDS),
+        id="rollup_compactor",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
+
+    # Fold and expire traces past their retention; runs in a worker thread like the compactor.
+    # Archiving writes the graph, so it holds the graph write lease that graph sync and rebuild
+    # take too: the graph write lock is process-local and would not stop another replica
+    scheduler.add_job(
+        instrument_job(
+            "retention", run_on_one_replica("retention", apply_retention, lease=GRAPH_WRITE_LEASE),
+            settings.RETENTION_INTERVAL_SECONDS,
+        ),
+        trigger=IntervalTrigger(seconds=settings.RETENTION_INTERVAL_SECONDS),
+        id="retention",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
+
+    scheduler.add_listener(record_skipped_job, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+    print(
+        f"Scheduler started. Collecting each service every {settings.COLLECTOR_MIN_INTERVAL_SECONDS:g}-"
+        f"{settings.COLLECTOR_MAX_INTERVAL_SECONDS:g} seconds depending on its traffic."
+    )
     scheduler.start()
 
 
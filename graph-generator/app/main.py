@@ -2,8 +2,16 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.database import db_manager
-from app.core.scheduler import start_scheduler, stop_scheduler
-from app.routers import traces_router, graphs_router, services_router
+from app.core.scheduler import replica_coordinator, start_scheduler, stop_scheduler
+from app.routers import traces_router, graphs_router, services_router, anti_patterns_router, metrics_router, scheduler_router, ingest_router, storage_router
+from app.services.anti_patterns import setup_anti_pattern_indexes
+from app.services.data_collector import close_jaeger_client, setup_indexes
+from app.services.ingest import start_ingest_workers, stop_ingest_workers
+from app.services.operation_graph import setup_operation_graph_indexes
+from app.services.replica_coordinator import setup_coordination_indexes
+from app.services.retention import setup_retention_indexes
+from app.services.rollups import setup_rollup_indexes
+from app.services.span_store import setup_span_store_indexes
 
 app = FastAPI(title="Graph Generator")
 
@@ -20,22 +28,41 @@ app.add_middleware(
 app.include_router(traces_router, prefix="/api/traces", tags=["Traces"])
 app.include_router(graphs_router, prefix="/api/graphs", tags=["Graphs"])
 app.include_router(services_router, prefix="/api/services", tags=["Graphs"])
+app.include_router(anti_patterns_router, prefix="/api/anti-patterns", tags=["Anti-patterns"])
+app.include_router(ingest_router, prefix="/api/ingest", tags=["Ingest"])
+app.include_router(storage_router, prefix="/api/storage", tags=["Storage"])
+app.include_router(scheduler_router, prefix="/api/scheduler", tags=["Scheduler"])
+app.include_router(metrics_router, prefix="/metrics", tags=["Metrics"])
 
 
 @app.on_event("startup")
 async def startup():
     print("Starting up: Initializing database connection...")
     await db_manager.initialize_mongo()
+    setup_indexes()
+    setup_rollup_indexes()
+    setup_span_store_indexes()
+    setup_retention_indexes()
+    setup_coordination_indexes()
+    setup_anti_pattern_indexes()
+    setup_operation_graph_indexes()
     db_manager.initialize_neo4j()
+    await db_manager.initialize_async_neo4j()
+    db_manager.ensure_neo4j_schema()
+    start_ingest_workers()
     start_scheduler()
 
 
 @app.on_event("shutdown")
 async def shutdown():
     print("Shutting down: Closing database connection...")
+    await stop_ingest_workers()
+    await replica_coordinator.leave()
     await db_manager.close_mongo()
     db_manager.close_neo4j()
+    await db_manager.close_async_neo4j()
     stop_scheduler()
+    await close_jaeger_client()
 
 
 @app.get("/")
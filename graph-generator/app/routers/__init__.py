@@ -1,5 +1,12 @@
 from app.routers.traces import router as traces_router
 from app.routers.graphs import router as graphs_router
 from app.routers.services import router as services_router
+from app.routers.anti_patterns import router as anti_patterns_router
+from app.routers.metrics import router as metrics_router
+from app.routers.scheduler import router as scheduler_router
+from app.routers.ingest import router as ingest_router
+from app.routers.storage import router as storage_router
 
-__all__ = ["traces_router", "graphs_router", "services_router"]
+__all__ = ["traces_router", "graphs_router", "services_router", "anti_patterns_router", "metrics_router",
+           "scheduler_router", "ingest_router",
+           "storage_router"]
@@ -0,0 +1,21 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+
+from app.services.anti_patterns import ANTI_PATTERN_TYPES, get_anti_patterns
+
+router = APIRouter()
+
+
+@router.get("")
+async def list_anti_patterns(type: Optional[str] = None):
+    """
+    Endpoint to list detected anti-patterns, optionally filtered by type.
+    """
+    if type is not None and type not in ANTI_PATTERN_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown anti-pattern type. Expected one of {ANTI_PATTERN_TYPES}.")
+    try:
+        return {"status": "success", "anti_patterns": await asyncio.to_thread(get_anti_patterns, type)}
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to detect anti-patterns: {str(e)}"}
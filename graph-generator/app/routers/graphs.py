@@ -1,10 +1,19 @@
-from fastapi import APIRouter
-from app.services.graph_processor import (
-    generate_weighted_graph_from_traces,
-    update_graph_in_neo4j,
-    get_graph_data_as_json
-)
-from app.services.graph_updater import fetch_new_traces_since_last_sync, update_last_sync_date
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from networkx.readwrite import json_graph
+
+from app.core.scheduler import replica_coordinator
+from app.services.graph_analytics import compute_graph_analytics
+from app.services.graph_cache import etag_matches, format_etag, get_graph_version_async, graph_cache
+from app.services.graph_processor import read_graph_from_neo4j_async
+from app.services.graph_updater import rebuild_graph_from_all_traces, sync_graph_incrementally
+from app.services.operation_graph import get_operation_graph_data
+from app.services.replica_coordinator import GRAPH_WRITE_LEASE
+from app.services.rollups import build_windowed_graph
 
 router = APIRouter()
 
@@ -13,34 +22,149 @@ router = APIRouter()
 async def create_dependency_graph():
     """
     Endpoint to create or update the dependency graph.
+    The sync runs in a worker thread so the API keeps serving requests meanwhile, under the
+    graph write lease; answers 409 Conflict while another replica is writing the graph.
     """
     try:
-        new_traces = fetch_new_traces_since_last_sync()
-        if not new_traces:
-            return {"status": "success", "message": "No new traces to process."}
+        ran, synced = await replica_coordinator.run_in_thread_with_lease(GRAPH_WRITE_LEASE, sync_graph_incrementally)
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to update graph: {str(e)}"}
+    if not ran:
+        raise HTTPException(status_code=409, detail="Another replica is writing the dependency graph.")
+    if not synced:
+        return {"status": "success", "message": "No new traces to process."}
 
-        graph = generate_weighted_graph_from_traces(new_traces)
-        update_graph_in_neo4j(graph)
+    return {"status": "success", "message": f"Dependency graph updated successfully with {synced} traces."}
 
-        # Ensure `startTime` is accessed safely
-        latest_sync_date = max(
-            span["startTime"] if isinstance(span["startTime"], int) else int(span["startTime"]["$numberLong"])
-            for trace in new_traces for span in trace["spans"]
-        )
-        update_last_sync_date(latest_sync_date)
 
-        return {"status": "success", "message": "Dependency graph updated successfully."}
+@router.post("/rebuild")
+async def rebuild_dependency_graph(
+        workers: Optional[int] = Query(None, ge=1, description="Build processes, defaults to GRAPH_BUILD_WORKERS"),
+        shard_size: Optional[int] = Query(None, ge=1, description="Traces per worker shard"),
+):
+    """
+    Endpoint to rebuild the dependency graph from every stored trace.
+    Runs under the graph write lease, like graph sync.
+    """
+    try:
+        ran, processed = await replica_coordinator.run_in_thread_with_lease(
+            GRAPH_WRITE_LEASE, rebuild_graph_from_all_traces, workers=workers, shard_size=shard_size,
+        )
     except Exception as e:
-        return {"status": "error", "message": f"Failed to update graph: {str(e)}"}
+        return {"status": "error", "message": f"Failed to rebuild graph: {str(e)}"}
+    if not ran:
+        raise HTTPException(status_code=409, detail="Another replica is writing the dependency graph.")
+    return {"status": "success", "message": f"Dependency graph rebuilt from {processed} traces."}
 
 
 @router.get("/")
-async def fetch_dependency_graph():
+async def fetch_dependency_graph(
+        if_none_match: Optional[str] = Header(None),
+        from_: Optional[datetime] = Query(None, alias="from", description="Window start (ISO 8601)"),
+        to: Optional[datetime] = Query(None, description="Window end (ISO 8601), defaults to now"),
+        level: str = Query("service", pattern="^(service|operation)$", description="Node granularity"),
+):
     """
     Endpoint to fetch the dependency graph as JSON data.
+    Without a window, the cumulative graph is served from a cache keyed by graph version;
+    clients polling with If-None-Match get 304 Not Modified until the graph changes.
+    With `from`/`to`, the graph is summed from time-bucketed edge rollups.
+    With `level=operation`, nodes are (service, operation) pairs. The cumulative operation
+    graph is kept up to date by graph sync and still counts traces removed by retention; a
+    window selects span store traces by start time, so it only covers retained traces.
+    """
+    window = _parse_window(from_, to) if from_ is not None or to is not None else None
+    if level == "operation":
+        return await _fetch_operation_graph(if_none_match, window)
+
+    if window is not None:
+        try:
+            graph_data = json_graph.node_link_data(await build_windowed_graph(*window))
+            return {"status": "success", "graph": graph_data}
+        except Exception as e:
+            return {"status": "error", "message": f"Failed to fetch graph: {str(e)}"}
+
+    try:
+        version = await get_graph_version_async()
+        etag = format_etag(version)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
+        async def build():
+            graph = await read_graph_from_neo4j_async()
+            return json.dumps({"status": "success", "graph": json_graph.node_link_data(graph)}).encode()
+
+        body = await graph_cache.get_async("service", version, build)
+        return Response(content=body, media_type="application/json", headers=headers)
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to fetch graph: {str(e)}"}
+
+
+@router.get("/analytics")
+async def fetch_graph_analytics(if_none_match: Optional[str] = Header(None)):
+    """
+    Endpoint to fetch per-service PageRank, betweenness, degree and reachability metrics.
+    They are computed once per graph version and served from the graph cache, with the
+    same ETag/If-None-Match handling as the graph itself.
+    """
+    try:
+        version = await get_graph_version_async()
+        etag = format_etag(version, "analytics")
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
+        async def build():
+            graph = await read_graph_from_neo4j_async()
+            analytics = await asyncio.to_thread(compute_graph_analytics, graph)
+            return json.dumps({"status": "success", **analytics}).encode()
+
+        body = await graph_cache.get_async("analytics", version, build)
+        return Response(content=body, media_type="application/json", headers=headers)
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to compute graph analytics: {str(e)}"}
+
+
+async def _fetch_operation_graph(if_none_match, window):
+    """
+    Serve the operation-level graph, cached per graph version when no window is given.
     """
     try:
-        graph_data = get_graph_data_as_json()
-        return {"status": "success", "graph": graph_data}
+        if window is not None:
+            start_s, end_s = window
+            graph_data = await asyncio.to_thread(get_operation_graph_data, start_s * 1_000_000, end_s * 1_000_000)
+            return {"status": "success", "graph": graph_data}
+
+        version = await get_graph_version_async()
+        etag = format_etag(version, "operation")
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
+        async def build():
+            graph_data = await asyncio.to_thread(get_operation_graph_data)
+            return json.dumps({"status": "success", "graph": graph_data}).encode()
+
+        body = await graph_cache.get_async("operation", version, build)
+        return Response(content=body, media_type="application/json", headers=headers)
     except Exception as e:
         return {"status": "error", "message": f"Failed to fetch graph: {str(e)}"}
+
+
+def _parse_window(from_, to):
+    """
+    Resolve `from`/`to` query parameters to whole epoch seconds; `to` defaults to now.
+    """
+    start_s = int(_as_utc(from_).timestamp()) if from_ is not None else 0
+    end_s = int(_as_utc(to).timestamp()) if to is not None else int(datetime.now(timezone.utc).timestamp())
+    if start_s >= end_s:
+        raise HTTPException(status_code=400, detail="`from` must be earlier than `to`.")
+    return start_s, end_s
+
+
+def _as_utc(value):
+    """
+    Treat naive datetimes from query parameters as UTC.
+    """
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
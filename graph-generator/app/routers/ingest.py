@@ -0,0 +1,49 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from app.core.metrics import INGEST_REJECTED_TOTAL
+from app.services.ingest import (
+    SUPPORTED_ENCODINGS,
+    IngestQueueFull,
+    PayloadTooLarge,
+    enqueue_payload,
+    get_ingest_queue,
+)
+
+router = APIRouter()
+RETRY_AFTER_SECONDS = "1"
+
+
+@router.post("", status_code=202)
+async def ingest_traces(request: Request):
+    """
+    Accept a batch of pushed traces (Jaeger JSON or OTLP/JSON, optionally gzip-compressed)
+    and queue it for storage. Answers 429 with Retry-After when the ingest queue is full.
+    """
+    encoding = request.headers.get("content-encoding", "identity").lower()
+    if encoding not in SUPPORTED_ENCODINGS:
+        INGEST_REJECTED_TOTAL.labels("unsupported_encoding").inc()
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding. Expected one of {SUPPORTED_ENCODINGS}.")
+
+    # Reject before reading the body when there is clearly no room
+    if get_ingest_queue().full():
+        INGEST_REJECTED_TOTAL.labels("queue_full").inc()
+        return JSONResponse(
+            status_code=429, headers={"Retry-After": RETRY_AFTER_SECONDS},
+            content={"status": "error", "message": "Ingest queue is full.", "accepted": 0},
+        )
+
+    try:
+        accepted = await enqueue_payload(request.stream(), encoding)
+    except IngestQueueFull as e:
+        return JSONResponse(
+            status_code=429, headers={"Retry-After": RETRY_AFTER_SECONDS},
+            content={"status": "error", "message": str(e), "accepted": e.accepted},
+        )
+    except PayloadTooLarge as e:
+        INGEST_REJECTED_TOTAL.labels("too_large").inc()
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        INGEST_REJECTED_TOTAL.labels("invalid").inc()
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "accepted": accepted}
@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Response
+from app.core.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get("", include_in_schema=False)
+async def get_metrics():
+    """
+    Expose pipeline metrics in the Prometheus text format.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
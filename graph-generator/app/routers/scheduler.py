@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+
+from app.core.scheduler import collection_scheduler
+from app.services.trace_filter import recent_traces
+
+router = APIRouter()
+
+
+@router.get("")
+async def get_scheduler_stats():
+    """
+    Report the per-service collection schedule (cadence, trace rate, ingest lag, skips and run
+    durations) of this replica, how services are split between replicas, and the hit rate of
+    the recently stored trace filter.
+    """
+    return {"status": "success", **collection_scheduler.get_stats(), "trace_filter": recent_traces.get_stats()}
@@ -7,5 +7,5 @@ router = APIRouter()
 
 @router.get("")
 async def get_services():
-    services = get_all_services()
+    services = await get_all_services()
     return {"status": "success", "services": services}
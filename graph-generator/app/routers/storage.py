@@ -0,0 +1,16 @@
+import asyncio
+
+from fastapi import APIRouter
+
+from app.services.retention import get_storage_stats
+
+router = APIRouter()
+
+
+@router.get("")
+async def get_storage():
+    """
+    Report documents and bytes per storage tier, traces awaiting TTL deletion and the retention settings.
+    """
+    stats = await asyncio.to_thread(get_storage_stats)
+    return {"status": "success", **stats}
@@ -1,17 +1,39 @@
-from fastapi import APIRouter, HTTPException
+from typing import Literal, Optional
 
-from app.services import get_all_traces_from_mongo, get_traces_by_parent_service
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.services import get_traces_by_parent_service, get_traces_page, stream_traces_as_ndjson
+from app.utils.pagination import decode_cursor
 
 router = APIRouter()
 
 
 @router.get("")
-async def get_traces():
-    traces = get_all_traces_from_mongo()
-    return {"status": "success", "traces": traces}
+async def get_traces(
+        limit: int = Query(100, ge=1, le=1000, description="Traces per page"),
+        cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+        start: Optional[int] = Query(None, description="Inclusive trace start time lower bound (microseconds)"),
+        end: Optional[int] = Query(None, description="Exclusive trace start time upper bound (microseconds)"),
+        service: Optional[str] = Query(None, description="Only traces involving this service"),
+        format: Literal["json", "ndjson"] = Query("json", description="ndjson streams every matching trace"),
+):
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_traces_as_ndjson(after=after, start_us=start, end_us=end, service=service),
+            media_type="application/x-ndjson",
+        )
+
+    traces, next_cursor = await get_traces_page(limit=limit, after=after, start_us=start, end_us=end, service=service)
+    return {"status": "success", "traces": traces, "next_cursor": next_cursor}
 
 
 @router.get("services/{service}")
 async def get_trace(service: str):
-    traces = get_traces_by_parent_service(service)
+    traces = await get_traces_by_parent_service(service)
     return {"status": "success", "traces": traces}
@@ -1,5 +1,11 @@
-from app.services.data_collector import fetch_services, fetch_and_store_traces_for_all_services, get_all_the_traces
-from app.services.db_service import get_traces_by_parent_service, get_all_traces_from_mongo
+from app.services.data_collector import fetch_services, fetch_and_store_traces_for_all_services
+from app.services.db_service import (
+    get_traces_by_parent_service,
+    get_all_traces_from_mongo,
+    get_traces_page,
+    stream_traces_as_ndjson,
+)
 
 
-__all__ = ["fetch_services", "fetch_and_store_traces_for_all_services", "get_all_the_traces", "get_all_traces_from_mongo", "get_traces_by_parent_service"]
+__all__ = ["fetch_services", "fetch_and_store_traces_for_all_services", "get_all_traces_from_mongo",
+           "get_traces_by_parent_service", "get_traces_page", "stream_traces_as_ndjson"]
@@ -0,0 +1,361 @@
+import threading
+from datetime import datetime, timezone
+import networkx as nx
+from pymongo import errors
+from app.core.config import settings
+from app.core.database import db_manager
+from app.services.graph_cache import get_graph_version, get_graph_write_state
+from app.services.graph_processor import read_graph_from_neo4j
+from app.services.span_extractor import get_longest_call_chain
+
+CYCLIC_DEPENDENCY = "cyclic_dependency"
+CHATTY_SERVICES = "chatty_services"
+HUB_SERVICE = "hub_service"
+LONG_CALL_CHAIN = "long_call_chain"
+ANTI_PATTERN_TYPES = (CYCLIC_DEPENDENCY, CHATTY_SERVICES, HUB_SERVICE, LONG_CALL_CHAIN)
+
+# Sync batch deltas let detectors in other processes catch up without reloading the graph;
+# a detector further behind than this reloads from Neo4j instead
+GRAPH_DELTA_TTL_SECONDS = 24 * 3600
+RELOAD_ATTEMPTS = 3
+
+
+class AntiPatternDetector:
+    """
+    Incrementally maintained anti-pattern findings over the service dependency graph.
+    The detector mirrors the cumulative graph, its strongly connected components and a
+    topological order of the components (the condensation), kept up to date with the
+    Pearce-Kelly algorithm. Each sync batch only re-evaluates the nodes, edges and components
+    it touched: a new edge that agrees with the order cannot close a cycle, and one that does
+    not only searches the components ordered between its endpoints, merging them if it closed
+    a cycle and reordering them otherwise. Only the degrees and call ratios of touched nodes
+    and edges are re-checked.
+    """
+
+    def __init__(self, chatty_calls_per_trace=None, hub_fan_in=None, hub_fan_out=None, chain_hops=None):
+        self.chatty_calls_per_trace = chatty_calls_per_trace or settings.ANTI_PATTERN_CHATTY_CALLS_PER_TRACE
+        self.hub_fan_in = hub_fan_in or settings.ANTI_PATTERN_HUB_FAN_IN
+        self.hub_fan_out = hub_fan_out or settings.ANTI_PATTERN_HUB_FAN_OUT
+        self.chain_hops = chain_hops or settings.ANTI_PATTERN_CHAIN_HOPS
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all state; the next `load` re-evaluates from scratch.
+        """
+        self.graph = nx.DiGraph()
+        self.components = {}  # node -> frozenset of the strongly connected component it belongs to
+        self.order = {}  # component -> position in a topological order of the condensation
+        self.order_bounds = [0, 0]  # No position lies outside [first, last]
+        self.findings = {}  # (type, key) -> finding
+        self.loaded = False
+        self.version = None  # Graph version the detector reflects
+
+    def load(self, graph, chains=(), version=None):
+        """
+        Bootstrap from a full graph with a one-off evaluation of every node, edge and component.
+        Args:
+            graph (nx.DiGraph): The cumulative graph, with `weight` and `traces` edge attributes.
+            chains: Service call chains seen by past sync batches; long call chains come from
+                traces, not the graph.
+            version (int): Graph version `graph` was read at, or None if it is not known exactly.
+        """
+        with self._lock:
+            self.reset()
+            for chain in chains:
+                self._evaluate_chain(chain)
+            for parent, child, data in graph.edges(data=True):
+                self.graph.add_edge(parent, child, weight=data.get("weight", 0), traces=data.get("traces", 0))
+            condensation = nx.condensation(self.graph)
+            for position, component_id in enumerate(nx.topological_sort(condensation)):
+                component = frozenset(condensation.nodes[component_id]["members"])
+                for node in component:
+                    self.components[node] = component
+                self.order[component] = position
+                self.order_bounds[1] = position
+                self._evaluate_component(component)
+            for node in self.graph.nodes:
+                self._evaluate_hub(node)
+            for parent, child in self.graph.edges:
+                self._evaluate_edge(parent, child)
+            self.loaded = True
+            self.version = version
+
+    def apply(self, delta, traces=(), chains=()):
+        """
+        Fold a sync batch into the detector and re-evaluate only what it touched.
+        Args:
+            delta (nx.DiGraph): Edges added by the batch, with `weight` and `traces` increments.
+            traces: The batch's traces, scanned for long synchronous call chains.
+            chains: Service call chains already extracted from the batch's traces.
+        """
+        with self._lock:
+            self._apply(delta, traces, chains)
+
+    def apply_version(self, version, delta, chains=()):
+        """
+        Fold the sync batch written as graph version `version`, if the detector reflects
+        exactly the version before it.
+        Returns:
+            bool: True if the batch was applied; False leaves the detector unchanged.
+        """
+        with self._lock:
+            if not self.loaded or self.version != version - 1:
+                return False
+            self._apply(delta, (), chains)
+            self.version = version
+            return True
+
+    def _apply(self, delta, traces, chains):
+        touched_nodes = set()
+        for parent, child, data in delta.edges(data=True):
+            if self.graph.has_edge(parent, child):
+                edge = self.graph[parent][child]
+                edge["weight"] += data.get("weight", 0)
+                edge["traces"] += data.get("traces", 0)
+            else:
+                # A new node has no edges yet, so it can go first (as a caller) or last (as a callee)
+                self._add_node(parent, 0)
+                self._add_node(child, 1)
+                self.graph.add_edge(parent, child, weight=data.get("weight", 0), traces=data.get("traces", 0))
+                self._insert_component_edge(self.components[parent], self.components[child])
+            touched_nodes.update((parent, child))
+            self._evaluate_edge(parent, child)
+
+        for node in touched_nodes:
+            self._evaluate_hub(node)
+
+        for chain in chains:
+            self._evaluate_chain(chain)
+        for trace in traces:
+            self._evaluate_chain(get_longest_call_chain(trace))
+
+    def get_findings(self, anti_pattern_type=None):
+        """
+        Return current findings, optionally filtered by type.
+        """
+        with self._lock:
+            findings = [
+                finding for (finding_type, _), finding in self.findings.items()
+                if anti_pattern_type is None or finding_type == anti_pattern_type
+            ]
+        return sorted(findings, key=lambda finding: (finding["type"], finding["services"]))
+
+    def _add_node(self, node, end):
+        if node not in self.components:
+            component = frozenset([node])
+            self.components[node] = component
+            self.order_bounds[end] += 1 if end else -1
+            self.order[component] = self.order_bounds[end]
+
+    def _component_neighbors(self, component, neighbors):
+        return {self.components[other] for node in component for other in neighbors(node)} - {component}
+
+    def _search(self, start, neighbors, inside):
+        """
+        Collect the components reachable from `start` through components for which `inside` holds.
+        """
+        seen = {start}
+        stack = [start]
+        while stack:
+            for other in self._component_neighbors(stack.pop(), neighbors):
+                if other not in seen and inside(other):
+                    seen.add(other)
+                    stack.append(other)
+        return seen
+
+    def _insert_component_edge(self, source, target):
+        # Pearce-Kelly: an edge from an earlier to a later component keeps the order valid.
+        # Otherwise only components ordered between target and source can be involved: those
+        # reachable from target and those reaching source. If source is reachable, the edge
+        # closed a cycle through exactly the components in both sets.
+        if source is target or self.order[source] < self.order[target]:
+            return
+        lower, upper = self.order[target], self.order[source]
+        forward = self._search(target, self.graph.successors, lambda component: self.order[component] <= upper)
+        backward = self._search(source, self.graph.predecessors, lambda component: self.order[component] >= lower)
+        cycle = forward & backward if source in forward else set()
+
+        merged = []
+        if cycle:
+            component = frozenset().union(*cycle)
+            for old_component in cycle:
+                self.findings.pop((CYCLIC_DEPENDENCY, old_component), None)
+            for node in component:
+                self.components[node] = component
+            self._evaluate_component(component)
+            merged.append(component)
+
+        # Reuse the positions of the affected components: everything reaching source first,
+        # then the merged cycle, then everything reachable from target, each in its old order
+        positions = sorted(self.order[component] for component in forward | backward)
+        by_order = self.order.get
+        earlier = sorted(backward - cycle, key=by_order)
+        later = sorted(forward - cycle, key=by_order)
+        for component in cycle:
+            del self.order[component]
+        for component, position in zip(earlier, positions):
+            self.order[component] = position
+        for component, position in zip(merged, positions[len(earlier):]):
+            self.order[component] = position
+        for component, position in zip(later, positions[len(positions) - len(later):]):
+            self.order[component] = position
+
+    def _evaluate_component(self, component):
+        if len(component) > 1:
+            self._set_finding(CYCLIC_DEPENDENCY, component, sorted(component), {"size": len(component)})
+
+    def _evaluate_edge(self, parent, child):
+        edge = self.graph[parent][child]
+        calls_per_trace = edge["weight"] / edge["traces"] if edge["traces"] else 0
+        if calls_per_trace > self.chatty_calls_per_trace:
+            self._set_finding(CHATTY_SERVICES, (parent, child), [parent, child], {
+                "calls": edge["weight"], "traces": edge["traces"], "calls_per_trace": round(calls_per_trace, 2)
+            })
+        else:
+            self.findings.pop((CHATTY_SERVICES, (parent, child)), None)
+
+    def _evaluate_hub(self, node):
+        fan_in = self.graph.in_degree(node)
+        fan_out = self.graph.out_degree(node)
+        if fan_in >= self.hub_fan_in or fan_out >= self.hub_fan_out:
+            self._set_finding(HUB_SERVICE, node, [node], {"fan_in": fan_in, "fan_out": fan_out})
+        else:
+            self.findings.pop((HUB_SERVICE, node), None)
+
+    def _evaluate_chain(self, chain):
+        hops = len(chain) - 1
+        if hops < self.chain_hops:
+            return
+        key = tuple(chain)
+        existing = self.findings.get((LONG_CALL_CHAIN, key))
+        occurrences = existing["metrics"]["occurrences"] + 1 if existing else 1
+        self._set_finding(LONG_CALL_CHAIN, key, list(chain), {"hops": hops, "occurrences": occurrences})
+
+    def _set_finding(self, anti_pattern_type, key, services, metrics):
+        existing = self.findings.get((anti_pattern_type, key))
+        self.findings[(anti_pattern_type, key)] = {
+            "type": anti_pattern_type,
+            "services": services,
+            "metrics": metrics,
+            "detected_at": existing["detected_at"] if existing else datetime.now(timezone.utc).isoformat(),
+        }
+
+
+anti_pattern_detector = AntiPatternDetector()
+_reload_lock = threading.Lock()
+
+
+def setup_anti_pattern_indexes():
+    """
+    Ensure the TTL index that removes old sync batch deltas.
+    """
+    try:
+        db_manager.get_graph_deltas_collection().create_index("created_at", expireAfterSeconds=GRAPH_DELTA_TTL_SECONDS)
+    except errors.PyMongoError as e:
+        print(f"Error setting up anti-pattern indexes: {e}")
+
+
+def _delta_graph(edges):
+    delta = nx.DiGraph()
+    for parent, child, weight, traces in edges:
+        delta.add_edge(parent, child, weight=weight, traces=traces)
+    return delta
+
+
+def record_graph_delta(version, delta, chains):
+    """
+    Store the edges and long call chains of the sync batch written as graph version `version`.
+    """
+    db_manager.get_graph_deltas_collection().insert_one({
+        "_id": version,
+        "edges": [
+            [parent, child, data.get("weight", 0), data.get("traces", 0)]
+            for parent, child, data in delta.edges(data=True)
+        ],
+        "chains": chains,
+        "created_at": datetime.now(timezone.utc),
+    })
+
+
+def observe_sync_batch(delta, traces, version):
+    """
+    Record a sync batch that was just written to Neo4j as graph version `version` and fold it
+    into this process's detector if the detector is at the version before it.
+    Detection errors are logged and never fail the sync.
+    Args:
+        delta (nx.DiGraph): The batch's edges.
+        traces: The batch's traces, scanned for long call chains.
+        version (int): The version returned by the batch's graph write, or None if nothing was written.
+    """
+    if version is None:
+        return
+    try:
+        chains = [
+            chain for chain in map(get_longest_call_chain, traces)
+            if len(chain) - 1 >= anti_pattern_detector.chain_hops
+        ]
+        record_graph_delta(version, delta, chains)
+        anti_pattern_detector.apply_version(version, delta, chains)
+    except Exception as e:
+        print(f"Error running anti-pattern detection: {e}")
+
+
+def _catch_up(version):
+    """
+    Apply the recorded deltas between the detector's version and `version`, in order.
+    Returns:
+        bool: True if the detector reached `version`.
+    """
+    if not anti_pattern_detector.loaded or anti_pattern_detector.version is None:
+        return False
+    if anti_pattern_detector.version >= version:
+        return True
+    deltas = db_manager.get_graph_deltas_collection().find(
+        {"_id": {"$gt": anti_pattern_detector.version, "$lte": version}}
+    ).sort("_id", 1)
+    for record in deltas:
+        # A missing version (a rebuild, or a delta past its TTL) stops the catch-up
+        if not anti_pattern_detector.apply_version(record["_id"], _delta_graph(record["edges"]), record["chains"]):
+            break
+    return anti_pattern_detector.version is not None and anti_pattern_detector.version >= version
+
+
+def _reload():
+    """
+    Reload the detector from Neo4j. It is stamped with the graph version only if no write
+    was in progress and none completed while the graph was read, so later deltas apply exactly;
+    otherwise the read is retried a few times and then kept unstamped, to be reloaded next time.
+    """
+    for _ in range(RELOAD_ATTEMPTS):
+        before = get_graph_write_state()
+        graph = read_graph_from_neo4j()
+        exact = not before[1] and get_graph_write_state() == before
+        if exact:
+            break
+    chains = [
+        chain
+        for record in db_manager.get_graph_deltas_collection().find(
+            {"_id": {"$lte": before[0]}, "chains.0": {"$exists": True}}, {"chains": 1}
+        )
+        for chain in record["chains"]
+    ]
+    anti_pattern_detector.load(graph, chains, version=before[0] if exact else None)
+
+
+def get_anti_patterns(anti_pattern_type=None):
+    """
+    Return current anti-pattern findings. A detector behind the latest graph version (e.g. in
+    a worker that does not run graph sync) first applies the sync batch deltas it missed; it
+    only reloads from Neo4j when they do not reach back to its version.
+    Long call chains are those of the sync batches whose deltas are still stored.
+    """
+    version = get_graph_version()
+    if _catch_up(version):
+        return anti_pattern_detector.get_findings(anti_pattern_type)
+    with _reload_lock:
+        # Another request may have reloaded while this one waited
+        if not _catch_up(version):
+            _reload()
+    return anti_pattern_detector.get_findings(anti_pattern_type)
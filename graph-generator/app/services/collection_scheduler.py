@@ -0,0 +1,272 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.triggers.interval import IntervalTrigger
+from app.core.config import settings
+from app.core.metrics import record_job_run
+from app.services.data_collector import fetch_services_async, initialize_trace_updates, sweep_service
+from app.services.replica_coordinator import LeaseLostError
+
+SERVICE_JOB_PREFIX = "collect:"
+SERVICE_COLLECTOR_JOB = "service_collector"
+# Weight of the newest sample in the per-service trace rate average
+RATE_SMOOTHING = 0.3
+# Only reschedule when the cadence moved by more than this fraction, so jobs are not
+# re-triggered (and their next run pushed back) on every small rate change
+RESCHEDULE_THRESHOLD = 0.2
+
+
+def compute_interval(trace_rate, lag_seconds):
+    """
+    Pick a service's collection interval from its observed traffic and ingest lag.
+    The interval aims for COLLECTOR_TARGET_TRACES_PER_RUN traces per sweep, clamped to
+    [COLLECTOR_MIN_INTERVAL_SECONDS, COLLECTOR_MAX_INTERVAL_SECONDS]; a service that is more
+    than two intervals behind is swept at the minimum interval until it catches up.
+    Args:
+        trace_rate (float): Smoothed traces per second seen by recent sweeps.
+        lag_seconds (float): Seconds between now and the service's checkpoint.
+    Returns:
+        float: Interval in seconds.
+    """
+    low, high = settings.COLLECTOR_MIN_INTERVAL_SECONDS, settings.COLLECTOR_MAX_INTERVAL_SECONDS
+    interval = settings.COLLECTOR_TARGET_TRACES_PER_RUN / trace_rate if trace_rate > 0 else high
+    interval = min(high, max(low, interval))
+    if lag_seconds > 2 * interval:
+        return low
+    return interval
+
+
+def _new_service_stats(service_name, interval):
+    return {
+        "service": service_name,
+        "interval_seconds": interval,
+        "trace_rate": None,
+        "checkpoint_us": None,
+        "running": False,
+        "runs": 0,
+        "failures": 0,
+        "skipped": {"max_instances": 0, "missed": 0, "lease_held": 0},
+        "last_run_at": None,
+        "last_run_seconds": None,
+        "max_run_seconds": None,
+        "total_run_seconds": 0.0,
+        "last_wait_seconds": None,
+        "last_inserted": None,
+    }
+
+
+class CollectionScheduler:
+    """
+    Runs one collection job per service on its own APScheduler interval.
+    Each job is registered with max_instances=1 and coalesce=True, so a run that comes due
+    while the previous one is still going is skipped (and counted) rather than stacked, and
+    missed run times collapse into one. At most COLLECTOR_MAX_IN_FLIGHT sweeps run at once;
+    the rest wait their turn. A discovery job adds and removes services as Jaeger reports them.
+    With a `coordinator`, only the services assigned to this replica get jobs, and each sweep
+    runs under the service's lease; without one, every service is collected here.
+    """
+
+    def __init__(self, scheduler, coordinator=None):
+        self.scheduler = scheduler
+        self.coordinator = coordinator
+        self._services = {}
+        self._discovered = []
+        self._in_flight = asyncio.Semaphore(settings.COLLECTOR_MAX_IN_FLIGHT)
+        self._running = 0
+        self._waiting = 0
+
+    @staticmethod
+    def job_id(service_name):
+        return f"{SERVICE_JOB_PREFIX}{service_name}"
+
+    def _trigger(self, interval):
+        return IntervalTrigger(seconds=interval, jitter=interval * settings.COLLECTOR_JITTER_RATIO)
+
+    def add_service(self, service_name):
+        """
+        Register a service's collection job. New services start at the minimum interval,
+        with their first run spread randomly across it so they do not all fire together.
+        """
+        interval = settings.COLLECTOR_MIN_INTERVAL_SECONDS
+        self._services[service_name] = _new_service_stats(service_name, interval)
+        self.scheduler.add_job(
+            self.run_service,
+            trigger=self._trigger(interval),
+            args=[service_name],
+            id=self.job_id(service_name),
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=int(interval),
+            next_run_time=datetime.now(timezone.utc) + timedelta(seconds=random.uniform(0, interval)),
+            replace_existing=True,
+        )
+
+    def remove_service(self, service_name):
+        """
+        Drop a service's collection job and stats.
+        """
+        self._services.pop(service_name, None)
+        try:
+            self.scheduler.remove_job(self.job_id(service_name))
+        except JobLookupError:
+            pass
+
+    async def discover_services(self):
+        """
+        Sync the per-service jobs with the services Jaeger currently knows about.
+        """
+        services = await fetch_services_async()
+        if not services:
+            print("No services available.")
+            return
+
+        await initialize_trace_updates(services)
+        if self.coordinator is not None and self.coordinator.last_heartbeat is None:
+            await self.coordinator.heartbeat()  # Learn the other replicas before claiming services
+        for service_name in set(self._discovered) - set(services):
+            print(f"Service {service_name} is no longer reported by Jaeger; stopping its collection.")
+        self._discovered = list(services)
+        self.rebalance()
+
+    async def heartbeat(self):
+        """
+        Heartbeat job: refresh the live replica set and take over or hand off services accordingly.
+        """
+        if self.coordinator is None:
+            return
+        await self.coordinator.heartbeat()
+        self.rebalance()
+
+    def rebalance(self):
+        """
+        Align the per-service jobs with the discovered services this replica is responsible for.
+        """
+        assigned = [
+            service_name for service_name in self._discovered
+            if self.coordinator is None or self.coordinator.owns(service_name)
+        ]
+        added = [service_name for service_name in assigned if service_name not in self._services]
+        removed = set(self._services) - set(assigned)
+        for service_name in added:
+            self.add_service(service_name)
+        for service_name in removed:
+            self.remove_service(service_name)
+        if self.coordinator is not None and (added or removed):
+            print(f"Collecting {len(assigned)} of {len(self._discovered)} services on this replica "
+                  f"({len(added)} taken over, {len(removed)} handed off).")
+
+    def _update_cadence(self, stats, sweep):
+        if sweep["covered_seconds"] > 0:
+            sample = (sweep["inserted"] + sweep["skipped"]) / sweep["covered_seconds"]
+            previous = stats["trace_rate"]
+            stats["trace_rate"] = sample if previous is None else (
+                RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * previous
+            )
+
+        interval = compute_interval(stats["trace_rate"] or 0.0, sweep["lag_seconds"])
+        current = stats["interval_seconds"]
+        if abs(interval - current) <= RESCHEDULE_THRESHOLD * current:
+            return
+        stats["interval_seconds"] = interval
+        try:
+            self.scheduler.reschedule_job(self.job_id(stats["service"]), trigger=self._trigger(interval))
+            self.scheduler.modify_job(self.job_id(stats["service"]), misfire_grace_time=int(interval))
+        except JobLookupError:
+            pass
+
+    async def run_service(self, service_name):
+        """
+        Collect one service, then adjust its cadence from what the sweep saw.
+        """
+        stats = self._services.get(service_name)
+        if stats is None:
+            return
+
+        stats["running"] = True
+        queued = time.perf_counter()
+        self._waiting += 1
+        try:
+            async with self._in_flight:
+                self._waiting -= 1
+                self._running += 1
+                started = time.perf_counter()
+                try:
+                    if self.coordinator is None:
+                        sweep = await sweep_service(service_name)
+                    else:
+                        try:
+                            ran, sweep = await self.coordinator.run_with_lease(
+                                self.job_id(service_name), lambda: sweep_service(service_name)
+                            )
+                        except LeaseLostError as e:
+                            # The sweep was cancelled; the new holder resumes from its last stored checkpoint
+                            print(f"Stopped sweeping {service_name}: {e}")
+                            stats["failures"] += 1
+                            return
+                        if not ran:
+                            # Another replica is still sweeping it, e.g. right after a handover
+                            stats["skipped"]["lease_held"] += 1
+                            return
+                finally:
+                    self._running -= 1
+        finally:
+            stats["running"] = False
+
+        elapsed = time.perf_counter() - started
+        record_job_run(SERVICE_COLLECTOR_JOB, elapsed, stats["interval_seconds"])
+        stats["runs"] += 1
+        stats["last_run_at"] = datetime.now(timezone.utc).isoformat()
+        stats["last_run_seconds"] = elapsed
+        stats["max_run_seconds"] = max(elapsed, stats["max_run_seconds"] or 0.0)
+        stats["total_run_seconds"] += elapsed
+        stats["last_wait_seconds"] = started - queued
+        stats["last_inserted"] = sweep["inserted"]
+        if sweep["checkpoint_us"] is None:
+            stats["failures"] += 1
+            return
+        stats["checkpoint_us"] = sweep["checkpoint_us"]
+        self._update_cadence(stats, sweep)
+
+    def record_skip(self, job_id, reason):
+        """
+        Count a run the scheduler skipped for a service job.
+        Returns:
+            bool: True if the job belongs to a collected service.
+        """
+        if not job_id.startswith(SERVICE_JOB_PREFIX):
+            return False
+        stats = self._services.get(job_id[len(SERVICE_JOB_PREFIX):])
+        if stats is not None:
+            stats["skipped"][reason] += 1
+        return True
+
+    def get_stats(self):
+        """
+        Snapshot the scheduler state for the API.
+        Returns:
+            dict: {"running", "waiting", "max_in_flight", "replica", "services": [...]}; each service
+            entry has its interval, smoothed trace rate, current ingest lag, run counts, skips and
+            durations. "replica" describes replica coordination, or is None without a coordinator.
+        """
+        now_us = datetime.now(timezone.utc).timestamp() * 1e6
+        services = []
+        for service_name in sorted(self._services):
+            stats = dict(self._services[service_name])
+            stats["skipped"] = dict(stats["skipped"])
+            checkpoint_us = stats.pop("checkpoint_us")
+            stats["lag_seconds"] = None if checkpoint_us is None else max(0.0, (now_us - checkpoint_us) / 1e6)
+            total = stats.pop("total_run_seconds")
+            stats["avg_run_seconds"] = total / stats["runs"] if stats["runs"] else None
+            job = self.scheduler.get_job(self.job_id(service_name))
+            next_run_time = getattr(job, "next_run_time", None)
+            stats["next_run_at"] = next_run_time.isoformat() if next_run_time else None
+            services.append(stats)
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "max_in_flight": settings.COLLECTOR_MAX_IN_FLIGHT,
+            "replica": self.coordinator.get_stats() if self.coordinator is not None else None,
+            "services": services,
+        }
@@ -1,9 +1,41 @@
+import asyncio
+import random
+import time
+import httpx
 import requests
 from datetime import datetime, timezone, timedelta
-from pymongo import errors
+from pymongo import ReturnDocument, UpdateOne, errors
+from app.core.config import settings
 from app.core.database import db_manager
+from app.core.metrics import (
+    COLLECTOR_TRACES_PER_WINDOW, COLLECTOR_TRUNCATED_WINDOWS_TOTAL, COLLECTOR_WINDOW_SECONDS,
+    COLLECTOR_WINDOW_SPLITS_TOTAL, JAEGER_REQUEST_SECONDS, TRACES_STORED_TOTAL, TRACE_UPSERT_SECONDS,
+    record_ingest_checkpoint,
+)
+from app.services.span_extractor import derive_trace_fields, get_process_services
+from app.services.span_store import intern_services_async, project_trace_spans
+from app.services.trace_filter import recent_traces
 
-JAEGER_BASE_URL = "http://localhost:16686/api"
+JAEGER_BASE_URL = settings.JAEGER_BASE_URL
+WIDEN_BELOW_FILL = 0.25  # Double the window after one that filled less than this share of a page
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+DUPLICATE_KEY_ERROR = 11000
+INGEST_SEQUENCE_COUNTER = "ingest_seq"
+
+_jaeger_client = None
+_jaeger_semaphore = None
+
+
+class TraceStoreError(Exception):
+    """
+    Raised by `store_traces` when traces of a batch were not written, so the caller must not
+    treat the batch as stored. `inserted` and `skipped` count the traces that were handled.
+    """
+
+    def __init__(self, message, inserted=0, skipped=0):
+        super().__init__(message)
+        self.inserted = inserted
+        self.skipped = skipped
 
 
 def setup_indexes():
@@ -13,6 +45,10 @@ def setup_indexes():
     try:
         trace_collection = db_manager.get_trace_collection()
         trace_collection.create_index("traceID", unique=True)  # Enforce unique traceIDs
+        # The trace API filters on service or start time and pages by _id, so each index ends in
+        # _id to return matches already in page order
+        trace_collection.create_index([("services", 1), ("_id", 1)])  # Multikey: traces involving a service
+        trace_collection.create_index([("start_time", 1), ("_id", 1)])
         trace_updates = db_manager.get_trace_updates_collection()
         trace_updates.create_index("service_name", unique=True)  # Enforce unique services
         print("Indexes created successfully.")
@@ -37,11 +73,88 @@ def fetch_services():
         return []
 
 
-def fetch_traces(service_name, start_us, end_us, limit=100):
+def get_jaeger_client():
+    """
+    Get the shared async HTTP client for the Jaeger query API, creating it on first use.
+    The client keeps a connection pool sized to the collector concurrency so every
+    request of a sweep reuses warm connections.
+    """
+    global _jaeger_client, _jaeger_semaphore
+    if _jaeger_client is None or _jaeger_client.is_closed:
+        _jaeger_client = httpx.AsyncClient(
+            base_url=JAEGER_BASE_URL,
+            timeout=settings.COLLECTOR_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=settings.COLLECTOR_CONCURRENCY,
+                max_keepalive_connections=settings.COLLECTOR_CONCURRENCY,
+            ),
+        )
+        _jaeger_semaphore = asyncio.Semaphore(settings.COLLECTOR_CONCURRENCY)
+    return _jaeger_client
+
+
+async def close_jaeger_client():
+    """
+    Close the shared Jaeger HTTP client, if it was created.
+    """
+    global _jaeger_client
+    if _jaeger_client is not None:
+        await _jaeger_client.aclose()
+        _jaeger_client = None
+
+
+async def jaeger_get(path, params=None):
+    """
+    Issue a GET against the Jaeger query API with bounded concurrency and retries.
+    Transport errors, 429 and 5xx responses are retried with jittered exponential backoff.
+    Args:
+        path (str): API path relative to JAEGER_BASE_URL, e.g. "/traces".
+        params (dict): Query parameters.
+    Returns:
+        dict: Decoded JSON response body.
+    """
+    client = get_jaeger_client()
+    attempt = 0
+    started = time.perf_counter()
+    while True:
+        try:
+            async with _jaeger_semaphore:
+                response = await client.get(path, params=params)
+            response.raise_for_status()
+            JAEGER_REQUEST_SECONDS.labels(path, response.status_code).observe(time.perf_counter() - started)
+            return response.json()
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in RETRYABLE_STATUS_CODES
+            if not retryable or attempt >= settings.COLLECTOR_MAX_RETRIES:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else "error"
+                JAEGER_REQUEST_SECONDS.labels(path, status).observe(time.perf_counter() - started)
+                raise
+            delay = settings.COLLECTOR_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+            attempt += 1
+            print(f"Retrying Jaeger request {path} in {delay:.2f}s (attempt {attempt}): {e}")
+            await asyncio.sleep(delay)
+
+
+async def fetch_services_async():
+    """
+    Fetch all available services from Jaeger without blocking the event loop.
+    Returns:
+        List of service names.
+    """
+    try:
+        services = (await jaeger_get("/services")).get("data", []) or []
+        return sorted([service for service in services if service != "jaeger-all-in-one"])
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Failed to fetch services: {e}")
+        return []
+
+
+async def fetch_traces(service_name, start_us, end_us, limit=100, raise_errors=False):
     """
     Fetch traces for a specific service within a time range.
+    Failed requests return an empty list, or raise when `raise_errors` is set, so callers
+    can tell a failure apart from an empty window.
     """
-    url = f"{JAEGER_BASE_URL}/traces"
     params = {
         "service": service_name,
         "start": int(start_us),  # Ensure integer timestamps
@@ -50,29 +163,25 @@ def fetch_traces(service_name, start_us, end_us, limit=100):
     }
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json().get("data", [])
+        data = (await jaeger_get("/traces", params=params)).get("data", [])
         if not isinstance(data, list):
-            print(f"Unexpected API response for {service_name}: {data}")
-            return []
+            raise ValueError(f"Unexpected API response for {service_name}: {data}")
         return data
-    except requests.exceptions.RequestException as e:
+    except (httpx.HTTPError, ValueError) as e:
         print(f"Failed to fetch traces for service '{service_name}': {e}")
+        if raise_errors:
+            raise
         return []
 
 
-def initialize_trace_updates(services):
+async def initialize_trace_updates(services):
     """
     Ensure every service has an entry in the trace_updates collection.
     """
     try:
-        trace_updates = db_manager.get_trace_updates_collection()
-        if trace_updates is None:
-            raise RuntimeError("trace_updates collection is not initialized.")
-
+        trace_updates = db_manager.get_async_trace_updates_collection()
         for service in services:
-            trace_updates.update_one(
+            await trace_updates.update_one(
                 {"service_name": service},
                 {"$setOnInsert": {
                     "last_fetched_end_time_us": None
@@ -83,117 +192,308 @@ def initialize_trace_updates(services):
         print(f"Failed to initialize trace updates: {e}")
 
 
-def fetch_and_store_traces(service_name):
+async def reserve_ingest_sequence(count):
+    """
+    Atomically reserve `count` consecutive ingest sequence numbers.
+    Returns:
+        int: The first reserved number.
+    """
+    counters = db_manager.get_async_counters_collection()
+    counter = await counters.find_one_and_update(
+        {"_id": INGEST_SEQUENCE_COUNTER},
+        {"$inc": {"value": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["value"] - count + 1
+
+
+async def store_raw_traces(service_name, batch):
+    """
+    Upsert full Jaeger trace documents, with their derived lookup fields, into the raw traces
+    collection. Failures are logged; graph building never reads this collection.
+    Args:
+        batch (dict): {traceID: trace}
+    Returns:
+        set: traceIDs whose raw document was not written.
+    """
+    trace_collection = db_manager.get_async_trace_collection()
+    operations = [
+        UpdateOne({"traceID": trace_id}, {"$set": {**trace, **derive_trace_fields(trace)}}, upsert=True)
+        for trace_id, trace in batch.items()
+    ]
+    trace_ids = list(batch)
+    failed = set()
+    try:
+        await trace_collection.bulk_write(operations, ordered=False)
+    except errors.BulkWriteError as e:
+        for write_error in e.details.get("writeErrors", []):
+            if write_error.get("code") != DUPLICATE_KEY_ERROR:
+                failed.add(trace_ids[write_error["index"]])
+                print(f"Error storing raw trace for {service_name}: {write_error.get('errmsg')}")
+    except errors.PyMongoError as e:
+        print(f"Error bulk writing {len(operations)} raw traces for {service_name}: {e}")
+        failed.update(trace_ids)
+    return failed
+
+
+async def store_traces(service_name, traces):
+    """
+    Upsert a batch of traces fetched for a service into the compact trace_spans store with a
+    single unordered bulk write; the full documents also go to the raw traces collection when
+    STORE_RAW_TRACES is set.
+    Duplicate-key errors (a concurrent sweep inserting the same traceID first) count as
+    skipped; any other per-document error is logged without failing the rest of the batch,
+    and then raised as a TraceStoreError once the rest is accounted for.
+    Newly inserted traces are stamped with a monotonic `ingest_seq` and `ingested_at_us`,
+    which drive incremental graph sync; updates to existing traces keep their stamp. Spans a
+    trace gains after it was synced are stored, but only reach the graph on a full rebuild;
+    GRAPH_SYNC_SETTLE_SECONDS gives in-progress traces time to complete before they are synced.
+    Traces this process stored recently with at least as many spans are dropped before the
+    write (see `RecentTraceFilter`) and count as skipped. Traces whose raw or span store write
+    failed are not remembered there, so they are written again when next seen.
+    Returns:
+        tuple: (inserted, skipped) counts.
+    Raises:
+        TraceStoreError: If any trace of the batch could not be written.
+    """
+    trace_spans = db_manager.get_async_trace_spans_collection()
+
+    # Keep the last copy of each traceID; a window can return the same trace twice
+    batch = {trace["traceID"]: trace for trace in traces if "traceID" in trace}
+    batch, filtered = recent_traces.filter_new(batch)
+    TRACES_STORED_TOTAL.labels("filtered").inc(filtered)
+    if not batch:
+        return 0, filtered
+
+    trace_ids = list(batch)
+    raw_failed = set()
+    try:
+        if settings.STORE_RAW_TRACES:
+            raw_failed = await store_raw_traces(service_name, batch)
+
+        service_ids = await intern_services_async(
+            {service for trace in batch.values() for service in get_process_services(trace).values()}
+        )
+        # Stamp the time before reserving so time order never lags sequence order
+        ingested_at_us = int(datetime.now(timezone.utc).timestamp() * 1e6)
+        first_seq = await reserve_ingest_sequence(len(trace_ids))
+        operations = [
+            UpdateOne(
+                {"traceID": trace_id},
+                {
+                    "$set": project_trace_spans(batch[trace_id], service_ids),
+                    "$setOnInsert": {"ingest_seq": first_seq + offset, "ingested_at_us": ingested_at_us},
+                },
+                upsert=True,
+            )
+            for offset, trace_id in enumerate(trace_ids)
+        ]
+        with TRACE_UPSERT_SECONDS.time():
+            result = await trace_spans.bulk_write(operations, ordered=False)
+        inserted, skipped = result.upserted_count, result.matched_count
+        failed = set()
+    except errors.BulkWriteError as e:
+        details = e.details
+        duplicates = 0
+        failed = set()
+        for write_error in details.get("writeErrors", []):
+            if write_error.get("code") == DUPLICATE_KEY_ERROR:
+                duplicates += 1
+            else:
+                trace_id = trace_ids[write_error["index"]]
+                failed.add(trace_id)
+                print(f"Error inserting/updating trace {trace_id} for {service_name}: {write_error.get('errmsg')}")
+        inserted, skipped = details.get("nUpserted", 0), details.get("nMatched", 0) + duplicates
+    except errors.PyMongoError as e:
+        raise TraceStoreError(
+            f"Error bulk writing {len(trace_ids)} traces for {service_name}: {e}", skipped=filtered
+        ) from e
+
+    recent_traces.remember(
+        (trace_id, trace) for trace_id, trace in batch.items() if trace_id not in failed and trace_id not in raw_failed
+    )
+    TRACES_STORED_TOTAL.labels("inserted").inc(inserted)
+    TRACES_STORED_TOTAL.labels("skipped").inc(skipped)
+    if failed:
+        raise TraceStoreError(f"{len(failed)} traces for {service_name} were not stored.", inserted, skipped + filtered)
+    return inserted, skipped + filtered
+
+
+def _plan_windows(start_us, end_us, window_us, max_windows=None):
+    """
+    Split [start_us, end_us] into consecutive fetch windows of `window_us`, at most `max_windows`.
+    """
+    windows = []
+    while start_us < end_us and (max_windows is None or len(windows) < max_windows):
+        next_end_us = min(start_us + window_us, end_us)
+        windows.append((start_us, next_end_us))
+        start_us = next_end_us + 1
+    return windows
+
+
+async def fetch_window_traces(service_name, start_us, end_us, limit=None):
+    """
+    Fetch every trace of a window, bisecting it while Jaeger returns a full page, since a full
+    page means traces beyond the limit were dropped. Halves are fetched concurrently.
+    Returns:
+        list: (start_us, end_us, traces) for each leaf window, in time order.
+    Raises:
+        httpx.HTTPError, ValueError: If a request fails.
+    """
+    limit = limit or settings.COLLECTOR_PAGE_LIMIT
+    traces = await fetch_traces(service_name, start_us, end_us, limit=limit, raise_errors=True)
+    if len(traces) < limit:
+        return [(start_us, end_us, traces)]
+
+    if end_us - start_us <= settings.COLLECTOR_MIN_WINDOW_SECONDS * 1e6:
+        COLLECTOR_TRUNCATED_WINDOWS_TOTAL.inc()
+        print(f"Window {start_us} - {end_us} for {service_name} returned a full page at the minimum "
+              f"window size; traces beyond the first {limit} may be missing.")
+        return [(start_us, end_us, traces)]
+
+    COLLECTOR_WINDOW_SPLITS_TOTAL.inc()
+    mid_us = (start_us + end_us) // 2
+    left, right = await asyncio.gather(
+        fetch_window_traces(service_name, start_us, mid_us, limit),
+        fetch_window_traces(service_name, mid_us + 1, end_us, limit),
+    )
+    return left + right
+
+
+def _next_window_us(window_us, leaves, limit=None):
+    """
+    Adapt the fetch window size to the traffic seen in the last window: shrink to the
+    smallest leaf when it had to be bisected, double it when it was sparse.
+    """
+    limit = limit or settings.COLLECTOR_PAGE_LIMIT
+    if len(leaves) > 1:
+        window_us = min(end_us - start_us for start_us, end_us, _ in leaves)
+    elif len(leaves[0][2]) < limit * WIDEN_BELOW_FILL:
+        window_us *= 2
+    return int(min(max(window_us, settings.COLLECTOR_MIN_WINDOW_SECONDS * 1e6),
+                   settings.COLLECTOR_MAX_WINDOW_SECONDS * 1e6))
+
+
+async def fetch_and_store_traces(service_name):
     """
     Fetch and store traces for a specific service, handling sparse data and deduplication.
+    Returns:
+        int: Number of newly inserted traces.
+    """
+    return (await sweep_service(service_name))["inserted"]
+
+
+async def sweep_service(service_name):
+    """
+    Collect a service from its checkpoint up to now.
+    Windows are sized adaptively per service (see `fetch_window_traces` and `_next_window_us`),
+    fetched concurrently in groups of COLLECTOR_CONCURRENCY and stored in order. The checkpoint
+    moves forward over every fully fetched and stored window, empty ones included, and stops at
+    the first window whose fetch or store failed so it is retried on the next sweep.
+    Returns:
+        dict: {"inserted", "skipped", "requests", "checkpoint_us", "covered_seconds", "lag_seconds",
+               "window_seconds"}; checkpoint_us is None when the sweep failed outright.
     """
+    sweep = {"inserted": 0, "skipped": 0, "requests": 0, "checkpoint_us": None, "covered_seconds": 0.0,
+             "lag_seconds": 0.0, "window_seconds": 0.0}
     try:
-        trace_collection = db_manager.get_trace_collection()
-        trace_updates = db_manager.get_trace_updates_collection()
+        trace_updates = db_manager.get_async_trace_updates_collection()
 
-        # Retrieve last fetched end time in microseconds
-        update_record = trace_updates.find_one({"service_name": service_name})
+        # Retrieve last fetched end time in microseconds and the service's current window size
+        update_record = await trace_updates.find_one({"service_name": service_name}) or {}
         last_end_time_us = update_record.get("last_fetched_end_time_us", None)
+        window_us = update_record.get("window_us") or int(settings.COLLECTOR_INITIAL_WINDOW_SECONDS * 1e6)
 
         # Default: Start from the last 5 minutes if no records exist
         if last_end_time_us is None:
             last_end_time_us = int((datetime.now(timezone.utc) - timedelta(minutes=5)).timestamp() * 1e6)
+        record_ingest_checkpoint(service_name, last_end_time_us)
 
         current_time_us = int(datetime.now(timezone.utc).timestamp() * 1e6)
+        cursor_us = last_end_time_us
         total_stored = 0
         total_skipped = 0
-        consecutive_no_trace_batches = 0  # Counter for consecutive empty batches
+        request_count = 0
 
-        while last_end_time_us < current_time_us:
-            next_end_time_us = min(last_end_time_us + (5 * 60 * 1e6), current_time_us)  # 5-minute batch
-            traces = fetch_traces(service_name, start_us=last_end_time_us, end_us=next_end_time_us)
+        while cursor_us < current_time_us:
+            group = _plan_windows(cursor_us, current_time_us, window_us, settings.COLLECTOR_CONCURRENCY)
+            results = await asyncio.gather(
+                *(fetch_window_traces(service_name, start, end) for start, end in group), return_exceptions=True
+            )
 
-            if not traces:
-                consecutive_no_trace_batches += 1
-                print(f"No traces found for {service_name} in range {int(last_end_time_us)} - {int(next_end_time_us)}")
-                if consecutive_no_trace_batches > 10:  # Allow 10 consecutive empty batches before stopping
-                    print(f"Stopping early for {service_name}, no traces found in 10 consecutive ranges.")
+            failed = False
+            for (start_us, end_us), leaves in zip(group, results):
+                if isinstance(leaves, Exception):
+                    print(f"Stopping {service_name} sweep at {start_us}; window fetch failed: {leaves}")
+                    failed = True
                     break
-                last_end_time_us = next_end_time_us + 1
-                continue
 
-            consecutive_no_trace_batches = 0  # Reset counter upon finding data
-            for trace in traces:
-                if "traceID" in trace:
+                request_count += 2 * len(leaves) - 1
+                for _, _, traces in leaves:
+                    COLLECTOR_TRACES_PER_WINDOW.observe(len(traces))
+                    if not traces:
+                        continue
                     try:
-                        # Use upsert to avoid duplicates
-                        result = trace_collection.update_one(
-                            {"traceID": trace["traceID"]}, {"$set": trace}, upsert=True
-                        )
-                        if result.upserted_id:
-                            total_stored += 1  # Trace inserted
-                        else:
-                            total_skipped += 1  # Trace already exists
-                    except errors.PyMongoError as e:
-                        print(f"Error inserting/updating trace {trace['traceID']} for {service_name}: {e}")
-
-            # Update last_end_time_us for the next batch
-            last_end_time_us = next_end_time_us + 1
+                        stored, skipped = await store_traces(service_name, traces)
+                    except TraceStoreError as e:
+                        print(f"Stopping {service_name} sweep at {start_us}; window store failed: {e}")
+                        stored, skipped = e.inserted, e.skipped
+                        failed = True
+                    total_stored += stored
+                    total_skipped += skipped
+                    if failed:
+                        break
+                if failed:
+                    break
+                for leaf_start_us, leaf_end_us, _ in leaves:
+                    COLLECTOR_WINDOW_SECONDS.observe((leaf_end_us - leaf_start_us) / 1e6)
+                window_us = _next_window_us(window_us, leaves)
+                cursor_us = end_us + 1
 
             # Update progress in the trace_updates collection
-            trace_updates.update_one(
-                {"service_name": service_name},
-                {"$set": {"last_fetched_end_time_us": last_end_time_us}}
-            )
+            if cursor_us > last_end_time_us:
+                await trace_updates.update_one(
+                    {"service_name": service_name},
+                    {"$set": {"last_fetched_end_time_us": cursor_us, "window_us": window_us}}
+                )
+                record_ingest_checkpoint(service_name, cursor_us)
+            if failed:
+                break
 
         print(
-            f"Processed {total_stored + total_skipped} traces for service: {service_name}. "
-            f"Inserted: {total_stored}, Skipped (duplicates): {total_skipped}."
+            f"Processed {total_stored + total_skipped} traces for service: {service_name} in {request_count} requests. "
+            f"Inserted: {total_stored}, Skipped (duplicates): {total_skipped}. Window: {window_us / 1e6:.1f}s."
+        )
+        sweep.update(
+            inserted=total_stored,
+            skipped=total_skipped,
+            requests=request_count,
+            checkpoint_us=cursor_us,
+            covered_seconds=(cursor_us - last_end_time_us) / 1e6,
+            lag_seconds=max(0.0, (datetime.now(timezone.utc).timestamp() * 1e6 - cursor_us) / 1e6),
+            window_seconds=window_us / 1e6,
         )
-        return total_stored
     except Exception as e:
         print(f"Error fetching and storing traces for {service_name}: {e}")
-        return 0
+    return sweep
 
 
-def fetch_and_store_traces_for_all_services():
+async def fetch_and_store_traces_for_all_services():
     """
     Fetch and store traces for all services, updating the trace_updates collection.
+    Services are processed concurrently; Jaeger load is bounded by COLLECTOR_CONCURRENCY.
     """
-    services = fetch_services()
+    services = await fetch_services_async()
     if not services:
         print("No services available.")
         return
 
     # Initialize the trace_updates collection
-    initialize_trace_updates(services)
+    await initialize_trace_updates(services)
 
-    for service in services:
-        print(f"Processing service: {service}")
-        total_traces = fetch_and_store_traces(service)
+    totals = await asyncio.gather(*(fetch_and_store_traces(service) for service in services))
+    for service, total_traces in zip(services, totals):
         if total_traces == 0:
-            print(f"No new traces for service: {service}. Moving to the next service.")
-
+            print(f"No new traces for service: {service}.")
 
-def get_all_the_traces(batch_size=100):
-    """
-    Retrieve all traces from the MongoDB traces collection.
-    Args:
-        batch_size (int): Number of traces to fetch per batch to avoid memory issues.
-    Returns:
-        list: List of all trace documents in the database.
-    """
-    print("Trying to retrieve the traces")
-    try:
-        traces_collection = db_manager.get_trace_collection()
-        all_traces = []
-        skip_count = 0
-
-        # Use a loop to fetch in batches
-        while True:
-            batch = list(traces_collection.find({}, {"_id": 0}).skip(skip_count).limit(batch_size))
-            if not batch:
-                break  # Exit when no more documents are found
-            all_traces.extend(batch)
-            skip_count += batch_size
-
-        print(f"Retrieved {len(all_traces)} traces from the database.")
-        return all_traces
-    except Exception as e:
-        print(f"Error fetching traces: {e}")
-        return None
@@ -1,17 +1,21 @@
-from pymongo.collection import Collection
+import json
+from pymongo.asynchronous.collection import AsyncCollection
+from app.core.config import settings
 from app.core.database import db_manager
-from app.services import fetch_services
+from app.services.data_collector import fetch_services_async
+from app.services.span_store import expand_span_documents_async, get_service_id_async
+from app.utils.pagination import encode_cursor, iter_keyset_async
 
 
-def get_all_traces_from_mongo():
+async def get_all_traces_from_mongo():
     """
     Retrieve all traces from the 'trace' collection.
     Returns:
         list: A list of all trace documents.
     """
     try:
-        trace_collection: Collection = db_manager.get_trace_collection()
-        traces = list(trace_collection.find({}, {"_id": 0}))  # Exclude MongoDB's `_id` field
+        trace_collection: AsyncCollection = db_manager.get_async_trace_collection()
+        traces = await trace_collection.find({}, {"_id": 0}).to_list(None)  # Exclude MongoDB's `_id` field
         print(f"Retrieved {len(traces)} traces.")
         return traces
     except Exception as e:
@@ -19,43 +23,127 @@ def get_all_traces_from_mongo():
         return []
 
 
-def get_traces_by_parent_service(parent_service_name):
+def build_trace_query(start_us=None, end_us=None, service=None):
+    """
+    Build a traces filter on the indexed `start_time` and `services` fields.
+    """
+    query = {}
+    if start_us is not None or end_us is not None:
+        query["start_time"] = {}
+        if start_us is not None:
+            query["start_time"]["$gte"] = start_us
+        if end_us is not None:
+            query["start_time"]["$lt"] = end_us
+    if service:
+        query["services"] = service
+    return query
+
+
+async def _trace_source(start_us=None, end_us=None, service=None):
+    """
+    Pick the collection traces are served from, with its filter and projection.
+    Raw traces are served as stored; without STORE_RAW_TRACES, span store documents are read
+    instead and expanded to minimal Jaeger-shaped traces (no tags, logs or process details).
+    Returns:
+        tuple: (collection, query, projection), or None if `service` is unknown to the span store.
+    """
+    if settings.STORE_RAW_TRACES:
+        return db_manager.get_async_trace_collection(), build_trace_query(start_us, end_us, service), None
+
+    query = build_trace_query(start_us, end_us)
+    if service:
+        service_id = await get_service_id_async(service)
+        if service_id is None:
+            return None
+        query["spans.v"] = service_id
+    return db_manager.get_async_trace_spans_collection(), query, {"parents": 0}
+
+
+async def _as_traces(documents):
+    for document in documents:
+        document.pop("_id")
+    if settings.STORE_RAW_TRACES:
+        return documents
+    return await expand_span_documents_async(documents)
+
+
+async def get_traces_page(limit=100, after=None, start_us=None, end_us=None, service=None):
+    """
+    Retrieve one page of traces in `_id` order using keyset pagination.
+    Args:
+        limit (int): Maximum number of traces in the page.
+        after (ObjectId): Decoded cursor; only traces after it are returned.
+        start_us (int): Inclusive lower bound on the trace start time (microseconds).
+        end_us (int): Exclusive upper bound on the trace start time (microseconds).
+        service (str): Only traces involving this service.
+    Returns:
+        tuple: (traces, next_cursor). next_cursor is None on the last page.
+    """
+    try:
+        source = await _trace_source(start_us, end_us, service)
+        if source is None:
+            return [], None
+        collection, query, projection = source
+        if after is not None:
+            query["_id"] = {"$gt": after}
+
+        # Fetch one extra document to learn whether another page exists
+        documents = await collection.find(query, projection).sort("_id", 1).limit(limit + 1).to_list(None)
+        next_cursor = encode_cursor(documents[limit - 1]["_id"]) if len(documents) > limit else None
+        return await _as_traces(documents[:limit]), next_cursor
+    except Exception as e:
+        print(f"Error fetching traces page: {e}")
+        return [], None
+
+
+async def stream_traces_as_ndjson(after=None, start_us=None, end_us=None, service=None, batch_size=500):
+    """
+    Stream matching traces as newline-delimited JSON.
+    The Mongo cursor is consumed lazily and flushed every `batch_size` traces,
+    so memory stays flat regardless of the result size.
+    Yields:
+        bytes: Chunks of NDJSON lines.
+    """
+    source = await _trace_source(start_us, end_us, service)
+    if source is None:
+        return
+    collection, query, projection = source
+
+    batch = []
+    async for document in iter_keyset_async(collection, query, projection, batch_size=batch_size, after=after):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield ("\n".join(json.dumps(trace, default=str) for trace in await _as_traces(batch)) + "\n").encode()
+            batch = []
+    if batch:
+        yield ("\n".join(json.dumps(trace, default=str) for trace in await _as_traces(batch)) + "\n").encode()
+
+
+async def get_traces_by_parent_service(parent_service_name):
     """
     Retrieve traces where the parent service matches the given name.
+    Matching traceIDs come from the span store's multikey `parents` index; the full documents
+    are read from the raw traces collection, or rebuilt from the span store without it.
     Args:
         parent_service_name (str): The name of the parent service.
     Returns:
         list: A list of traces matching the criteria.
     """
     try:
-        trace_collection: Collection = db_manager.get_trace_collection()
-        matching_traces = []
-
-        # Iterate over traces to find those with the given parent service
-        traces = trace_collection.find({}, {"_id": 0})  # Fetch all traces without `_id`
-        for trace in traces:
-            processes = trace.get("processes", {})
-            spans = trace.get("spans", [])
-
-            # Map process IDs to service names
-            process_to_service = {pid: details["serviceName"] for pid, details in processes.items()}
-
-            for span in spans:
-                # Check for parent span references (CHILD_OF)
-                parent_span_id = None
-                for ref in span.get("references", []):
-                    if ref["refType"] == "CHILD_OF":
-                        parent_span_id = ref["spanID"]
-                        break
-
-                # If a parent span exists, find its service name
-                if parent_span_id:
-                    parent_span = next((s for s in spans if s["spanID"] == parent_span_id), None)
-                    if parent_span and parent_span.get("processID") in process_to_service:
-                        parent_service = process_to_service[parent_span["processID"]]
-                        if parent_service == parent_service_name:
-                            matching_traces.append(trace)
-                            break  # No need to check further spans for this trace
+        service_id = await get_service_id_async(parent_service_name)
+        if service_id is None:
+            return []
+
+        trace_spans: AsyncCollection = db_manager.get_async_trace_spans_collection()
+        if settings.STORE_RAW_TRACES:
+            trace_ids = [document["traceID"] async for document in trace_spans.find(
+                {"parents": service_id}, {"_id": 0, "traceID": 1}
+            )]
+            trace_collection: AsyncCollection = db_manager.get_async_trace_collection()
+            matching_traces = await trace_collection.find({"traceID": {"$in": trace_ids}}, {"_id": 0}).to_list(None)
+        else:
+            documents = await trace_spans.find({"parents": service_id}, {"_id": 0, "parents": 0}).to_list(None)
+            matching_traces = await expand_span_documents_async(documents)
 
         print(f"Found {len(matching_traces)} traces with parent service '{parent_service_name}'.")
         return matching_traces
@@ -64,5 +152,5 @@ def get_traces_by_parent_service(parent_service_name):
         return []
 
 
-def get_all_services():
-    return fetch_services()
+async def get_all_services():
+    return await fetch_services_async()
@@ -0,0 +1,185 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_MAX_ITERATIONS = 100
+PAGERANK_TOLERANCE = 1e-6  # Per node, on the L1 change between iterations, as in NetworkX
+CRITICAL_SERVICES_LIMIT = 10
+# Betweenness runs its BFS for a block of sources at once; this bounds the dense
+# (nodes x sources) path-count matrices each block keeps
+BETWEENNESS_BLOCK_CELLS = 1 << 22
+
+
+class GraphMatrix:
+    """
+    Weighted adjacency matrix of a dependency graph as a SciPy CSR matrix, with a 0/1
+    copy for the hop-count metrics. Every metric below is a sparse matrix operation
+    instead of a pass over NetworkX's per-node dictionaries.
+    """
+
+    def __init__(self, nodes, src, dst, weights):
+        self.nodes = nodes
+        shape = (len(nodes), len(nodes))
+        self.weights = sparse.csr_matrix((np.asarray(weights, dtype=float), (src, dst)), shape=shape)
+        self.links = sparse.csr_matrix((np.ones(len(src)), (src, dst)), shape=shape)
+
+    @classmethod
+    def from_networkx(cls, graph, weight="weight"):
+        """
+        Build the matrix of a NetworkX DiGraph; edges without `weight` count as 1.
+        """
+        nodes = list(graph.nodes)
+        node_ids = {node: node_id for node_id, node in enumerate(nodes)}
+        src, dst, weights = [], [], []
+        for parent, child, data in graph.edges(data=True):
+            src.append(node_ids[parent])
+            dst.append(node_ids[child])
+            weights.append(data.get(weight, 1) or 0)
+        return cls(nodes, np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64), weights)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def out_degree(self):
+        return np.diff(self.links.indptr)
+
+    def in_degree(self):
+        return np.bincount(self.links.indices, minlength=len(self))
+
+    def weighted_out_degree(self):
+        return np.asarray(self.weights.sum(axis=1)).ravel()
+
+    def weighted_in_degree(self):
+        return np.asarray(self.weights.sum(axis=0)).ravel()
+
+
+def pagerank(matrix, damping=PAGERANK_DAMPING, max_iterations=PAGERANK_MAX_ITERATIONS, tolerance=PAGERANK_TOLERANCE):
+    """
+    Weighted PageRank by power iteration with the row-normalized sparse matrix, matching
+    `nx.pagerank`: uniform teleport, and rank held by nodes without outgoing weight spread uniformly.
+    Returns:
+        np.ndarray: Rank per node id, summing to 1.
+    """
+    node_count = len(matrix)
+    if not node_count:
+        return np.zeros(0)
+    out_weight = matrix.weighted_out_degree()
+    dangling = out_weight == 0
+    inverse = np.divide(1.0, out_weight, out=np.zeros(node_count), where=~dangling)
+    transition = sparse.diags(inverse) @ matrix.weights
+
+    rank = np.full(node_count, 1.0 / node_count)
+    for _ in range(max_iterations):
+        previous = rank
+        base = (1.0 - damping + damping * previous[dangling].sum()) / node_count
+        rank = damping * (transition.T @ previous) + base
+        if np.abs(rank - previous).sum() < node_count * tolerance:
+            break
+    return rank
+
+
+def betweenness(matrix):
+    """
+    Betweenness centrality over hop-count shortest paths, normalized like
+    `nx.betweenness_centrality` for directed graphs. Brandes' algorithm in its algebraic form:
+    the BFS and the dependency accumulation run for a block of sources at once, each level
+    one sparse-times-dense product over (nodes x sources) matrices.
+    Returns:
+        np.ndarray: Centrality per node id.
+    """
+    node_count = len(matrix)
+    centrality = np.zeros(node_count)
+    sources = np.flatnonzero(matrix.out_degree())  # Nodes without successors lie on no path as a source
+    forward = matrix.links.T.tocsr()
+    block_size = max(1, BETWEENNESS_BLOCK_CELLS // max(node_count, 1))
+    for start in range(0, len(sources), block_size):
+        block = sources[start:start + block_size]
+        columns = np.arange(len(block))
+        paths = np.zeros((node_count, len(block)))
+        paths[block, columns] = 1.0
+        depth = np.full((node_count, len(block)), -1, dtype=np.int32)
+        depth[block, columns] = 0
+
+        frontier = paths.copy()
+        level = 0
+        while True:
+            reached = forward @ frontier
+            reached[depth >= 0] = 0.0
+            if not reached.any():
+                break
+            level += 1
+            depth[reached > 0] = level
+            paths += reached
+            frontier = reached
+
+        dependency = np.zeros_like(paths)
+        for current in range(level, 0, -1):
+            at_level = depth == current
+            coefficient = np.where(at_level, (1.0 + dependency) / np.where(at_level, paths, 1.0), 0.0)
+            dependency += np.where(depth == current - 1, paths * (matrix.links @ coefficient), 0.0)
+        dependency[block, columns] = 0.0  # A source is not between itself and its targets
+        centrality += dependency.sum(axis=1)
+
+    if node_count > 2:
+        centrality /= (node_count - 1) * (node_count - 2)
+    return centrality
+
+
+def reachable_counts(adjacency):
+    """
+    Count the nodes reachable from each node, excluding itself (`len(nx.descendants)`).
+    Nodes are collapsed into their strongly connected components first, so the breadth-first
+    search runs once per component over the condensation instead of once per node.
+    Args:
+        adjacency (sparse.csr_matrix): Directed adjacency matrix.
+    """
+    node_count = adjacency.shape[0]
+    if not node_count:
+        return np.zeros(0, dtype=np.int64)
+    component_count, component_of = csgraph.connected_components(adjacency, directed=True, connection="strong")
+    sizes = np.bincount(component_of, minlength=component_count)
+    edges = adjacency.tocoo()
+    condensation = sparse.csr_matrix(
+        (np.ones(len(edges.row)), (component_of[edges.row], component_of[edges.col])),
+        shape=(component_count, component_count),
+    )
+    reach = np.array([
+        sizes[csgraph.breadth_first_order(condensation, component, directed=True, return_predecessors=False)].sum()
+        for component in range(component_count)
+    ])
+    return reach[component_of] - 1
+
+
+def compute_graph_analytics(graph):
+    """
+    Compute per-service centrality and reach metrics of the dependency graph.
+    Args:
+        graph (nx.DiGraph): Service graph with `weight` (calls) edge attributes.
+    Returns:
+        dict: {"services": {service: {"pagerank", "betweenness", "in_degree", "out_degree",
+               "weighted_in_degree", "weighted_out_degree", "upstream", "downstream"}},
+               "critical_services": [service, ...]}
+        where upstream counts the services that transitively call a service (its blast radius)
+        and downstream the services it transitively calls. Critical services are ranked by
+        upstream count, then PageRank.
+    """
+    matrix = GraphMatrix.from_networkx(graph)
+    metrics = {
+        "pagerank": pagerank(matrix),
+        "betweenness": betweenness(matrix),
+        "in_degree": matrix.in_degree(),
+        "out_degree": matrix.out_degree(),
+        "weighted_in_degree": matrix.weighted_in_degree(),
+        "weighted_out_degree": matrix.weighted_out_degree(),
+        "upstream": reachable_counts(matrix.links.T.tocsr()),
+        "downstream": reachable_counts(matrix.links),
+    }
+    # Plain Python numbers, for JSON serialization
+    metrics = {name: values.tolist() for name, values in metrics.items()}
+    services = {
+        service: {name: values[node] for name, values in metrics.items()}
+        for node, service in enumerate(matrix.nodes)
+    }
+    critical = sorted(services, key=lambda service: (-services[service]["upstream"], -services[service]["pagerank"]))
+    return {"services": services, "critical_services": critical[:CRITICAL_SERVICES_LIMIT]}
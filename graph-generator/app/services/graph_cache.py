@@ -0,0 +1,126 @@
+import threading
+from pymongo import ReturnDocument
+from app.core.database import db_manager
+
+
+def get_graph_version():
+    """
+    Retrieve the current graph version from the trace_collection_updates collection.
+    The version is shared by every worker, so all process-local caches invalidate together.
+    """
+    collection = db_manager.get_trace_collection_updates_collection()
+    record = collection.find_one({}, {"graph_version": 1})
+    return int((record or {}).get("graph_version", 0))
+
+
+async def get_graph_version_async():
+    """
+    Retrieve the current graph version without blocking the event loop.
+    """
+    collection = db_manager.get_async_trace_collection_updates_collection()
+    record = await collection.find_one({}, {"graph_version": 1})
+    return int((record or {}).get("graph_version", 0))
+
+
+def get_graph_write_state():
+    """
+    Retrieve the graph version together with whether a Neo4j graph write is in progress.
+    A reader that sees the same state, without a write in progress, before and after reading
+    the graph has read exactly that version.
+    Returns:
+        tuple: (version, write_pending)
+    """
+    collection = db_manager.get_trace_collection_updates_collection()
+    record = collection.find_one({}, {"graph_version": 1, "graph_write_pending": 1}) or {}
+    return int(record.get("graph_version", 0)), bool(record.get("graph_write_pending", False))
+
+
+def mark_graph_write_pending():
+    """
+    Flag that a Neo4j graph write has started; `bump_graph_version` clears the flag.
+    A write that fails leaves the flag set until the next write completes.
+    """
+    collection = db_manager.get_trace_collection_updates_collection()
+    collection.update_one({}, {"$set": {"graph_write_pending": True}}, upsert=True)
+
+
+def bump_graph_version(state=None):
+    """
+    Increment the graph version after the Neo4j graph changed.
+    Args:
+        state (dict): Other fields of the state document to set in the same update, such as the
+            sync checkpoint, so they change exactly when the new version does.
+    Returns:
+        int: The new version, which identifies exactly this write.
+    """
+    collection = db_manager.get_trace_collection_updates_collection()
+    record = collection.find_one_and_update(
+        {},
+        {"$inc": {"graph_version": 1}, "$set": {**(state or {}), "graph_write_pending": False}},
+        projection={"graph_version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return int(record["graph_version"])
+
+
+def format_etag(version, *variant):
+    """
+    Build the HTTP entity tag for a graph version and an optional response variant.
+    """
+    return '"' + "-".join(["graph", f"v{version}", *map(str, variant)]) + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Check an If-None-Match header against an entity tag (weak comparison).
+    """
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+
+class GraphCache:
+    """
+    Process-local cache of serialized graph payloads, one entry per key, valid for one graph version.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, version, build):
+        """
+        Return the payload cached for `key` at `version`, building and caching it on a miss.
+        The version must be read before `build` runs, so a concurrent update can only make
+        the entry stale (and rebuilt on the next request), never wrongly current.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        return self._store(key, version, build())
+
+    async def get_async(self, key, version, build):
+        """
+        Like `get`, with `build` a coroutine function.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        return self._store(key, version, await build())
+
+    def _store(self, key, version, payload):
+        with self._lock:
+            current = self._entries.get(key)
+            if current is None or current[0] <= version:
+                self._entries[key] = (version, payload)
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+graph_cache = GraphCache()
@@ -1,91 +1,394 @@
 import networkx as nx
 from networkx.readwrite import json_graph
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
 from app.core.database import db_manager
+from app.core.metrics import GRAPH_BUILD_SECONDS, NEO4J_WRITE_SECONDS
+from app.services.graph_cache import bump_graph_version, mark_graph_write_pending
+from app.services.parallel import map_trace_shards
+from app.services.span_extractor import iter_span_edges
+from app.utils.sketch import LatencySketch
 
+MERGE_SERVICE_EDGES_QUERY = """
+    UNWIND $rows AS row
+    MERGE (a:Service {name: row.parent})
+    MERGE (b:Service {name: row.child})
+    MERGE (a)-[r:CALLS]->(b)
+    WITH r, row
+    WHERE row.sync_seq IS NULL OR r.sync_seq IS NULL OR r.sync_seq <> row.sync_seq
+    SET r.weight = coalesce(r.weight, 0) + row.weight,
+        r.traces = coalesce(r.traces, 0) + row.traces,
+        r.latency_sketch = coalesce(row.latency_sketch, r.latency_sketch),
+        r.sync_seq = coalesce(row.sync_seq, r.sync_seq)
+"""
 
-def generate_weighted_graph_from_traces(traces):
+READ_EDGE_SKETCHES_QUERY = """
+    UNWIND $rows AS row
+    MATCH (:Service {name: row.parent})-[r:CALLS]->(:Service {name: row.child})
+    WHERE r.latency_sketch IS NOT NULL
+    RETURN row.parent AS parent, row.child AS child, r.latency_sketch AS sketch
+"""
+
+READ_SERVICE_GRAPH_QUERY = """
+    MATCH (a:Service)-[r:CALLS]->(b:Service)
+    RETURN a.name AS parent, b.name AS child, r.weight AS weight, r.traces AS traces,
+           r.latency_sketch AS latency_sketch
+"""
+
+# A rebuild writes the new graph as CALLS_REBUILD relationships, which readers never match,
+# and swaps them in for the CALLS relationships in a single transaction
+CLEAR_STAGED_SERVICE_EDGES_QUERY = """
+    MATCH (:Service)-[r:CALLS_REBUILD]->(:Service)
+    CALL { WITH r DELETE r } IN TRANSACTIONS OF 10000 ROWS
+"""
+
+STAGE_SERVICE_EDGES_QUERY = """
+    UNWIND $rows AS row
+    MERGE (a:Service {name: row.parent})
+    MERGE (b:Service {name: row.child})
+    CREATE (a)-[r:CALLS_REBUILD]->(b)
+    SET r.weight = row.weight, r.traces = row.traces, r.latency_sketch = row.latency_sketch
+"""
+
+DELETE_SERVICE_EDGES_QUERY = """
+    MATCH (:Service)-[r:CALLS]->(:Service)
+    DELETE r
+"""
+
+PROMOTE_STAGED_SERVICE_EDGES_QUERY = """
+    MATCH (a:Service)-[s:CALLS_REBUILD]->(b:Service)
+    CREATE (a)-[r:CALLS]->(b)
+    SET r = properties(s)
+    DELETE s
+"""
+
+DUPLICATE_KEY_ERROR = 11000
+# Documents counted by graph sync record the last ingest sequence number of the batch that
+# last added to them, so a batch replayed after a failed sync is skipped where it was applied
+SYNC_BATCH_FIELD = "sync_seq"
+
+LATENCY_QUANTILES = {"latency_p50_us": 0.5, "latency_p95_us": 0.95, "latency_p99_us": 0.99}
+
+
+def count_service_edges(traces):
     """
-    Generate a weighted dependency graph from new traces.
+    Count service edges in a batch of traces into compact partial counters.
+    Returns:
+        dict: {(parent, child): [weight, traces, LatencySketch]} in first-seen edge order.
     """
-    graph = nx.DiGraph()
+    counters = {}
 
     for trace in traces:
-        processes = trace.get("processes", {})
-        spans = trace.get("spans", [])
-
-        # Map process IDs to service names
-        process_to_service = {pid: details["serviceName"] for pid, details in processes.items()}
-
-        # Process spans to build relationships
-        for span in spans:
-            process_id = span.get("processID")
-            parent_span_id = None
-            for ref in span.get("references", []):
-                if ref["refType"] == "CHILD_OF":
-                    parent_span_id = ref["spanID"]
-                    break
-
-            if parent_span_id and process_id in process_to_service:
-                child_service = process_to_service[process_id]
-                parent_span = next((s for s in spans if s["spanID"] == parent_span_id), None)
-                if parent_span and parent_span["processID"] in process_to_service:
-                    parent_service = process_to_service[parent_span["processID"]]
-
-                    # Skip self-loops
-                    if parent_service != child_service:
-                        # Update graph with weight
-                        if graph.has_edge(parent_service, child_service):
-                            graph[parent_service][child_service]["weight"] += 1
-                        else:
-                            graph.add_edge(parent_service, child_service, weight=1)
+        trace_edges = set()
+        for parent_service, child_service, span in iter_span_edges(trace):
+            # Skip unknown children and self-loops
+            if child_service is None or parent_service == child_service:
+                continue
+
+            edge = (parent_service, child_service)
+            counts = counters.get(edge)
+            if counts is None:
+                counts = counters[edge] = [0, 0, LatencySketch()]
+            counts[0] += 1
+            trace_edges.add(edge)
 
+            if "duration" in span:
+                counts[2].add(span["duration"])
+
+        for edge in trace_edges:
+            counters[edge][1] += 1
+
+    return counters
+
+
+def merge_edge_counters(merged, partial):
+    """
+    Merge partial edge counters into `merged`, keeping first-seen edge order.
+    """
+    for edge, (weight, traces, sketch) in partial.items():
+        counts = merged.get(edge)
+        if counts is None:
+            merged[edge] = [weight, traces, sketch]
+        else:
+            counts[0] += weight
+            counts[1] += traces
+            counts[2].merge(sketch)
+    return merged
+
+
+def graph_from_edge_counters(counters):
+    """
+    Convert edge counters into the weighted NetworkX graph used by the Neo4j writer.
+    """
+    graph = nx.DiGraph()
+    for (parent_service, child_service), (weight, traces, sketch) in counters.items():
+        graph.add_edge(parent_service, child_service, weight=weight, traces=traces, latency_sketch=sketch)
     return graph
 
 
-def update_graph_in_neo4j(graph):
+def write_edge_archive(counters, batch_id):
+    """
+    Add edge counters of traces leaving the span store to the durable edge archive, so a
+    full rebuild still counts them after the traces are deleted.
+    Each archive edge records the last batch added to it, and an edge that already holds
+    `batch_id` is left alone, so replaying the latest batch after a crash adds it only once.
+    Args:
+        counters (dict): {(parent, child): [weight, traces, LatencySketch]} from `count_service_edges`.
+        batch_id: Identifier of the retention batch the counters come from.
+    """
+    if not counters:
+        return
+    edge_archive = db_manager.get_edge_archive_collection()
+    stored = {
+        (doc["parent"], doc["child"]): doc.get("latency_sketch")
+        for doc in edge_archive.find(
+            {"$or": [{"parent": parent, "child": child} for parent, child in counters]},
+            {"parent": 1, "child": 1, "latency_sketch": 1},
+        )
+    }
+
+    operations = []
+    for (parent, child), (weight, traces, sketch) in counters.items():
+        update = {"$inc": {"weight": weight, "traces": traces}, "$set": {"archive_batch": batch_id}}
+        existing = stored.get((parent, child))
+        if existing:
+            sketch = LatencySketch.from_json(existing).merge(sketch)
+        serialized = serialize_sketch(sketch)
+        if serialized is not None:
+            update["$set"]["latency_sketch"] = serialized
+        operations.append(UpdateOne(
+            {"parent": parent, "child": child, "archive_batch": {"$ne": batch_id}}, update, upsert=True
+        ))
+    write_batch_updates(edge_archive, operations)
+
+
+def write_batch_updates(collection, operations):
+    """
+    Run upserts stamped with a batch as one unordered bulk write. Each one filters on its
+    key plus `{field: {"$ne": batch}}`; a document already holding the batch fails the filter
+    and its upsert hits the unique key, so those duplicate key errors mark updates the batch
+    already made and are ignored.
+    """
+    if not operations:
+        return
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+            raise
+
+
+def serialize_sketch(sketch):
+    """
+    Serialize a latency sketch for storage, or None if there is none or it is empty.
+    """
+    return sketch.to_json() if sketch is not None and sketch.count else None
+
+
+def read_edge_archive():
+    """
+    Load the edge archive as edge counters, the starting point of a full rebuild.
+    Returns:
+        dict: {(parent, child): [weight, traces, LatencySketch]}
+    """
+    counters = {}
+    for doc in db_manager.get_edge_archive_collection().find({}, {"_id": 0}):
+        sketch = doc.get("latency_sketch")
+        counters[(doc["parent"], doc["child"])] = [
+            doc.get("weight", 0), doc.get("traces", 0), LatencySketch.from_json(sketch) if sketch else LatencySketch(),
+        ]
+    return counters
+
+
+def generate_weighted_graph_from_traces(traces):
+    """
+    Generate a weighted dependency graph from new traces.
+    Each edge carries its call count as `weight`, the number of traces it appears in as `traces`,
+    and a `latency_sketch` of the child span durations.
+    """
+    with GRAPH_BUILD_SECONDS.labels("serial").time():
+        return graph_from_edge_counters(count_service_edges(traces))
+
+
+def generate_weighted_graph_in_parallel(traces, workers=None, shard_size=None):
+    """
+    Generate the same graph as `generate_weighted_graph_from_traces`, sharding the trace
+    stream across a process pool. Workers return partial edge counters that are merged
+    in shard order, so the result is identical to the serial build.
+    """
+    with GRAPH_BUILD_SECONDS.labels("parallel").time():
+        merged = {}
+        for partial in map_trace_shards(traces, count_service_edges, workers=workers, shard_size=shard_size):
+            merge_edge_counters(merged, partial)
+        return graph_from_edge_counters(merged)
+
+
+def _merge_service_edges(tx, rows, sync_seq=None):
+    """
+    Merge one chunk of service edges inside a write transaction.
+    Latency sketches are read and merged with the stored ones in the same transaction.
+    With a `sync_seq`, edges already stamped with it are left alone.
+    """
+    stored = {
+        (record["parent"], record["child"]): record["sketch"]
+        for record in tx.run(READ_EDGE_SKETCHES_QUERY, rows=[
+            {"parent": row["parent"], "child": row["child"]} for row in rows if row.get("latency_sketch")
+        ])
+    }
+
+    params = []
+    for row in rows:
+        sketch = row.get("latency_sketch")
+        existing = stored.get((row["parent"], row["child"]))
+        if existing and serialize_sketch(sketch) is not None:
+            sketch = LatencySketch.from_json(existing).merge(sketch)
+        params.append({
+            "parent": row["parent"],
+            "child": row["child"],
+            "weight": row["weight"],
+            "traces": row.get("traces", 0),
+            "latency_sketch": serialize_sketch(sketch),
+            "sync_seq": sync_seq,
+        })
+
+    tx.run(MERGE_SERVICE_EDGES_QUERY, rows=params).consume()
+
+
+def _graph_rows(graph):
+    return [
+        {
+            "parent": parent,
+            "child": child,
+            "weight": attributes.get("weight", 1),
+            "traces": attributes.get("traces", 0),
+            "latency_sketch": attributes.get("latency_sketch"),
+        }
+        for parent, child, attributes in graph.edges(data=True)
+    ]
+
+
+def update_graph_in_neo4j(graph, batch_size=None, sync_seq=None, state=None):
     """
     Update the dependency graph in Neo4j using the provided NetworkX graph.
+    Edges are sent in chunks of `batch_size` rows, one UNWIND statement per write transaction.
+    Args:
+        sync_seq (int): Sync batch the edges come from; each edge is stamped with it, and edges
+            already stamped by an earlier, failed attempt at the same batch are not added again.
+        state (dict): State document fields to set together with the version bump.
+    Returns:
+        int: The graph version of this write, or None if the graph had no edges (nothing is
+        written then, `state` included).
+    """
+    batch_size = batch_size or settings.NEO4J_WRITE_BATCH_SIZE
+    rows = _graph_rows(graph)
+
+    if not rows:
+        return None
+
+    mark_graph_write_pending()
+    with NEO4J_WRITE_SECONDS.time(), db_manager.neo4j_driver.session() as session:
+        for start in range(0, len(rows), batch_size):
+            session.execute_write(_merge_service_edges, rows[start:start + batch_size], sync_seq)
+    return bump_graph_version(state)
+
+
+def _stage_service_edges(tx, rows):
+    params = [{**row, "latency_sketch": serialize_sketch(row["latency_sketch"])} for row in rows]
+    tx.run(STAGE_SERVICE_EDGES_QUERY, rows=params).consume()
+
+
+def _swap_staged_service_edges(tx):
+    tx.run(DELETE_SERVICE_EDGES_QUERY).consume()
+    tx.run(PROMOTE_STAGED_SERVICE_EDGES_QUERY).consume()
+
+
+def replace_graph_in_neo4j(graph, batch_size=None, state=None):
+    """
+    Replace the whole dependency graph in Neo4j with the provided NetworkX graph.
+    The edges are first written as CALLS_REBUILD relationships, in chunks of `batch_size`,
+    then swapped for the CALLS relationships in one write transaction: readers see the old
+    graph until the swap commits, and a rebuild that fails before it leaves the old graph
+    in place (its staged edges are cleared by the next rebuild).
+    `state` fields are set together with the version bump that follows the swap.
+    Returns:
+        int: The graph version of this write.
+    """
+    batch_size = batch_size or settings.NEO4J_WRITE_BATCH_SIZE
+    rows = _graph_rows(graph)
+
+    with NEO4J_WRITE_SECONDS.time(), db_manager.neo4j_driver.session() as session:
+        session.run(CLEAR_STAGED_SERVICE_EDGES_QUERY).consume()
+        for start in range(0, len(rows), batch_size):
+            session.execute_write(_stage_service_edges, rows[start:start + batch_size])
+        mark_graph_write_pending()
+        session.execute_write(_swap_staged_service_edges)
+    return bump_graph_version(state)
+
+
+def get_latency_percentiles(serialized_sketch):
+    """
+    Compute the p50/p95/p99 latency (microseconds) of a stored edge sketch.
+    Returns:
+        dict: {"latency_p50_us": float, ...}, empty when the edge has no sketch.
+    """
+    if not serialized_sketch:
+        return {}
+    sketch = LatencySketch.from_json(serialized_sketch)
+    return {name: round(sketch.quantile(q), 1) for name, q in LATENCY_QUANTILES.items()}
+
+
+def _add_service_edge_record(graph, record):
+    """
+    Add one READ_SERVICE_GRAPH_QUERY record to a NetworkX graph.
+    """
+    graph.add_edge(
+        record["parent"], record["child"], weight=record["weight"], traces=record["traces"] or 0,
+        **get_latency_percentiles(record["latency_sketch"])
+    )
+
+
+def read_graph_from_neo4j():
+    """
+    Read the dependency graph from Neo4j as a NetworkX graph object. Errors propagate.
     """
+    graph = nx.DiGraph()
+
     with db_manager.neo4j_driver.session() as session:
-        for edge in graph.edges(data=True):
-            parent, child, attributes = edge
-            weight = attributes.get("weight", 1)
+        result = session.run(READ_SERVICE_GRAPH_QUERY)
+
+        for record in result:
+            _add_service_edge_record(graph, record)
 
-            # Create or update nodes and relationships in Neo4j
-            session.run("""
-                MERGE (a:Service {name: $parent})
-                MERGE (b:Service {name: $child})
-                MERGE (a)-[r:CALLS]->(b)
-                ON CREATE SET r.weight = $weight
-                ON MATCH SET r.weight = r.weight + $weight
-            """, parent=parent, child=child, weight=weight)
+    return graph
 
 
-def fetch_graph_from_neo4j():
+async def read_graph_from_neo4j_async():
     """
-    Fetch the dependency graph from Neo4j and return it as a NetworkX graph object.
+    Read the dependency graph from Neo4j with the async driver. Errors propagate.
     """
     graph = nx.DiGraph()
 
-    try:
-        with db_manager.neo4j_driver.session() as session:
-            result = session.run("""
-                MATCH (a:Service)-[r:CALLS]->(b:Service)
-                RETURN a.name AS parent, b.name AS child, r.weight AS weight
-            """)
-
-            for record in result:
-                parent = record["parent"]
-                child = record["child"]
-                weight = record["weight"]
-                graph.add_edge(parent, child, weight=weight)
+    async with db_manager.get_async_neo4j_driver().session() as session:
+        result = await session.run(READ_SERVICE_GRAPH_QUERY)
 
-    except Exception as e:
-        print(f"Error fetching graph from Neo4j: {e}")
+        async for record in result:
+            _add_service_edge_record(graph, record)
 
     return graph
 
 
+def fetch_graph_from_neo4j():
+    """
+    Fetch the dependency graph from Neo4j and return it as a NetworkX graph object.
+    """
+    try:
+        return read_graph_from_neo4j()
+    except Exception as e:
+        print(f"Error fetching graph from Neo4j: {e}")
+        return nx.DiGraph()
+
+
 def get_graph_data_as_json():
     """
     Retrieve the dependency graph as JSON-compatible data for API or frontend consumption.
@@ -1,36 +1,303 @@
+import threading
+from datetime import datetime, timezone
+from app.core.config import settings
 from app.core.database import db_manager
+from app.core.metrics import GRAPH_BUILD_SECONDS
+from app.services.anti_patterns import anti_pattern_detector, observe_sync_batch
+from app.services.graph_processor import (
+    count_service_edges,
+    generate_weighted_graph_from_traces,
+    graph_from_edge_counters,
+    merge_edge_counters,
+    read_edge_archive,
+    replace_graph_in_neo4j,
+    update_graph_in_neo4j,
+    write_edge_archive
+)
+from app.services.operation_graph import (
+    operation_graph_from_documents,
+    read_operation_edges,
+    replace_operation_edges,
+    write_operation_edge_archive,
+    write_operation_edges
+)
+from app.services.parallel import map_trace_shards
+from app.services.replica_coordinator import ensure_lease_held
+from app.services.rollups import (
+    clear_edge_rollups,
+    collect_edge_rollups,
+    merge_rollup_counters,
+    new_rollup_counters,
+    write_edge_rollups
+)
+from app.services.span_store import expand_span_documents, iter_span_document_batches
 
+# Rollup keys buffered during a rebuild before they are flushed to Mongo
+REBUILD_ROLLUP_FLUSH_KEYS = 50_000
+# Span store documents taken by a retention batch are stamped with its id before they are archived
+ARCHIVE_BATCH_FIELD = "archive_batch"
+# Sync state field holding the last ingest sequence number of a sync batch being written
+PENDING_SYNC_FIELD = "pending_sync_seq"
 
-def fetch_new_traces_since_last_sync():
+# Graph sync and rebuild run in worker threads; one at a time, so no batch is folded in twice
+graph_write_lock = threading.Lock()
+
+
+def _settled_cutoff_us():
+    """
+    Ingest time (microseconds) after which traces are not yet safe to sync.
+    """
+    return int(datetime.now(timezone.utc).timestamp() * 1e6 - settings.GRAPH_SYNC_SETTLE_SECONDS * 1e6)
+
+
+def fetch_new_span_documents(batch_size=None):
+    """
+    Fetch the span store documents of the next batch of traces ingested after the last synced
+    ingest sequence number.
+    Only the settled prefix is returned: the batch stops at the first trace ingested less
+    than GRAPH_SYNC_SETTLE_SECONDS ago, so a slower writer holding a lower sequence number
+    cannot be skipped by the checkpoint.
+    Returns:
+        list: Compact trace_spans documents in ascending `ingest_seq` order.
+    """
+    trace_spans = db_manager.get_trace_spans_collection()
+    batch_size = batch_size or settings.GRAPH_SYNC_BATCH_SIZE
+    last_synced_seq = get_last_synced_seq()
+
+    batch = trace_spans.find(
+        {"ingest_seq": {"$gt": last_synced_seq}}, {"_id": 0, "parents": 0}
+    ).sort("ingest_seq", 1).limit(batch_size)
+
+    cutoff_us = _settled_cutoff_us()
+    documents = []
+    for document in batch:
+        if document.get("ingested_at_us", 0) > cutoff_us:
+            break
+        documents.append(document)
+    return documents
+
+
+def fetch_new_traces_since_last_sync(batch_size=None):
+    """
+    Fetch the next batch of traces to sync (see `fetch_new_span_documents`), expanded to
+    Jaeger-shaped traces.
+    Returns:
+        list: Traces in ascending `ingest_seq` order.
+    """
+    return expand_span_documents(fetch_new_span_documents(batch_size))
+
+
+def next_sync_batch(batch_size=None):
+    """
+    Pick the next sync batch. A batch whose write failed is recorded as pending and is picked
+    again with exactly the same traces; otherwise the next settled batch is recorded as pending
+    before any of it is written.
+    Returns:
+        tuple: (documents, sync_seq), sync_seq being the batch's last ingest sequence number;
+        (None, None) when there is nothing to sync.
+    """
+    state = get_sync_state()
+    sync_seq = state.get(PENDING_SYNC_FIELD)
+    if sync_seq is not None:
+        documents = list(db_manager.get_trace_spans_collection().find(
+            {"ingest_seq": {"$gt": int(state.get("last_synced_seq", 0)), "$lte": sync_seq}}, {"_id": 0, "parents": 0}
+        ).sort("ingest_seq", 1))
+        return documents, sync_seq
+
+    documents = fetch_new_span_documents(batch_size)
+    if not documents:
+        return None, None
+    sync_seq = documents[-1]["ingest_seq"]
+    db_manager.get_trace_collection_updates_collection().update_one(
+        {}, {"$set": {PENDING_SYNC_FIELD: sync_seq}}, upsert=True
+    )
+    return documents, sync_seq
+
+
+def sync_graph_incrementally(batch_size=None, lease_held=None):
     """
-    Fetch all new traces since the last sync date.
+    Fold every trace ingested since the last sync into the Neo4j graph, the operation edges
+    and the edge rollups, one bounded batch at a time, advancing the checkpoint after each
+    batch is written.
+    Every edge, rollup bucket and operation edge a batch adds to is stamped with the batch's
+    last ingest sequence number, and the checkpoint moves with the graph version bump. A batch
+    that fails part-way, or before its checkpoint, is replayed by the next sync and skipped
+    wherever it was already added, so each trace is counted once.
+    Args:
+        batch_size (int): Traces per batch.
+        lease_held (callable): Checked before each batch; the sync stops once it returns False.
+    Returns:
+        int: Number of traces synced.
+    Raises:
+        LeaseLostError: If the graph write lease was lost; batches already written are checkpointed.
     """
-    trace_collection = db_manager.get_trace_collection()
-    last_sync_date = get_last_sync_date()
+    with graph_write_lock:
+        synced = 0
+        while True:
+            ensure_lease_held(lease_held)
+            documents, sync_seq = next_sync_batch(batch_size)
+            if sync_seq is None:
+                return synced
 
-    query = {}
-    if last_sync_date:
-        query["spans.startTime"] = {"$gt": last_sync_date}  # Directly compare numeric timestamps
+            traces = expand_span_documents(documents)
+            graph = generate_weighted_graph_from_traces(traces)
+            write_edge_rollups(collect_edge_rollups(traces), sync_seq=sync_seq)
+            # Before the Neo4j write bumps the graph version, which the operation graph is cached by
+            write_operation_edges(operation_graph_from_documents(documents), sync_seq)
+            checkpoint = {"last_synced_seq": sync_seq, PENDING_SYNC_FIELD: None}
+            version = update_graph_in_neo4j(graph, sync_seq=sync_seq, state=checkpoint)
+            if version is None:
+                update_last_synced_seq(sync_seq)
+            observe_sync_batch(graph, traces, version)
+            synced += len(traces)
 
-    return list(trace_collection.find(query, {"_id": 0}))
 
+def get_sync_state():
+    """
+    Retrieve the graph sync state document from the trace_collection_updates collection.
+    """
+    collection = db_manager.get_trace_collection_updates_collection()
+    return collection.find_one() or {}
 
-def update_last_sync_date(last_sync_date):
+
+def update_last_synced_seq(last_synced_seq):
     """
-    Update the last sync date in the trace_collection_updates collection.
+    Update the last synced ingest sequence number in the trace_collection_updates collection,
+    clearing any pending sync batch.
     """
     collection = db_manager.get_trace_collection_updates_collection()
     collection.update_one(
         {},
-        {"$set": {"last_sync_date": last_sync_date}},
+        {"$set": {"last_synced_seq": last_synced_seq, PENDING_SYNC_FIELD: None}},
         upsert=True
     )
 
 
-def get_last_sync_date():
+def get_last_synced_seq():
     """
-    Retrieve the last sync date from the trace_collection_updates collection.
+    Retrieve the last synced ingest sequence number, or 0 if nothing was synced yet.
     """
-    collection = db_manager.get_trace_collection_updates_collection()
-    record = collection.find_one()
-    return int(record["last_sync_date"]) if record else None
+    return int(get_sync_state().get("last_synced_seq", 0))
+
+
+def get_archive_horizon_us():
+    """
+    Retrieve the trace start time (microseconds) before which synced traces have been folded
+    into the edge archive and scheduled for deletion, or 0 if retention never ran.
+    """
+    return int(get_sync_state().get("archive_horizon_us", 0))
+
+
+def get_latest_settled_seq():
+    """
+    Retrieve the highest ingest sequence number that is old enough to be synced, or 0.
+    """
+    trace_spans = db_manager.get_trace_spans_collection()
+    latest = trace_spans.find_one(
+        {"ingest_seq": {"$exists": True}, "ingested_at_us": {"$lte": _settled_cutoff_us()}},
+        {"ingest_seq": 1},
+        sort=[("ingest_seq", -1)],
+    )
+    return latest["ingest_seq"] if latest else 0
+
+
+def archive_span_batch(batch_id, expire_at):
+    """
+    Fold the span store documents stamped with `batch_id` into the edge archive and the
+    operation edge archive, then schedule them for TTL deletion at `expire_at`. Safe to repeat
+    after a failure at any point: the archives skip edges the batch was already added to, and
+    no document expires before the whole batch is archived.
+    Returns:
+        int: Number of documents in the batch.
+    """
+    trace_spans = db_manager.get_trace_spans_collection()
+    documents = list(trace_spans.find({ARCHIVE_BATCH_FIELD: batch_id}, {"_id": 0, "parents": 0}))
+    write_edge_archive(count_service_edges(expand_span_documents(documents)), batch_id)
+    write_operation_edge_archive(operation_graph_from_documents(documents), batch_id)
+    trace_spans.update_many({ARCHIVE_BATCH_FIELD: batch_id}, {"$set": {"expire_at": expire_at}})
+    return len(documents)
+
+
+def finish_pending_archive_batches(expire_at):
+    """
+    Complete the archive batches an interrupted retention run stamped but did not expire, so
+    their traces are counted once, from the archive. Must run under the graph write lock
+    before new batches are started or the span store is read for a rebuild.
+    Returns:
+        int: Number of documents archived.
+    """
+    pending = db_manager.get_trace_spans_collection().distinct(
+        ARCHIVE_BATCH_FIELD, {ARCHIVE_BATCH_FIELD: {"$exists": True}, "expire_at": {"$exists": False}}
+    )
+    return sum(archive_span_batch(batch_id, expire_at) for batch_id in sorted(pending))
+
+
+def build_rebuild_partials(traces):
+    """
+    Rebuild worker: reduce one shard of traces to plain edge and rollup counters.
+    Returns:
+        tuple: (edge_counters, rollup_counters, trace_count)
+    """
+    return count_service_edges(traces), dict(collect_edge_rollups(traces)), len(traces)
+
+
+def rebuild_graph_from_all_traces(batch_size=500, workers=None, shard_size=None, lease_held=None):
+    """
+    Rebuild the dependency graph in Neo4j, the operation edges and the edge rollups from every
+    stored trace.
+    Traces are streamed from the span store with a keyset reader and sharded across `workers`
+    processes; partial counters are merged in shard order, so the graph is identical to a
+    serial build and memory is bounded by the number of edges, not the number of traces.
+    The rebuild covers every trace up to the latest settled ingest sequence number
+    (including backfilled traces, which have sequence number 0) and moves the sync checkpoint there.
+    Traces already folded into the edge archives by retention are counted from the archives,
+    and rollup buckets before the archive horizon are kept as they are.
+    Args:
+        lease_held (callable): Checked after each shard and before the swap; the rebuild stops
+            once it returns False. The graph and the sync checkpoint are then left as they
+            were, like after a failed rebuild, but the rollups may be partly rebuilt.
+    Returns:
+        int: Number of traces processed.
+    Raises:
+        LeaseLostError: If the graph write lease was lost.
+    """
+    with graph_write_lock:
+        finish_pending_archive_batches(datetime.now(timezone.utc))
+        rebuild_seq = get_latest_settled_seq()
+        horizon_s = get_archive_horizon_us() // 1_000_000
+        clear_edge_rollups(since_s=horizon_s)
+        operation_graph = read_operation_edges(db_manager.get_operation_edge_archive_collection())
+
+        def traces():
+            # The operation graph is counted here from the compact documents; workers get the traces
+            for documents in iter_span_document_batches(
+                    {"ingest_seq": {"$lte": rebuild_seq}, "expire_at": {"$exists": False}}, batch_size):
+                for document in documents:
+                    operation_graph.add_span_document(document)
+                yield from expand_span_documents(documents)
+
+        processed = 0
+        edges = read_edge_archive()
+        rollups = new_rollup_counters()
+        with GRAPH_BUILD_SECONDS.labels("rebuild").time():
+            for shard_edges, shard_rollups, shard_traces in map_trace_shards(
+                    traces(), build_rebuild_partials, workers=workers, shard_size=shard_size):
+                merge_edge_counters(edges, shard_edges)
+                if horizon_s:
+                    shard_rollups = {key: counts for key, counts in shard_rollups.items() if key[0] >= horizon_s}
+                merge_rollup_counters(rollups, shard_rollups)
+                if len(rollups) >= REBUILD_ROLLUP_FLUSH_KEYS:
+                    write_edge_rollups(rollups)
+                    rollups = new_rollup_counters()
+                processed += shard_traces
+                ensure_lease_held(lease_held)
+
+        write_edge_rollups(rollups)
+        ensure_lease_held(lease_held)
+        replace_operation_edges(operation_graph)
+        # The checkpoint moves with the swap, so a failure in between cannot sync the rebuilt traces again
+        replace_graph_in_neo4j(
+            graph_from_edge_counters(edges), state={"last_synced_seq": rebuild_seq, PENDING_SYNC_FIELD: None}
+        )
+        anti_pattern_detector.reset()
+        return processed
@@ -0,0 +1,282 @@
+import asyncio
+import base64
+import binascii
+import zlib
+from app.core.config import settings
+from app.core.metrics import INGEST_QUEUE_BATCHES, INGEST_REJECTED_TOTAL, INGEST_TRACES_TOTAL
+from app.services.data_collector import store_traces
+from app.utils.json_stream import JsonArrayStream
+
+# Label passed to store_traces for pushed batches, which are not tied to one Jaeger service
+INGEST_SOURCE = "ingest"
+JAEGER_FORMAT_KEY = "data"
+OTLP_FORMAT_KEY = "resourceSpans"
+OTLP_STATUS_ERROR = (2, "STATUS_CODE_ERROR")
+DECOMPRESS_CHUNK_BYTES = 1 << 20
+SUPPORTED_ENCODINGS = ("identity", "gzip")
+
+_queue = None
+_workers = []
+INGEST_QUEUE_BATCHES.set_function(lambda: _queue.qsize() if _queue is not None else 0)
+
+
+class IngestQueueFull(Exception):
+    """
+    Raised when the ingest queue stayed full for INGEST_ENQUEUE_TIMEOUT_SECONDS.
+    `accepted` traces of the payload were queued before that and will still be stored.
+    """
+
+    def __init__(self, accepted):
+        super().__init__(f"Ingest queue is full; {accepted} traces were accepted.")
+        self.accepted = accepted
+
+
+class PayloadTooLarge(ValueError):
+    """
+    Raised when a decompressed payload exceeds INGEST_MAX_BODY_MB.
+    """
+
+
+def get_ingest_queue():
+    """
+    Return the bounded queue of trace batches waiting to be stored, creating it on first use.
+    """
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_MAX_BATCHES)
+    return _queue
+
+
+async def _ingest_worker():
+    queue = get_ingest_queue()
+    while True:
+        batch = await queue.get()
+        try:
+            await store_traces(INGEST_SOURCE, batch)
+        except Exception as e:
+            print(f"Error storing {len(batch)} pushed traces: {e}")
+        finally:
+            queue.task_done()
+
+
+def start_ingest_workers():
+    """
+    Start the tasks that drain the ingest queue into the trace store.
+    """
+    get_ingest_queue()
+    for _ in range(settings.INGEST_WORKERS - len(_workers)):
+        _workers.append(asyncio.create_task(_ingest_worker()))
+    print(f"Started {len(_workers)} ingest workers.")
+
+
+async def stop_ingest_workers(drain_timeout_seconds=10):
+    """
+    Give queued batches up to `drain_timeout_seconds` to be stored, then stop the workers.
+    """
+    if _queue is not None and _workers:
+        try:
+            await asyncio.wait_for(_queue.join(), drain_timeout_seconds)
+        except asyncio.TimeoutError:
+            print(f"Stopping ingest workers with {_queue.qsize()} batches still queued.")
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+async def decode_body(chunks, encoding="identity"):
+    """
+    Decompress a request body stream chunk by chunk, enforcing INGEST_MAX_BODY_MB on the
+    decompressed size so a small gzip bomb cannot exhaust memory.
+    Yields:
+        bytes: Decompressed chunks.
+    Raises:
+        PayloadTooLarge: If the body grows past the limit.
+        ValueError: If the gzip stream is corrupt.
+    """
+    max_bytes = int(settings.INGEST_MAX_BODY_MB * 1024 * 1024)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip" else None
+    total = 0
+    async for chunk in chunks:
+        pending = [chunk] if decompressor is None else []
+        if decompressor is not None:
+            try:
+                data = chunk
+                while data:
+                    pending.append(decompressor.decompress(data, DECOMPRESS_CHUNK_BYTES))
+                    data = decompressor.unconsumed_tail
+            except zlib.error as e:
+                raise ValueError(f"Invalid gzip body: {e}") from e
+        for piece in pending:
+            total += len(piece)
+            if total > max_bytes:
+                raise PayloadTooLarge(f"Decompressed body exceeds {settings.INGEST_MAX_BODY_MB:g} MB.")
+            if piece:
+                yield piece
+    if decompressor is not None and not decompressor.eof:
+        raise ValueError("Truncated gzip body.")
+
+
+def is_valid_trace(trace):
+    """
+    Check a pushed Jaeger trace has the fields storing it relies on: a traceID, a spanID on
+    every span and its references, and a serviceName on every process. One malformed trace
+    would otherwise fail the whole batch it is stored with.
+    """
+    try:
+        if not isinstance(trace, dict) or "traceID" not in trace:
+            return False
+        for process in trace.get("processes", {}).values():
+            if "serviceName" not in process:
+                return False
+        for span in trace.get("spans", []):
+            if "spanID" not in span:
+                return False
+            for reference in span.get("references", []):
+                if "refType" not in reference or "spanID" not in reference:
+                    return False
+    except (AttributeError, TypeError):
+        return False
+    return True
+
+
+def _otlp_id(value):
+    """
+    OTLP/JSON encodes ids as hex; protobuf's generic JSON mapping uses base64. Return lowercase hex.
+    """
+    if not value:
+        return None
+    if len(value) in (16, 32):
+        try:
+            int(value, 16)
+            return value.lower()
+        except ValueError:
+            pass
+    try:
+        return base64.b64decode(value, validate=True).hex()
+    except (binascii.Error, ValueError):
+        return value
+
+
+def _otlp_value(value):
+    for field in ("stringValue", "boolValue", "intValue", "doubleValue"):
+        if field in value:
+            return int(value[field]) if field == "intValue" else value[field]
+    return None
+
+
+def _otlp_tags(attributes):
+    return [{"key": attribute["key"], "value": _otlp_value(attribute.get("value", {}))} for attribute in attributes]
+
+
+def add_otlp_resource_spans(resource_spans, traces):
+    """
+    Convert one OTLP `resourceSpans` entry to Jaeger-shaped spans, grouped into `traces`
+    by traceID. A trace's spans usually arrive in several entries (one per service), so
+    traces are only complete once the whole payload has been read.
+    Args:
+        resource_spans (dict): OTLP/JSON ResourceSpans.
+        traces (dict): {traceID: Jaeger trace}, updated in place.
+    """
+    attributes = resource_spans.get("resource", {}).get("attributes", [])
+    service_name = next(
+        (_otlp_value(attribute.get("value", {})) for attribute in attributes if attribute.get("key") == "service.name"),
+        None,
+    ) or "unknown_service"
+    scopes = resource_spans.get("scopeSpans") or resource_spans.get("instrumentationLibrarySpans") or []
+
+    for scope in scopes:
+        for otlp_span in scope.get("spans", []):
+            trace_id = _otlp_id(otlp_span.get("traceId"))
+            span_id = _otlp_id(otlp_span.get("spanId"))
+            if not trace_id or not span_id:
+                continue
+            trace = traces.setdefault(trace_id, {"traceID": trace_id, "spans": [], "processes": {}})
+            process_id = next(
+                (pid for pid, process in trace["processes"].items() if process["serviceName"] == service_name), None
+            )
+            if process_id is None:
+                process_id = f"p{len(trace['processes']) + 1}"
+                trace["processes"][process_id] = {"serviceName": service_name, "tags": _otlp_tags(attributes)}
+
+            start_ns = int(otlp_span.get("startTimeUnixNano", 0))
+            end_ns = int(otlp_span.get("endTimeUnixNano", start_ns))
+            tags = _otlp_tags(otlp_span.get("attributes", []))
+            if otlp_span.get("status", {}).get("code") in OTLP_STATUS_ERROR:
+                tags.append({"key": "error", "value": True})
+            span = {
+                "traceID": trace_id,
+                "spanID": span_id,
+                "operationName": otlp_span.get("name", ""),
+                "references": [],
+                "startTime": start_ns // 1000,
+                "duration": max(0, end_ns - start_ns) // 1000,
+                "processID": process_id,
+                "tags": tags,
+            }
+            parent_span_id = _otlp_id(otlp_span.get("parentSpanId"))
+            if parent_span_id:
+                span["references"].append({"refType": "CHILD_OF", "traceID": trace_id, "spanID": parent_span_id})
+            trace["spans"].append(span)
+
+
+async def _enqueue(batch, accepted):
+    try:
+        await asyncio.wait_for(get_ingest_queue().put(batch), settings.INGEST_ENQUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        INGEST_REJECTED_TOTAL.labels("queue_full").inc()
+        raise IngestQueueFull(accepted)
+
+
+async def enqueue_payload(chunks, encoding="identity"):
+    """
+    Parse a pushed trace payload incrementally and queue its traces for storage.
+    Accepts Jaeger query API JSON (`{"data": [trace, ...]}` or a bare list of traces) and
+    OTLP/JSON (`{"resourceSpans": [...]}`), optionally gzip-compressed. Jaeger traces are
+    queued in batches as they are parsed; OTLP spans are grouped into traces first, so a
+    payload must carry whole traces (as a relay grouping spans by trace would send them).
+    Malformed Jaeger traces are skipped and counted as rejected, so they cannot fail the batch.
+    Args:
+        chunks: Async iterable of body bytes.
+        encoding (str): Content-Encoding, "identity" or "gzip".
+    Returns:
+        int: Number of traces queued.
+    Raises:
+        IngestQueueFull: If the queue stayed full; traces queued before that are kept.
+        PayloadTooLarge: If the decompressed body is too large.
+        ValueError: If the body is not valid JSON of a supported format.
+    """
+    stream = JsonArrayStream(keys=(JAEGER_FORMAT_KEY, OTLP_FORMAT_KEY))
+    batch = []
+    otlp_traces = {}
+    accepted = 0
+
+    async def flush(traces, payload_format):
+        nonlocal accepted
+        await _enqueue(traces, accepted)
+        accepted += len(traces)
+        INGEST_TRACES_TOTAL.labels(payload_format).inc(len(traces))
+
+    async def handle(items):
+        nonlocal batch
+        for key, item in items:
+            if key == OTLP_FORMAT_KEY:
+                add_otlp_resource_spans(item, otlp_traces)
+            elif not is_valid_trace(item):
+                INGEST_REJECTED_TOTAL.labels("invalid").inc()
+            else:
+                batch.append(item)
+                if len(batch) >= settings.INGEST_BATCH_SIZE:
+                    await flush(batch, "jaeger")
+                    batch = []
+
+    async for chunk in decode_body(chunks, encoding):
+        await handle(stream.feed(chunk))
+    await handle(stream.close())
+
+    if batch:
+        await flush(batch, "jaeger")
+    otlp_batch = list(otlp_traces.values())
+    for start in range(0, len(otlp_batch), settings.INGEST_BATCH_SIZE):
+        await flush(otlp_batch[start:start + settings.INGEST_BATCH_SIZE], "otlp")
+    return accepted
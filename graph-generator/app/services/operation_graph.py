@@ -0,0 +1,324 @@
+from array import array
+import networkx as nx
+from pymongo import UpdateOne, errors
+from app.core.database import db_manager
+from app.services.graph_processor import SYNC_BATCH_FIELD, write_batch_updates
+from app.services.span_store import get_service_names
+from app.utils.interner import StringInterner
+from app.utils.pagination import iter_keyset
+
+# Span store fields the builder reads; the compact spans already carry interned service ids
+OPERATION_GRAPH_PROJECTION = {"ops": 1, "spans": 1}
+NODE_ID_SEPARATOR = ":"
+# Persisted operation edges are keyed by these fields and carry one field per counter column
+OPERATION_EDGE_KEY = ("parent_service", "parent_operation", "child_service", "child_operation")
+OPERATION_EDGE_COUNTERS = ("calls", "traces", "errors", "duration_us")
+# A rebuild writes the operation edges to this collection suffix and renames it over the live one
+STAGING_SUFFIX = "_rebuild"
+ARCHIVE_BATCH_FIELD = "archive_batch"
+
+
+class OperationGraph:
+    """
+    Operation-level dependency graph kept in flat integer arrays.
+    Nodes are (service id, operation id) pairs numbered densely in first-seen order; service
+    ids come from the span store registry and operation names are interned here. Edges are
+    stored as COO columns (`src`, `dst` and one counter array per attribute), indexed by edge
+    id, so a graph with millions of edges costs a few dozen bytes per edge instead of a
+    NetworkX attribute dict each. Convert with `to_node_link`/`to_networkx` only at the API boundary.
+    """
+
+    def __init__(self):
+        self.operations = StringInterner()
+        self._node_ids = {}  # service id << 32 | operation id -> node id
+        self.node_service = array("i")
+        self.node_operation = array("i")
+        self._edge_ids = {}  # src node << 32 | dst node -> edge id
+        self.src = array("i")
+        self.dst = array("i")
+        self.calls = array("q")
+        self.traces = array("q")
+        self.errors = array("q")
+        self.duration_us = array("q")
+
+    @property
+    def node_count(self):
+        return len(self.node_service)
+
+    @property
+    def edge_count(self):
+        return len(self.src)
+
+    def _node(self, service_id, operation_id):
+        key = service_id << 32 | operation_id
+        node_id = self._node_ids.get(key)
+        if node_id is None:
+            node_id = self._node_ids[key] = len(self.node_service)
+            self.node_service.append(service_id)
+            self.node_operation.append(operation_id)
+        return node_id
+
+    def _edge(self, src, dst):
+        key = src << 32 | dst
+        edge_id = self._edge_ids.get(key)
+        if edge_id is None:
+            edge_id = self._edge_ids[key] = len(self.src)
+            self.src.append(src)
+            self.dst.append(dst)
+            for column in (self.calls, self.traces, self.errors, self.duration_us):
+                column.append(0)
+        return edge_id
+
+    def add_span_document(self, document):
+        """
+        Count the operation edges of one span store document.
+        An edge runs from the parent span's (service, operation) to the child span's, so calls
+        between operations of the same service are kept; only exact self-loops and spans whose
+        service is unknown are skipped. Parents resolve to the first span with that ID, as in
+        `iter_span_edges`.
+        Args:
+            document (dict): trace_spans document with "ops" and "spans".
+        """
+        operation_ids = [self.operations.intern(operation) for operation in document.get("ops", [])]
+        spans = document.get("spans", [])
+        missing_operation = None
+
+        span_nodes = {}
+        nodes = []
+        for compact in spans:
+            if "v" not in compact:
+                nodes.append(None)
+                continue
+            if "o" in compact:
+                operation_id = operation_ids[compact["o"]]
+            else:
+                if missing_operation is None:
+                    missing_operation = self.operations.intern("")
+                operation_id = missing_operation
+            node_id = self._node(compact["v"], operation_id)
+            nodes.append(node_id)
+            span_nodes.setdefault(compact["i"], node_id)
+
+        trace_edges = set()
+        for compact, child in zip(spans, nodes):
+            if child is None or "p" not in compact:
+                continue
+            parent = span_nodes.get(compact["p"])
+            if parent is None or parent == child:
+                continue
+            edge_id = self._edge(parent, child)
+            self.calls[edge_id] += 1
+            self.duration_us[edge_id] += compact.get("d", 0)
+            if compact.get("e"):
+                self.errors[edge_id] += 1
+            trace_edges.add(edge_id)
+
+        for edge_id in trace_edges:
+            self.traces[edge_id] += 1
+
+    def add_edge_document(self, document):
+        """
+        Add the counters of one persisted operation edge (see `edge_documents`).
+        """
+        src = self._node(document["parent_service"], self.operations.intern(document["parent_operation"]))
+        dst = self._node(document["child_service"], self.operations.intern(document["child_operation"]))
+        edge_id = self._edge(src, dst)
+        for field in OPERATION_EDGE_COUNTERS:
+            getattr(self, field)[edge_id] += document.get(field, 0)
+
+    def edge_documents(self):
+        """
+        Serialize the edges for MongoDB: service ids, operation names and counters.
+        Yields:
+            dict: {"parent_service", "parent_operation", "child_service", "child_operation",
+                   "calls", "traces", "errors", "duration_us"}
+        """
+        for edge_id, (src, dst) in enumerate(zip(self.src, self.dst)):
+            yield {
+                "parent_service": self.node_service[src],
+                "parent_operation": self.operations[self.node_operation[src]],
+                "child_service": self.node_service[dst],
+                "child_operation": self.operations[self.node_operation[dst]],
+                **{field: getattr(self, field)[edge_id] for field in OPERATION_EDGE_COUNTERS},
+            }
+
+    def _node_labels(self):
+        service_names = get_service_names(set(self.node_service))
+        return [
+            (service_names.get(service_id, str(service_id)), self.operations[operation_id])
+            for service_id, operation_id in zip(self.node_service, self.node_operation)
+        ]
+
+    def _node_names(self, labels):
+        return [f"{service}{NODE_ID_SEPARATOR}{operation}" for service, operation in labels]
+
+    def _edge_attributes(self, edge_id):
+        calls = self.calls[edge_id]
+        return {
+            "weight": calls,
+            "traces": self.traces[edge_id],
+            "errors": self.errors[edge_id],
+            "mean_latency_us": self.duration_us[edge_id] / calls if calls else None,
+        }
+
+    def to_node_link(self):
+        """
+        Serialize the graph straight to the node-link JSON layout `json_graph.node_link_data`
+        produces for the service graph, without building a NetworkX graph first.
+        Returns:
+            dict: {"directed", "multigraph", "graph", "nodes", "links"}
+        """
+        labels = self._node_labels()
+        node_names = self._node_names(labels)
+        return {
+            "directed": True,
+            "multigraph": False,
+            "graph": {},
+            "nodes": [
+                {"service": service, "operation": operation, "id": name}
+                for name, (service, operation) in zip(node_names, labels)
+            ],
+            "links": [
+                {**self._edge_attributes(edge_id), "source": node_names[src], "target": node_names[dst]}
+                for edge_id, (src, dst) in enumerate(zip(self.src, self.dst))
+            ],
+        }
+
+    def to_networkx(self):
+        """
+        Materialize the graph as a NetworkX DiGraph.
+        Nodes are "service:operation" strings with `service` and `operation` attributes; edges
+        carry `weight` (calls), `traces`, `errors` and `mean_latency_us`.
+        """
+        graph = nx.DiGraph()
+        labels = self._node_labels()
+        node_names = self._node_names(labels)
+        for name, (service, operation) in zip(node_names, labels):
+            graph.add_node(name, service=service, operation=operation)
+        for edge_id, (src, dst) in enumerate(zip(self.src, self.dst)):
+            graph.add_edge(node_names[src], node_names[dst], **self._edge_attributes(edge_id))
+        return graph
+
+
+def setup_operation_graph_indexes():
+    """
+    Ensure the unique edge keys of the cumulative operation edges and their archive.
+    """
+    try:
+        for collection in (db_manager.get_operation_edges_collection(),
+                           db_manager.get_operation_edge_archive_collection()):
+            collection.create_index([(field, 1) for field in OPERATION_EDGE_KEY], unique=True)
+    except errors.PyMongoError as e:
+        print(f"Error setting up operation graph indexes: {e}")
+
+
+def operation_graph_from_documents(documents):
+    """
+    Count the operation graph of a batch of span store documents.
+    """
+    graph = OperationGraph()
+    for document in documents:
+        graph.add_span_document(document)
+    return graph
+
+
+def increment_operation_edges(collection, graph, batch_id=None, batch_field=ARCHIVE_BATCH_FIELD):
+    """
+    Add the counters of `graph` to the operation edges stored in `collection`.
+    With a `batch_id`, edges whose `batch_field` already holds it are skipped, as in
+    `write_edge_archive`, so a replayed batch is counted once.
+    """
+    operations = []
+    for document in graph.edge_documents():
+        key = {field: document.pop(field) for field in OPERATION_EDGE_KEY}
+        update = {"$inc": document}
+        if batch_id is not None:
+            key[batch_field] = {"$ne": batch_id}
+            update["$set"] = {batch_field: batch_id}
+        operations.append(UpdateOne(key, update, upsert=True))
+    if batch_id is not None:
+        write_batch_updates(collection, operations)
+    elif operations:
+        collection.bulk_write(operations, ordered=False)
+
+
+def write_operation_edges(graph, sync_seq=None):
+    """
+    Fold a sync batch's operation graph into the cumulative operation edges, skipping edges
+    already stamped with `sync_seq` by an earlier attempt at the same batch.
+    """
+    increment_operation_edges(db_manager.get_operation_edges_collection(), graph, sync_seq, SYNC_BATCH_FIELD)
+
+
+def write_operation_edge_archive(graph, batch_id):
+    """
+    Fold the operation graph of traces leaving the span store into the operation edge archive,
+    the starting point of the next rebuild.
+    """
+    increment_operation_edges(db_manager.get_operation_edge_archive_collection(), graph, batch_id)
+
+
+def read_operation_edges(collection):
+    """
+    Load the operation edges stored in `collection` as an OperationGraph.
+    """
+    graph = OperationGraph()
+    for document in collection.find({}, {"_id": 0, ARCHIVE_BATCH_FIELD: 0, SYNC_BATCH_FIELD: 0}):
+        graph.add_edge_document(document)
+    return graph
+
+
+def replace_operation_edges(graph):
+    """
+    Replace the cumulative operation edges with `graph`. The edges are written to a staging
+    collection that is then renamed over the live one, so readers never see a partial set.
+    """
+    collection = db_manager.get_operation_edges_collection()
+    documents = list(graph.edge_documents())
+    if not documents:
+        collection.delete_many({})
+        return
+    staging = collection.database[collection.name + STAGING_SUFFIX]
+    staging.drop()
+    staging.create_index([(field, 1) for field in OPERATION_EDGE_KEY], unique=True)
+    staging.insert_many(documents, ordered=False)
+    staging.rename(collection.name, dropTarget=True)
+
+
+def build_operation_graph(query=None, batch_size=500):
+    """
+    Build the operation graph from span store documents matching `query`.
+    Documents are read with only the compact span fields and never expanded to Jaeger traces.
+    Returns:
+        OperationGraph: The counted graph.
+    """
+    graph = OperationGraph()
+    trace_spans = db_manager.get_trace_spans_collection()
+    for document in iter_keyset(trace_spans, query, OPERATION_GRAPH_PROJECTION, batch_size=batch_size):
+        graph.add_span_document(document)
+    return graph
+
+
+def operation_graph_query(start_us=None, end_us=None):
+    """
+    Span store filter selecting the traces that started in [start_us, end_us).
+    """
+    start_time = {}
+    if start_us is not None:
+        start_time["$gte"] = start_us
+    if end_us is not None:
+        start_time["$lt"] = end_us
+    return {"start_time": start_time}
+
+
+def get_operation_graph_data(start_us=None, end_us=None):
+    """
+    Get the operation graph as node-link JSON data.
+    Without a window, the cumulative graph is read from the operation edges that graph sync
+    maintains, which keep counting traces after retention removed them from the span store.
+    With one, the span store traces that started in [start_us, end_us) are counted, so the
+    window only covers traces still retained there.
+    """
+    if start_us is None and end_us is None:
+        return read_operation_edges(db_manager.get_operation_edges_collection()).to_node_link()
+    return build_operation_graph(operation_graph_query(start_us, end_us)).to_node_link()
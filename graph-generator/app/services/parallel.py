@@ -0,0 +1,50 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from app.core.config import settings
+
+
+def iter_shards(items, shard_size):
+    """
+    Split an iterable into consecutive lists of at most `shard_size` items.
+    """
+    iterator = iter(items)
+    while True:
+        shard = list(islice(iterator, shard_size))
+        if not shard:
+            return
+        yield shard
+
+
+def map_trace_shards(traces, func, workers=None, shard_size=None):
+    """
+    Apply `func` to consecutive shards of a trace stream and yield the results in shard order.
+    With more than one worker, shards run in a process pool with at most two shards per worker
+    in flight, so the stream is consumed lazily and memory stays bounded. `func` must be a
+    picklable module-level function returning plain data.
+    Args:
+        traces: Iterable of traces.
+        func: Callable taking a list of traces.
+        workers (int): Process count; 1 runs inline. Defaults to GRAPH_BUILD_WORKERS.
+        shard_size (int): Traces per shard. Defaults to GRAPH_BUILD_SHARD_SIZE.
+    Yields:
+        The result of `func` for each shard.
+    """
+    workers = workers or settings.GRAPH_BUILD_WORKERS
+    shard_size = shard_size or settings.GRAPH_BUILD_SHARD_SIZE
+
+    if workers <= 1:
+        for shard in iter_shards(traces, shard_size):
+            yield func(shard)
+        return
+
+    # Spawned workers do not inherit the parent's database clients, threads or event loop
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        for shard in iter_shards(traces, shard_size):
+            pending.append(pool.submit(func, shard))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import os
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from pymongo import errors
+from app.core.config import settings
+from app.core.database import db_manager
+
+# Replica records stop mattering once past the timeout; the TTL index only keeps the collection small
+REPLICA_RECORD_TTL_SECONDS = 3600
+# Held by every job that writes the dependency graph (sync, rebuild and retention's archiving),
+# so replicas never write it concurrently; the graph write lock only covers one process
+GRAPH_WRITE_LEASE = "job:graph_write"
+
+
+class LeaseLostError(Exception):
+    """
+    Raised by `run_with_lease` when the lease lapsed or was taken over while its function ran.
+    """
+
+
+def ensure_lease_held(lease_held):
+    """
+    Stop a job running in a worker thread once its lease is gone (see `run_in_thread_with_lease`).
+    Jobs call this between batches, since a thread cannot be cancelled from outside.
+    Args:
+        lease_held (callable): Returns False once the lease is lost; None when not run under a lease.
+    Raises:
+        LeaseLostError: If the lease was lost.
+    """
+    if lease_held is not None and not lease_held():
+        raise LeaseLostError("Lost the lease before the job finished.")
+
+
+def default_replica_id():
+    return settings.COLLECTOR_REPLICA_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def assign_owner(name, replicas):
+    """
+    Pick the replica responsible for `name` by rendezvous (highest random weight) hashing.
+    Every replica computes the same owner from the same live set, and a replica joining or
+    leaving only moves the names it gains or held, about 1/N of them.
+    Returns:
+        str: The owning replica id, or None without replicas.
+    """
+    return max(
+        replicas,
+        key=lambda replica: hashlib.blake2b(f"{replica}\0{name}".encode(), digest_size=8).digest(),
+        default=None,
+    )
+
+
+def setup_coordination_indexes():
+    """
+    Ensure the TTL index that removes long-dead replica records.
+    """
+    try:
+        db_manager.get_collector_replicas_collection().create_index(
+            "heartbeat_at", expireAfterSeconds=REPLICA_RECORD_TTL_SECONDS
+        )
+    except errors.PyMongoError as e:
+        print(f"Error setting up coordination indexes: {e}")
+
+
+class ReplicaCoordinator:
+    """
+    Splits collection work between replicas of the service through MongoDB.
+    Each replica heartbeats into `collector_replicas`. Replicas seen within
+    COLLECTOR_REPLICA_TIMEOUT_SECONDS form the live set, and each service belongs to one of them
+    by `assign_owner`; when a replica stops heartbeating, the others take over its services.
+    Replicas can briefly disagree about the live set, so the work itself runs under a lease in
+    `collection_leases`: a replica only sweeps a service (or runs a singleton job) while it holds
+    the lease, and a crashed holder's lease lapses after COLLECTOR_LEASE_SECONDS.
+    Lease expiry compares replica clocks, which must agree to well within the lease duration.
+    """
+
+    def __init__(self, replica_id=None):
+        self.replica_id = replica_id or default_replica_id()
+        self.replicas = [self.replica_id]
+        self.last_heartbeat = None
+        self._leases = set()
+        self._local_locks = {}
+        self._acquired = 0
+        self._contended = 0
+        self._lost = 0
+
+    async def heartbeat(self):
+        """
+        Record this replica as alive and refresh the live replica set.
+        Returns:
+            list: Live replica ids, sorted. On a MongoDB error the previous set is kept.
+        """
+        now = datetime.now(timezone.utc)
+        replicas = db_manager.get_async_collector_replicas_collection()
+        try:
+            await replicas.update_one(
+                {"_id": self.replica_id},
+                {"$set": {"heartbeat_at": now}, "$setOnInsert": {"started_at": now}},
+                upsert=True,
+            )
+            cutoff = now - timedelta(seconds=settings.COLLECTOR_REPLICA_TIMEOUT_SECONDS)
+            live = [doc["_id"] async for doc in replicas.find({"heartbeat_at": {"$gte": cutoff}}, {"_id": 1})]
+        except errors.PyMongoError as e:
+            print(f"Error sending replica heartbeat: {e}")
+            return self.replicas
+
+        if sorted(set(live) | {self.replica_id}) != self.replicas:
+            self.replicas = sorted(set(live) | {self.replica_id})
+            print(f"Live collector replicas: {self.replicas}")
+        self.last_heartbeat = now
+        return self.replicas
+
+    def owns(self, name):
+        """
+        Check whether this replica is responsible for `name` under the current live set.
+        """
+        return assign_owner(name, self.replicas) == self.replica_id
+
+    async def acquire(self, name):
+        """
+        Take or renew the lease on `name`, if it is free, lapsed or already ours.
+        Returns:
+            bool: True if this replica now holds the lease.
+        """
+        now = datetime.now(timezone.utc)
+        leases = db_manager.get_async_collection_leases_collection()
+        try:
+            await leases.update_one(
+                {"_id": name, "$or": [{"owner": self.replica_id}, {"expires_at": {"$lte": now}}]},
+                {"$set": {
+                    "owner": self.replica_id,
+                    "expires_at": now + timedelta(seconds=settings.COLLECTOR_LEASE_SECONDS),
+                    "renewed_at": now,
+                }},
+                upsert=True,
+            )
+        except errors.DuplicateKeyError:
+            # No match means another replica holds a live lease; the upsert then collides on _id
+            self._contended += 1
+            return False
+        if name not in self._leases:
+            self._leases.add(name)
+            self._acquired += 1
+        return True
+
+    async def release(self, name):
+        """
+        Give up the lease on `name` so another replica can take it without waiting for expiry.
+        """
+        self._leases.discard(name)
+        try:
+            await db_manager.get_async_collection_leases_collection().delete_one(
+                {"_id": name, "owner": self.replica_id}
+            )
+        except errors.PyMongoError as e:
+            print(f"Error releasing lease {name}: {e}")
+
+    async def _keep_renewed(self, name, on_lost):
+        """
+        Renew the lease on `name` until cancelled. A renewal failing on a MongoDB error is
+        retried while the lease is still ours; once it is lost, or would lapse before the next
+        attempt, `on_lost()` is called.
+        """
+        loop = asyncio.get_running_loop()
+        interval = settings.COLLECTOR_LEASE_SECONDS / 3
+        # Measured before each renewal request, so the local deadline is never later than the stored one
+        expires = loop.time() + settings.COLLECTOR_LEASE_SECONDS
+        while True:
+            await asyncio.sleep(interval)
+            attempted = loop.time()
+            try:
+                if await self.acquire(name):
+                    expires = attempted + settings.COLLECTOR_LEASE_SECONDS
+                    continue
+                print(f"Lost the lease on {name} while holding it.")
+            except errors.PyMongoError as e:
+                if loop.time() + interval < expires:
+                    print(f"Error renewing lease {name}, retrying: {e}")
+                    continue
+                print(f"Could not renew the lease on {name} before it lapsed: {e}")
+            self._leases.discard(name)
+            self._lost += 1
+            on_lost()
+            return
+
+    async def run_with_lease(self, name, func):
+        """
+        Run `func()` (a coroutine function) while holding the lease on `name`, renewing it in
+        the background so long runs keep it, and release it afterwards.
+        Runs in this process under the same name wait for each other, since they share the lease.
+        If the lease is lost meanwhile, the task running `func` is cancelled. Blocking jobs,
+        which cannot be cancelled, run with `run_in_thread_with_lease` instead.
+        Returns:
+            tuple: (ran, result); ran is False, and func not called, if another replica holds the lease.
+        Raises:
+            LeaseLostError: If the lease was lost before `func` finished.
+        """
+        async with self._local_locks.setdefault(name, asyncio.Lock()):
+            try:
+                if not await self.acquire(name):
+                    return False, None
+            except errors.PyMongoError as e:
+                print(f"Error acquiring lease {name}: {e}")
+                return False, None
+
+            task = asyncio.ensure_future(func())
+            renewer = asyncio.create_task(self._keep_renewed(name, task.cancel))
+            try:
+                return True, await task
+            except asyncio.CancelledError:
+                if renewer.done() and task.cancelled():
+                    raise LeaseLostError(f"Lost the lease on {name} before the job finished.") from None
+                raise
+            finally:
+                renewer.cancel()
+                task.cancel()
+                await asyncio.gather(renewer, task, return_exceptions=True)
+                await self.release(name)
+
+    async def run_in_thread_with_lease(self, name, func, *args, **kwargs):
+        """
+        Run the blocking `func(*args, lease_held=..., **kwargs)` in a worker thread while holding
+        the lease on `name`, like `run_with_lease`. A thread cannot be cancelled, so `func` gets
+        `lease_held`, a callable that turns False once the lease is lost or the caller is
+        cancelled, and checks it between batches with `ensure_lease_held`. The lease is renewed
+        until the thread has returned and only released then, so no other replica takes over
+        while it may still be writing.
+        Returns:
+            tuple: (ran, result); ran is False, and func not called, if another replica holds the lease.
+        Raises:
+            LeaseLostError: If `func` stopped because the lease was lost.
+        """
+        async with self._local_locks.setdefault(name, asyncio.Lock()):
+            try:
+                if not await self.acquire(name):
+                    return False, None
+            except errors.PyMongoError as e:
+                print(f"Error acquiring lease {name}: {e}")
+                return False, None
+
+            stop = threading.Event()
+            worker = asyncio.ensure_future(
+                asyncio.to_thread(func, *args, lease_held=lambda: not stop.is_set(), **kwargs)
+            )
+            renewer = asyncio.create_task(self._keep_renewed(name, stop.set))
+            try:
+                return True, await asyncio.shield(worker)
+            finally:
+                stop.set()
+                await asyncio.wait([worker])
+                if not worker.cancelled():
+                    worker.exception()  # Already raised above, unless the caller was cancelled
+                renewer.cancel()
+                await asyncio.gather(renewer, return_exceptions=True)
+                await self.release(name)
+
+    async def leave(self):
+        """
+        Withdraw this replica on shutdown: drop its heartbeat record and leases, so the
+        others take over its services at their next heartbeat instead of after the timeout.
+        """
+        try:
+            await db_manager.get_async_collector_replicas_collection().delete_one({"_id": self.replica_id})
+            await db_manager.get_async_collection_leases_collection().delete_many({"owner": self.replica_id})
+        except errors.PyMongoError as e:
+            print(f"Error withdrawing replica {self.replica_id}: {e}")
+        self._leases.clear()
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: This replica's id, the live replicas, leases currently held, and how often a
+            lease was acquired, found held by another replica, or lost while held.
+        """
+        return {
+            "replica_id": self.replica_id,
+            "replicas": list(self.replicas),
+            "last_heartbeat": self.last_heartbeat.isoformat() if self.last_heartbeat else None,
+            "leases_held": sorted(self._leases),
+            "leases_acquired": self._acquired,
+            "leases_contended": self._contended,
+            "leases_lost": self._lost,
+        }
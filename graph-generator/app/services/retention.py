@@ -0,0 +1,196 @@
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import errors
+from app.core.config import settings
+from app.core.database import db_manager
+from app.services.graph_updater import (
+    ARCHIVE_BATCH_FIELD,
+    archive_span_batch,
+    finish_pending_archive_batches,
+    get_archive_horizon_us,
+    get_last_synced_seq,
+    graph_write_lock
+)
+from app.services.replica_coordinator import ensure_lease_held
+from app.services.rollups import prune_hourly_rollups
+
+# TTL indexes delete a document once its `expire_at` has passed; the retention job sets it
+EXPIRE_AT_FIELD = "expire_at"
+STORAGE_COLLECTIONS = {
+    "raw_traces": "get_trace_collection",
+    "span_store": "get_trace_spans_collection",
+    "edge_rollups": "get_edge_rollups_collection",
+    "edge_archive": "get_edge_archive_collection",
+    "trace_updates": "get_trace_updates_collection",
+}
+NEO4J_STORAGE_QUERY = """
+    MATCH (s:Service)
+    OPTIONAL MATCH (s)-[r:CALLS]->(:Service)
+    RETURN count(DISTINCT s) AS services, count(r) AS edges
+"""
+
+
+def setup_retention_indexes():
+    """
+    Ensure the TTL indexes on raw traces and the span store, the span store start time and
+    archive batch indexes used to find expiring traces, and the edge archive key.
+    """
+    try:
+        db_manager.get_trace_collection().create_index(EXPIRE_AT_FIELD, expireAfterSeconds=0)
+        trace_spans = db_manager.get_trace_spans_collection()
+        trace_spans.create_index(EXPIRE_AT_FIELD, expireAfterSeconds=0)
+        trace_spans.create_index([("start_time", 1), ("_id", 1)])  # Also windowed reads in _id order
+        trace_spans.create_index(ARCHIVE_BATCH_FIELD, sparse=True)
+        db_manager.get_edge_archive_collection().create_index([("parent", 1), ("child", 1)], unique=True)
+    except errors.PyMongoError as e:
+        print(f"Error setting up retention indexes: {e}")
+
+
+def _retention_cutoff_us(hours, now):
+    # Hour-aligned, so rollup buckets before the archive horizon are whole hours
+    return int((now.timestamp() - hours * 3600) // 3600 * 3600 * 1_000_000)
+
+
+def expire_raw_traces(now=None):
+    """
+    Schedule raw traces that started more than RAW_TRACE_RETENTION_HOURS ago for TTL deletion.
+    Graph building never reads raw traces, so they need no folding first.
+    Returns:
+        int: Number of traces scheduled.
+    """
+    if not settings.RAW_TRACE_RETENTION_HOURS:
+        return 0
+    now = now or datetime.now(timezone.utc)
+    cutoff_us = _retention_cutoff_us(settings.RAW_TRACE_RETENTION_HOURS, now)
+    result = db_manager.get_trace_collection().update_many(
+        {"start_time": {"$lt": cutoff_us}, EXPIRE_AT_FIELD: {"$exists": False}},
+        {"$set": {EXPIRE_AT_FIELD: now}},
+    )
+    return result.modified_count
+
+
+def archive_expiring_traces(batch_size=None, now=None, lease_held=None):
+    """
+    Fold span store traces that started more than SPAN_STORE_RETENTION_HOURS ago into the
+    edge archive, then schedule them for TTL deletion.
+    Only traces the incremental sync has already written to Neo4j and the rollups are
+    archived; later ones wait for the next run. Each batch is first stamped with its own id
+    and archived by that id (see `archive_span_batch`), and batches left pending by an
+    interrupted run are finished first, so no trace is archived twice. Holding the graph write
+    lock keeps a concurrent rebuild from counting a batch both from the archive and from the
+    span store.
+    Args:
+        lease_held (callable): Checked before each batch; archiving stops once it returns False.
+    Returns:
+        int: Number of traces archived.
+    Raises:
+        LeaseLostError: If the graph write lease was lost.
+    """
+    if not settings.SPAN_STORE_RETENTION_HOURS:
+        return 0
+    now = now or datetime.now(timezone.utc)
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    cutoff_us = _retention_cutoff_us(settings.SPAN_STORE_RETENTION_HOURS, now)
+    trace_spans = db_manager.get_trace_spans_collection()
+
+    with graph_write_lock:
+        archived = finish_pending_archive_batches(now)
+        query = {
+            "start_time": {"$lt": cutoff_us},
+            "ingest_seq": {"$lte": get_last_synced_seq()},
+            EXPIRE_AT_FIELD: {"$exists": False},
+            ARCHIVE_BATCH_FIELD: {"$exists": False},
+        }
+        while True:
+            ensure_lease_held(lease_held)
+            document_ids = [document["_id"] for document in trace_spans.find(query, {"_id": 1}).limit(batch_size)]
+            if not document_ids:
+                break
+            batch_id = ObjectId()
+            trace_spans.update_many({"_id": {"$in": document_ids}}, {"$set": {ARCHIVE_BATCH_FIELD: batch_id}})
+            archived += archive_span_batch(batch_id, now)
+
+        if cutoff_us > get_archive_horizon_us():
+            db_manager.get_trace_collection_updates_collection().update_one(
+                {}, {"$set": {"archive_horizon_us": cutoff_us}}, upsert=True
+            )
+    return archived
+
+
+def apply_retention(lease_held=None):
+    """
+    Retention job: expire old raw traces, archive and expire old span store traces, and
+    prune old hourly rollups.
+    Args:
+        lease_held (callable): Passed on to `archive_expiring_traces`, which writes the graph archive.
+    Returns:
+        dict: Counts per tier.
+    """
+    try:
+        result = {
+            "raw_traces_expired": expire_raw_traces(),
+            "span_store_archived": archive_expiring_traces(lease_held=lease_held),
+            "hourly_rollups_pruned": prune_hourly_rollups(),
+        }
+    except errors.PyMongoError as e:
+        print(f"Error applying retention: {e}")
+        return {}
+    if any(result.values()):
+        print(f"Retention: {result}")
+    return result
+
+
+def _collection_stats(collection):
+    try:
+        stats = collection.database.command({"collStats": collection.name})
+    except errors.PyMongoError:
+        return {"collection": collection.name, "documents": collection.estimated_document_count()}
+    return {
+        "collection": collection.name,
+        "documents": stats.get("count", 0),
+        "data_bytes": stats.get("size", 0),
+        "storage_bytes": stats.get("storageSize", 0),
+        "index_bytes": stats.get("totalIndexSize", 0),
+    }
+
+
+def get_storage_stats():
+    """
+    Report how much each storage tier holds, with the retention settings that bound it.
+    Returns:
+        dict: {"tiers": {tier: {"collection", "documents", "data_bytes", "storage_bytes", "index_bytes"}},
+               "pending_expiry": {...}, "graph": {"services", "edges"}, "retention": {...}};
+        byte sizes are omitted when the server does not report collection stats.
+    """
+    tiers = {
+        tier: _collection_stats(getattr(db_manager, getter)())
+        for tier, getter in STORAGE_COLLECTIONS.items()
+    }
+    pending_expiry = {
+        "raw_traces": db_manager.get_trace_collection().count_documents({EXPIRE_AT_FIELD: {"$exists": True}}),
+        "span_store": db_manager.get_trace_spans_collection().count_documents({EXPIRE_AT_FIELD: {"$exists": True}}),
+    }
+
+    graph = None
+    try:
+        with db_manager.neo4j_driver.session() as session:
+            record = session.run(NEO4J_STORAGE_QUERY).single()
+            graph = {"services": record["services"], "edges": record["edges"]}
+    except Exception as e:
+        print(f"Error reading Neo4j storage stats: {e}")
+
+    horizon_us = get_archive_horizon_us()
+    return {
+        "tiers": tiers,
+        "pending_expiry": pending_expiry,
+        "graph": graph,
+        "retention": {
+            "raw_trace_hours": settings.RAW_TRACE_RETENTION_HOURS,
+            "span_store_hours": settings.SPAN_STORE_RETENTION_HOURS,
+            "minute_rollup_hours": settings.ROLLUP_MINUTE_RETENTION_HOURS,
+            "hourly_rollup_days": settings.ROLLUP_HOUR_RETENTION_DAYS,
+            "archive_horizon": (
+                datetime.fromtimestamp(horizon_us / 1e6, timezone.utc).isoformat() if horizon_us else None
+            ),
+        },
+    }
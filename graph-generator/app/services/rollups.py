@@ -0,0 +1,185 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+import networkx as nx
+from pymongo import UpdateOne, errors
+from app.core.config import settings
+from app.core.database import db_manager
+from app.services.graph_processor import SYNC_BATCH_FIELD, write_batch_updates
+from app.services.replica_coordinator import ensure_lease_held
+from app.services.span_extractor import iter_span_edges, span_has_error
+
+MINUTE = "minute"
+HOUR = "hour"
+GRANULARITY_SECONDS = {MINUTE: 60, HOUR: 3600}
+
+
+def setup_rollup_indexes():
+    """
+    Ensure the edge_rollups indexes exist. The unique key leads with `bucket`,
+    so window queries are range scans on it.
+    """
+    try:
+        edge_rollups = db_manager.get_edge_rollups_collection()
+        edge_rollups.create_index(
+            [("bucket", 1), ("granularity", 1), ("parent", 1), ("child", 1)], unique=True
+        )
+        edge_rollups.create_index([("granularity", 1), ("bucket", 1)])
+    except errors.PyMongoError as e:
+        print(f"Error setting up rollup indexes: {e}")
+
+
+def new_rollup_counters():
+    """
+    Create empty rollup counters: {(bucket_seconds, parent, child): [calls, errors]}.
+    """
+    return defaultdict(lambda: [0, 0])
+
+
+def collect_edge_rollups(traces):
+    """
+    Count calls and errors per service edge in 1-minute buckets of span start time.
+    Returns:
+        dict: {(bucket_seconds, parent, child): [calls, errors]}
+    """
+    counters = new_rollup_counters()
+    for trace in traces:
+        add_trace_to_rollups(trace, counters)
+    return counters
+
+
+def add_trace_to_rollups(trace, counters):
+    """
+    Add one trace's service edges to counters created by `new_rollup_counters`.
+    """
+    for parent_service, child_service, span in iter_span_edges(trace):
+        if child_service is None or parent_service == child_service or "startTime" not in span:
+            continue
+        bucket = int(span["startTime"] // 1_000_000) // 60 * 60
+        counts = counters[(bucket, parent_service, child_service)]
+        counts[0] += 1
+        if span_has_error(span):
+            counts[1] += 1
+
+
+def merge_rollup_counters(merged, partial):
+    """
+    Add partial rollup counters (e.g. from a rebuild worker) into `merged`.
+    """
+    for key, (calls, error_count) in partial.items():
+        counts = merged[key]
+        counts[0] += calls
+        counts[1] += error_count
+    return merged
+
+
+def write_edge_rollups(counters, granularity=MINUTE, sync_seq=None):
+    """
+    Add rollup counters to the edge_rollups collection with one unordered bulk upsert.
+    With a `sync_seq`, buckets already stamped with that sync batch are skipped, so a batch
+    replayed after a failed sync is added once.
+    """
+    if not counters:
+        return
+    operations = []
+    for (bucket, parent, child), (calls, error_count) in counters.items():
+        key = {"bucket": bucket, "granularity": granularity, "parent": parent, "child": child}
+        update = {"$inc": {"calls": calls, "errors": error_count}}
+        if sync_seq is not None:
+            key[SYNC_BATCH_FIELD] = {"$ne": sync_seq}
+            update["$set"] = {SYNC_BATCH_FIELD: sync_seq}
+        operations.append(UpdateOne(key, update, upsert=True))
+    if sync_seq is not None:
+        write_batch_updates(db_manager.get_edge_rollups_collection(), operations)
+    else:
+        db_manager.get_edge_rollups_collection().bulk_write(operations, ordered=False)
+
+
+def clear_edge_rollups(since_s=None):
+    """
+    Delete rollup buckets ahead of a full rebuild: all of them, or only those starting at or
+    after `since_s` when older buckets cover traces that are no longer stored.
+    """
+    query = {} if not since_s else {"bucket": {"$gte": since_s}}
+    db_manager.get_edge_rollups_collection().delete_many(query)
+
+
+def prune_hourly_rollups(older_than_days=None):
+    """
+    Delete hourly rollup buckets older than `older_than_days` (ROLLUP_HOUR_RETENTION_DAYS; 0 keeps them).
+    Returns:
+        int: Number of buckets deleted.
+    """
+    older_than_days = older_than_days if older_than_days is not None else settings.ROLLUP_HOUR_RETENTION_DAYS
+    if not older_than_days:
+        return 0
+    cutoff = int(datetime.now(timezone.utc).timestamp() - older_than_days * 86400)
+    result = db_manager.get_edge_rollups_collection().delete_many({"granularity": HOUR, "bucket": {"$lt": cutoff}})
+    return result.deleted_count
+
+
+def compact_edge_rollups(older_than_hours=None, lease_held=None):
+    """
+    Fold 1-minute buckets older than `older_than_hours` into hourly buckets.
+    Each hour is folded and then deleted by the exact minute documents that were read,
+    so buckets written concurrently by a late sync are kept for the next run.
+    Args:
+        lease_held (callable): Checked before each hour; compaction stops once it returns False.
+    Returns:
+        int: Number of minute buckets compacted.
+    Raises:
+        LeaseLostError: If the compaction lease was lost.
+    """
+    older_than_hours = older_than_hours if older_than_hours is not None else settings.ROLLUP_MINUTE_RETENTION_HOURS
+    edge_rollups = db_manager.get_edge_rollups_collection()
+    now_s = int(datetime.now(timezone.utc).timestamp())
+    cutoff = (now_s - older_than_hours * 3600) // 3600 * 3600
+
+    compacted = 0
+    minute_buckets = edge_rollups.distinct("bucket", {"granularity": MINUTE, "bucket": {"$lt": cutoff}})
+    for hour in sorted({bucket // 3600 * 3600 for bucket in minute_buckets}):
+        ensure_lease_held(lease_held)
+        minutes = list(edge_rollups.find(
+            {"granularity": MINUTE, "bucket": {"$gte": hour, "$lt": hour + 3600}},
+            {"parent": 1, "child": 1, "calls": 1, "errors": 1},
+        ))
+        hourly = new_rollup_counters()
+        for doc in minutes:
+            counts = hourly[(hour, doc["parent"], doc["child"])]
+            counts[0] += doc.get("calls", 0)
+            counts[1] += doc.get("errors", 0)
+
+        write_edge_rollups(hourly, granularity=HOUR)
+        edge_rollups.delete_many({"_id": {"$in": [doc["_id"] for doc in minutes]}})
+        compacted += len(minutes)
+
+    if compacted:
+        print(f"Compacted {compacted} minute rollup buckets into hourly buckets.")
+    return compacted
+
+
+async def build_windowed_graph(start_s, end_s):
+    """
+    Build a dependency graph for [start_s, end_s) by summing pre-aggregated buckets.
+    Minute buckets are included when they start in the window; hourly (compacted)
+    buckets are included when they overlap it, so older windows have hour resolution.
+    Returns:
+        nx.DiGraph: Edges with `weight` (calls) and `errors` attributes.
+    """
+    edge_rollups = db_manager.get_async_edge_rollups_collection()
+    pipeline = [
+        {"$match": {"$or": [
+            {"granularity": MINUTE, "bucket": {"$gte": start_s, "$lt": end_s}},
+            {"granularity": HOUR, "bucket": {"$gt": start_s - 3600, "$lt": end_s}},
+        ]}},
+        {"$group": {
+            "_id": {"parent": "$parent", "child": "$child"},
+            "calls": {"$sum": "$calls"},
+            "errors": {"$sum": "$errors"},
+        }},
+        {"$sort": {"_id.parent": 1, "_id.child": 1}},
+    ]
+
+    graph = nx.DiGraph()
+    async for row in await edge_rollups.aggregate(pipeline):
+        graph.add_edge(row["_id"]["parent"], row["_id"]["child"], weight=row["calls"], errors=row["errors"])
+    return graph
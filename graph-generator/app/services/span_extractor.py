@@ -0,0 +1,133 @@
+def get_process_services(trace):
+    """
+    Map a trace's process IDs to service names.
+    """
+    return {pid: details["serviceName"] for pid, details in trace.get("processes", {}).items()}
+
+
+def get_parent_span_id(span):
+    """
+    Return the spanID of the span's CHILD_OF parent, or None for root/FOLLOWS_FROM-only spans.
+    """
+    for ref in span.get("references", []):
+        if ref["refType"] == "CHILD_OF":
+            return ref["spanID"]
+    return None
+
+
+def iter_span_edges(trace):
+    """
+    Yield a (parent_service, child_service, span) edge for every span whose CHILD_OF parent
+    is present in the trace and belongs to a known process.
+    The spanID index is built once, so a trace is processed in O(spans) instead of
+    searching the span list for every parent.
+    Args:
+        trace (dict): A Jaeger trace document with "processes" and "spans".
+    Yields:
+        tuple: (parent_service, child_service, span). child_service is None when the
+        child span's process is unknown.
+    """
+    process_to_service = get_process_services(trace)
+    spans = trace.get("spans", [])
+
+    span_index = {}
+    for span in spans:
+        span_index.setdefault(span["spanID"], span)  # First occurrence wins, as with a linear search
+
+    for span in spans:
+        parent_span_id = get_parent_span_id(span)
+        if not parent_span_id:
+            continue
+
+        parent_span = span_index.get(parent_span_id)
+        if parent_span is None:
+            continue
+
+        parent_service = process_to_service.get(parent_span.get("processID"))
+        if parent_service is None:
+            continue
+
+        yield parent_service, process_to_service.get(span.get("processID")), span
+
+
+def get_longest_call_chain(trace):
+    """
+    Return the services along the deepest synchronous (CHILD_OF) call chain of a trace.
+    Consecutive spans of the same service are collapsed, so the chain length counts
+    service-to-service hops. Each span is resolved once, so this is O(spans).
+    Returns:
+        list: Service names from the root caller to the deepest callee.
+    """
+    process_to_service = get_process_services(trace)
+    span_index = {}
+    for span in trace.get("spans", []):
+        span_index.setdefault(span["spanID"], span)
+
+    def service_of(span_id):
+        return process_to_service.get(span_index[span_id].get("processID"))
+
+    hops = {}
+    for span_id in span_index:
+        # Walk up to the first resolved ancestor (or the root), then resolve downwards
+        path, on_path, current = [], set(), span_id
+        while current in span_index and current not in hops and current not in on_path:
+            path.append(current)
+            on_path.add(current)
+            current = get_parent_span_id(span_index[current])
+
+        base_hops = hops.get(current)
+        base_service = service_of(current) if base_hops is not None else None
+        for pending in reversed(path):
+            service = service_of(pending)
+            base_hops = 0 if base_hops is None else base_hops + (service != base_service)
+            base_service = service
+            hops[pending] = base_hops
+
+    if not hops:
+        return []
+
+    chain, seen, current = [], set(), max(hops, key=hops.get)
+    while current in span_index and current not in seen:
+        seen.add(current)
+        service = service_of(current)
+        if service is not None and (not chain or chain[-1] != service):
+            chain.append(service)
+        current = get_parent_span_id(span_index[current])
+    return chain[::-1]
+
+
+def span_has_error(span):
+    """
+    Check whether a span carries the OpenTracing `error=true` tag.
+    """
+    return any(
+        tag.get("key") == "error" and tag.get("value") in (True, "true")
+        for tag in span.get("tags", [])
+    )
+
+
+def get_trace_start_time(trace):
+    """
+    Return the earliest span startTime (microseconds) of a trace, or None if it has no spans.
+    """
+    start_times = [span["startTime"] for span in trace.get("spans", []) if "startTime" in span]
+    return min(start_times) if start_times else None
+
+
+def derive_trace_fields(trace):
+    """
+    Compute the compact, indexable fields stored alongside a trace at ingest, so lookups
+    by service or time never re-parse spans.
+    Returns:
+        dict: {"service_edges": [{"parent": str, "child": str | None}, ...], "services": [str, ...],
+               "start_time": int | None}
+    """
+    edges = {(parent, child) for parent, child, _ in iter_span_edges(trace)}
+    return {
+        "service_edges": [
+            {"parent": parent, "child": child}
+            for parent, child in sorted(edges, key=lambda edge: (edge[0], edge[1] or ""))
+        ],
+        "services": sorted(set(get_process_services(trace).values())),
+        "start_time": get_trace_start_time(trace),
+    }
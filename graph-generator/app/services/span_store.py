@@ -0,0 +1,270 @@
+import threading
+from pymongo import ReturnDocument, errors
+from app.core.database import db_manager
+from app.services.span_extractor import (
+    get_parent_span_id,
+    get_process_services,
+    get_trace_start_time,
+    iter_span_edges,
+    span_has_error,
+)
+from app.utils.pagination import iter_keyset
+
+SERVICE_ID_COUNTER = "service_id"
+# Ingest sequence number of span documents projected from traces stored before the span store
+# existed: a full rebuild includes them, incremental sync never does
+BACKFILLED_INGEST_SEQ = 0
+
+# Service ids never change once assigned, so both directions are cached for the process lifetime
+_service_ids = {}
+_service_names = {}
+_registry_lock = threading.Lock()
+
+
+def setup_span_store_indexes():
+    """
+    Ensure the trace_spans and service_registry indexes exist.
+    """
+    try:
+        trace_spans = db_manager.get_trace_spans_collection()
+        trace_spans.create_index("traceID", unique=True)
+        trace_spans.create_index("ingest_seq")  # Incremental graph sync checkpoint
+        trace_spans.create_index("parents")  # Multikey: parent-service lookups
+        # Multikey: the trace API's service filter, in its _id page order
+        trace_spans.create_index([("spans.v", 1), ("_id", 1)])
+        service_registry = db_manager.get_service_registry_collection()
+        service_registry.create_index("name", unique=True)
+        service_registry.create_index("id", unique=True)
+    except errors.PyMongoError as e:
+        print(f"Error setting up span store indexes: {e}")
+
+
+def _remember_service(name, service_id):
+    with _registry_lock:
+        _service_ids[name] = service_id
+        _service_names[service_id] = name
+
+
+async def intern_services_async(names):
+    """
+    Map service names to their small integer ids, registering unknown names.
+    Concurrent registrations of the same name converge on whichever id was stored first.
+    Returns:
+        dict: {service name: id}
+    """
+    counters = db_manager.get_async_counters_collection()
+    service_registry = db_manager.get_async_service_registry_collection()
+    for name in set(names) - _service_ids.keys():
+        counter = await counters.find_one_and_update(
+            {"_id": SERVICE_ID_COUNTER}, {"$inc": {"value": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        entry = await service_registry.find_one_and_update(
+            {"name": name}, {"$setOnInsert": {"id": counter["value"]}}, upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        _remember_service(name, entry["id"])
+    return {name: _service_ids[name] for name in names}
+
+
+def intern_services(names):
+    """
+    Synchronous `intern_services_async`, for scripts and worker threads.
+    """
+    counters = db_manager.get_counters_collection()
+    service_registry = db_manager.get_service_registry_collection()
+    for name in set(names) - _service_ids.keys():
+        counter = counters.find_one_and_update(
+            {"_id": SERVICE_ID_COUNTER}, {"$inc": {"value": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        entry = service_registry.find_one_and_update(
+            {"name": name}, {"$setOnInsert": {"id": counter["value"]}}, upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        _remember_service(name, entry["id"])
+    return {name: _service_ids[name] for name in names}
+
+
+def get_service_names(service_ids):
+    """
+    Resolve service ids to names, loading ids registered by other processes on demand.
+    Returns:
+        dict: {id: service name}
+    """
+    missing = set(service_ids) - _service_names.keys()
+    if missing:
+        service_registry = db_manager.get_service_registry_collection()
+        for entry in service_registry.find({"id": {"$in": list(missing)}}):
+            _remember_service(entry["name"], entry["id"])
+    return {service_id: _service_names[service_id] for service_id in service_ids if service_id in _service_names}
+
+
+async def get_service_names_async(service_ids):
+    """
+    Async `get_service_names`.
+    """
+    missing = set(service_ids) - _service_names.keys()
+    if missing:
+        service_registry = db_manager.get_async_service_registry_collection()
+        async for entry in service_registry.find({"id": {"$in": list(missing)}}):
+            _remember_service(entry["name"], entry["id"])
+    return {service_id: _service_names[service_id] for service_id in service_ids if service_id in _service_names}
+
+
+async def get_service_id_async(name):
+    """
+    Look up a service's id without registering it. Returns None for unknown services.
+    """
+    if name not in _service_ids:
+        service_registry = db_manager.get_async_service_registry_collection()
+        entry = await service_registry.find_one({"name": name})
+        if entry is None:
+            return None
+        _remember_service(name, entry["id"])
+    return _service_ids[name]
+
+
+def _pack_span_id(span_id):
+    """
+    Store 16-digit lowercase hex span IDs (the Jaeger format) as signed 64-bit integers;
+    anything else is kept as-is so it round-trips exactly.
+    """
+    if isinstance(span_id, str) and len(span_id) == 16:
+        try:
+            value = int(span_id, 16)
+        except ValueError:
+            return span_id
+        if f"{value:016x}" == span_id:
+            return value - (1 << 64) if value >= 1 << 63 else value
+    return span_id
+
+
+def _unpack_span_id(packed):
+    return f"{packed & 0xFFFFFFFFFFFFFFFF:016x}" if isinstance(packed, int) else packed
+
+
+def project_trace_spans(trace, service_ids):
+    """
+    Project a Jaeger trace onto the compact span store representation: only what graph
+    building needs, with one-letter span fields and services as interned ids.
+    Span order is kept, so building from the projection matches building from the raw trace.
+    Args:
+        trace (dict): Jaeger trace.
+        service_ids (dict): {service name: id} covering the trace's services.
+    Returns:
+        dict: {"start_time", "parents": [service id, ...], "ops": [operation name, ...],
+               "spans": [{"i", "p", "v", "o", "s", "d", "e"}, ...]}
+        where i=spanID, p=CHILD_OF parent spanID (64-bit integers for hex IDs), v=service id,
+        o=index into "ops", s=startTime offset from "start_time", d=duration, e=error;
+        absent fields are omitted.
+    """
+    process_to_service = get_process_services(trace)
+    start_time = get_trace_start_time(trace)
+    operations = {}
+    spans = []
+    for span in trace.get("spans", []):
+        compact = {"i": _pack_span_id(span["spanID"])}
+        parent_span_id = get_parent_span_id(span)
+        if parent_span_id:
+            compact["p"] = _pack_span_id(parent_span_id)
+        service = process_to_service.get(span.get("processID"))
+        if service is not None:
+            compact["v"] = service_ids[service]
+        if "operationName" in span:
+            compact["o"] = operations.setdefault(span["operationName"], len(operations))
+        if "startTime" in span:
+            compact["s"] = span["startTime"] - start_time
+        if "duration" in span:
+            compact["d"] = span["duration"]
+        if span_has_error(span):
+            compact["e"] = True
+        spans.append(compact)
+
+    parents = sorted({service_ids[parent] for parent, _, _ in iter_span_edges(trace)})
+    return {"start_time": start_time, "parents": parents, "ops": list(operations), "spans": spans}
+
+
+def expand_trace_spans(document, service_names):
+    """
+    Rebuild a minimal Jaeger-shaped trace from a span store document, so graph building,
+    rollups and anti-pattern detection consume it unchanged.
+    Args:
+        document (dict): trace_spans document.
+        service_names (dict): {id: service name} covering the document's services.
+    Returns:
+        dict: Trace with traceID, processes, spans and the ingest stamp fields.
+    """
+    operations = document.get("ops", [])
+    start_time = document.get("start_time")
+    processes = {}
+    spans = []
+    for compact in document.get("spans", []):
+        span = {"spanID": _unpack_span_id(compact["i"])}
+        if "v" in compact:
+            process_id = str(compact["v"])
+            processes.setdefault(process_id, {"serviceName": service_names[compact["v"]]})
+            span["processID"] = process_id
+        if "p" in compact:
+            span["references"] = [{"refType": "CHILD_OF", "spanID": _unpack_span_id(compact["p"])}]
+        if "o" in compact:
+            span["operationName"] = operations[compact["o"]]
+        if "s" in compact:
+            span["startTime"] = start_time + compact["s"]
+        if "d" in compact:
+            span["duration"] = compact["d"]
+        if compact.get("e"):
+            span["tags"] = [{"key": "error", "value": True}]
+        spans.append(span)
+
+    trace = {"traceID": document["traceID"], "processes": processes, "spans": spans}
+    for field in ("ingest_seq", "ingested_at_us", "start_time"):
+        if field in document:
+            trace[field] = document[field]
+    return trace
+
+
+def _document_service_ids(documents):
+    return {compact["v"] for document in documents for compact in document.get("spans", []) if "v" in compact}
+
+
+def expand_span_documents(documents):
+    """
+    Expand a batch of span store documents, resolving their service ids in one lookup.
+    """
+    service_names = get_service_names(_document_service_ids(documents))
+    return [expand_trace_spans(document, service_names) for document in documents]
+
+
+async def expand_span_documents_async(documents):
+    """
+    Async `expand_span_documents`.
+    """
+    service_names = await get_service_names_async(_document_service_ids(documents))
+    return [expand_trace_spans(document, service_names) for document in documents]
+
+
+def iter_span_document_batches(query=None, batch_size=500):
+    """
+    Lazily read span store documents in `_id` order, in batches of `batch_size`.
+    Yields:
+        list: Documents without `_id` and `parents`.
+    """
+    trace_spans = db_manager.get_trace_spans_collection()
+    batch = []
+    for document in iter_keyset(trace_spans, query, {"parents": 0}, batch_size=batch_size):
+        document.pop("_id")
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_span_store(query=None, batch_size=500):
+    """
+    Lazily iterate span store documents in `_id` order, expanded to Jaeger-shaped traces.
+    Yields:
+        dict: Expanded traces.
+    """
+    for batch in iter_span_document_batches(query, batch_size):
+        yield from expand_span_documents(batch)
@@ -0,0 +1,118 @@
+import sys
+import threading
+from collections import OrderedDict
+from app.core.config import settings
+from app.core.metrics import TRACE_FILTER_LOOKUPS_TOTAL
+
+# Approximate per-entry cost beyond the traceID string itself: the OrderedDict hash slot
+# and linked-list node plus the span count
+ENTRY_OVERHEAD_BYTES = 112
+
+
+def _span_count(trace):
+    return len(trace.get("spans", []))
+
+
+class RecentTraceFilter:
+    """
+    Bounded LRU of recently stored traceIDs and their span counts.
+    Overlapping fetch windows, in-progress traces and traces shared by several services make
+    Jaeger return many traces that were just stored; those are dropped here instead of costing
+    an upsert each. A trace seen again with more spans than stored has grown and passes through,
+    so the stored documents are updated; the graph is not (see `store_traces`).
+    The filter is process-local and only an optimisation: the unique traceID index stays the
+    source of truth, so evicted or never-seen traces are simply upserted as before.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._grown = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def filter_new(self, traces):
+        """
+        Split a {traceID: trace} batch into traces that need writing and the count of
+        unchanged duplicates that were dropped.
+        Returns:
+            tuple: ({traceID: trace} to write, dropped count)
+        """
+        if not self.enabled:
+            return traces, 0
+
+        pending = {}
+        grown = 0
+        with self._lock:
+            for trace_id, trace in traces.items():
+                stored_spans = self._entries.get(trace_id)
+                if stored_spans is None:
+                    pending[trace_id] = trace
+                elif _span_count(trace) > stored_spans:
+                    grown += 1
+                    pending[trace_id] = trace
+                else:
+                    self._entries.move_to_end(trace_id)
+            dropped = len(traces) - len(pending)
+            self._hits += dropped
+            self._grown += grown
+            self._misses += len(pending) - grown
+        TRACE_FILTER_LOOKUPS_TOTAL.labels("hit").inc(dropped)
+        TRACE_FILTER_LOOKUPS_TOTAL.labels("grown").inc(grown)
+        TRACE_FILTER_LOOKUPS_TOTAL.labels("miss").inc(len(pending) - grown)
+        return pending, dropped
+
+    def remember(self, traces):
+        """
+        Record traces that were written, evicting the least recently seen entries past the byte budget.
+        Args:
+            traces (iterable): (traceID, trace) pairs.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            for trace_id, trace in traces:
+                if trace_id in self._entries:
+                    self._entries.move_to_end(trace_id)
+                else:
+                    self._bytes += sys.getsizeof(trace_id) + ENTRY_OVERHEAD_BYTES
+                self._entries[trace_id] = _span_count(trace)
+            while self._bytes > self.max_bytes and self._entries:
+                trace_id, _ = self._entries.popitem(last=False)
+                self._bytes -= sys.getsizeof(trace_id) + ENTRY_OVERHEAD_BYTES
+                self._evictions += 1
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Entry count, estimated bytes and ceiling, hits, misses, grown traces, evictions
+            and the hit rate over all lookups.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses + self._grown
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "grown": self._grown,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else None,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+recent_traces = RecentTraceFilter(int(settings.TRACE_FILTER_MAX_MB * 1024 * 1024))
@@ -0,0 +1,170 @@
+import random
+
+import networkx as nx
+
+from app.services import anti_patterns
+from app.services.anti_patterns import (
+    CHATTY_SERVICES,
+    CYCLIC_DEPENDENCY,
+    HUB_SERVICE,
+    LONG_CALL_CHAIN,
+    AntiPatternDetector,
+)
+from app.services.span_extractor import get_longest_call_chain
+
+
+def _delta(*edges):
+    graph = nx.DiGraph()
+    for parent, child, weight, traces in edges:
+        graph.add_edge(parent, child, weight=weight, traces=traces)
+    return graph
+
+
+def _detector():
+    detector = AntiPatternDetector(chatty_calls_per_trace=5, hub_fan_in=3, hub_fan_out=3, chain_hops=2)
+    detector.load(nx.DiGraph())
+    return detector
+
+
+def test_incremental_sync_detects_cycle_when_it_closes():
+    detector = _detector()
+    detector.apply(_delta(("a", "b", 1, 1), ("b", "c", 1, 1), ("x", "a", 1, 1)))
+    assert detector.get_findings(CYCLIC_DEPENDENCY) == []
+
+    detector.apply(_delta(("c", "a", 1, 1)))
+    cycles = detector.get_findings(CYCLIC_DEPENDENCY)
+    assert [finding["services"] for finding in cycles] == [["a", "b", "c"]]
+
+    detector.apply(_delta(("c", "x", 1, 1)))
+    cycles = detector.get_findings(CYCLIC_DEPENDENCY)
+    assert [finding["services"] for finding in cycles] == [["a", "b", "c", "x"]]
+
+
+def test_incremental_matches_full_evaluation():
+    edges = [("a", "b", 20, 2), ("b", "a", 1, 1), ("hub", "a", 1, 1), ("hub", "b", 1, 1), ("hub", "c", 1, 1)]
+    incremental = _detector()
+    for edge in edges:
+        incremental.apply(_delta(edge))
+
+    full = AntiPatternDetector(chatty_calls_per_trace=5, hub_fan_in=3, hub_fan_out=3, chain_hops=2)
+    full.load(_delta(*edges))
+
+    def summary(detector):
+        return [(finding["type"], finding["services"]) for finding in detector.get_findings()]
+
+    assert summary(incremental) == summary(full)
+    assert (CHATTY_SERVICES, ["a", "b"]) in summary(full)
+    assert (HUB_SERVICE, ["hub"]) in summary(full)
+
+
+def test_incremental_components_and_order_match_the_graph_on_random_edges():
+    rng = random.Random(7)
+    detector = _detector()
+    for _ in range(200):
+        detector.apply(_delta((f"s{rng.randrange(25)}", f"s{rng.randrange(25)}", 1, 1)))
+
+        components = {frozenset(component) for component in nx.strongly_connected_components(detector.graph)}
+        assert set(detector.components.values()) == components
+        assert set(detector.order) == components
+        for parent, child in detector.graph.edges:
+            parent_component, child_component = detector.components[parent], detector.components[child]
+            assert parent_component is child_component or detector.order[parent_component] < detector.order[child_component]
+
+    def cycles(found):
+        return sorted(finding["services"] for finding in found.get_findings(CYCLIC_DEPENDENCY))
+
+    full = AntiPatternDetector(chatty_calls_per_trace=5, hub_fan_in=3, hub_fan_out=3, chain_hops=2)
+    full.load(detector.graph)
+    assert cycles(detector) == cycles(full)
+
+
+def test_chatty_finding_clears_when_ratio_drops():
+    detector = _detector()
+    detector.apply(_delta(("a", "b", 12, 2)))
+    assert detector.get_findings(CHATTY_SERVICES)
+    detector.apply(_delta(("a", "b", 0, 10)))
+    assert detector.get_findings(CHATTY_SERVICES) == []
+
+
+def test_long_call_chain_from_traces():
+    trace = {
+        "processes": {f"p{i}": {"serviceName": f"s{i}"} for i in range(4)},
+        "spans": [
+            {"spanID": "3", "processID": "p3", "references": [{"refType": "CHILD_OF", "spanID": "2"}]},
+            {"spanID": "0", "processID": "p0", "references": []},
+            {"spanID": "1", "processID": "p1", "references": [{"refType": "CHILD_OF", "spanID": "0"}]},
+            {"spanID": "1b", "processID": "p1", "references": [{"refType": "CHILD_OF", "spanID": "1"}]},
+            {"spanID": "2", "processID": "p2", "references": [{"refType": "CHILD_OF", "spanID": "1b"}]},
+        ],
+    }
+    assert get_longest_call_chain(trace) == ["s0", "s1", "s2", "s3"]
+
+    detector = _detector()
+    detector.apply(nx.DiGraph(), [trace, trace])
+    chains = detector.get_findings(LONG_CALL_CHAIN)
+    assert chains[0]["metrics"] == {"hops": 3, "occurrences": 2}
+
+
+def test_apply_version_only_applies_the_next_version():
+    detector = _detector()
+    detector.version = 3
+    assert not detector.apply_version(5, _delta(("a", "b", 12, 2)))
+    assert detector.apply_version(4, _delta(("a", "b", 12, 2)))
+    assert not detector.apply_version(4, _delta(("a", "b", 12, 2)))  # Already applied
+    assert detector.version == 4
+    assert detector.graph["a"]["b"] == {"weight": 12, "traces": 2}
+
+
+class _FakeDeltas(list):
+    def find(self, query, projection=None):
+        bounds = query["_id"]
+        return _FakeDeltas(record for record in self if bounds.get("$gt", -1) < record["_id"] <= bounds["$lte"])
+
+    def sort(self, key, direction):
+        return sorted(self, key=lambda record: record[key])
+
+
+def _install(monkeypatch, version, deltas, neo4j_graph):
+    detector = AntiPatternDetector(chatty_calls_per_trace=5, hub_fan_in=3, hub_fan_out=3, chain_hops=2)
+    reads = []
+
+    def read_graph():
+        reads.append(1)
+        return neo4j_graph
+
+    monkeypatch.setattr(anti_patterns, "anti_pattern_detector", detector)
+    monkeypatch.setattr(anti_patterns.db_manager, "graph_deltas", _FakeDeltas(deltas))
+    monkeypatch.setattr(anti_patterns, "get_graph_version", lambda: version)
+    monkeypatch.setattr(anti_patterns, "get_graph_write_state", lambda: (version, False))
+    monkeypatch.setattr(anti_patterns, "read_graph_from_neo4j", read_graph)
+    return detector, reads
+
+
+def test_get_anti_patterns_catches_up_from_deltas_without_reloading(monkeypatch):
+    deltas = [
+        {"_id": 2, "edges": [["a", "b", 1, 1]], "chains": []},
+        {"_id": 3, "edges": [["b", "a", 1, 1]], "chains": [["a", "b", "c"]]},
+    ]
+    detector, reads = _install(monkeypatch, 3, deltas, None)
+    detector.load(nx.DiGraph(), version=1)
+
+    findings = anti_patterns.get_anti_patterns()
+
+    assert reads == []
+    assert detector.version == 3
+    assert [(finding["type"], finding["services"]) for finding in findings] == [
+        (CYCLIC_DEPENDENCY, ["a", "b"]), (LONG_CALL_CHAIN, ["a", "b", "c"]),
+    ]
+
+
+def test_get_anti_patterns_reloads_on_a_version_gap(monkeypatch):
+    # Version 2 was a rebuild, which records no delta
+    deltas = [{"_id": 3, "edges": [["b", "a", 1, 1]], "chains": []}]
+    detector, reads = _install(monkeypatch, 3, deltas, _delta(("a", "b", 1, 1), ("b", "a", 1, 1)))
+    detector.load(nx.DiGraph(), version=1)
+
+    anti_patterns.get_anti_patterns()
+
+    assert reads == [1]
+    assert detector.version == 3
+    assert detector.graph["b"]["a"]["weight"] == 1
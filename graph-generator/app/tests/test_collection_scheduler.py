@@ -0,0 +1,149 @@
+import asyncio
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from app.services import collection_scheduler
+from app.services.collection_scheduler import CollectionScheduler, compute_interval
+from app.services.replica_coordinator import assign_owner
+
+
+def _sweep(inserted=0, covered_seconds=60.0, lag_seconds=0.0, checkpoint_us=1):
+    return {"inserted": inserted, "skipped": 0, "requests": 1, "checkpoint_us": checkpoint_us,
+            "covered_seconds": covered_seconds, "lag_seconds": lag_seconds, "window_seconds": 60.0}
+
+
+def _configure(monkeypatch, max_in_flight=4):
+    settings = collection_scheduler.settings
+    monkeypatch.setattr(settings, "COLLECTOR_MIN_INTERVAL_SECONDS", 15)
+    monkeypatch.setattr(settings, "COLLECTOR_MAX_INTERVAL_SECONDS", 300)
+    monkeypatch.setattr(settings, "COLLECTOR_TARGET_TRACES_PER_RUN", 500)
+    monkeypatch.setattr(settings, "COLLECTOR_MAX_IN_FLIGHT", max_in_flight)
+
+
+def test_compute_interval_follows_traffic_and_lag(monkeypatch):
+    _configure(monkeypatch)
+    assert compute_interval(100.0, 0) == 15  # Busy: clamped to the minimum
+    assert compute_interval(5.0, 0) == 100
+    assert compute_interval(0.0, 0) == 300  # Idle: back off to the maximum
+    assert compute_interval(0.0, 1000) == 15  # Far behind: catch up at the minimum
+
+
+def test_run_service_backs_off_quiet_service_and_records_stats(monkeypatch):
+    _configure(monkeypatch)
+    monkeypatch.setattr(collection_scheduler, "sweep_service", lambda service: asyncio.sleep(0, _sweep(inserted=6)))
+    scheduler = CollectionScheduler(AsyncIOScheduler())
+    scheduler.add_service("quiet")
+
+    asyncio.run(scheduler.run_service("quiet"))
+
+    stats = scheduler.get_stats()["services"][0]
+    assert stats["runs"] == 1
+    assert stats["trace_rate"] == 0.1
+    assert stats["interval_seconds"] == 300
+    assert stats["last_inserted"] == 6
+    assert stats["lag_seconds"] is not None
+    job = scheduler.scheduler.get_job(CollectionScheduler.job_id("quiet"))
+    assert job.trigger.interval.total_seconds() == 300
+    assert job.max_instances == 1 and job.coalesce
+
+
+def test_failed_sweep_keeps_cadence(monkeypatch):
+    _configure(monkeypatch)
+    monkeypatch.setattr(collection_scheduler, "sweep_service",
+                        lambda service: asyncio.sleep(0, _sweep(covered_seconds=0, checkpoint_us=None)))
+    scheduler = CollectionScheduler(AsyncIOScheduler())
+    scheduler.add_service("flaky")
+
+    asyncio.run(scheduler.run_service("flaky"))
+
+    stats = scheduler.get_stats()["services"][0]
+    assert stats["failures"] == 1
+    assert stats["interval_seconds"] == 15
+
+
+def test_in_flight_cap_limits_concurrent_sweeps(monkeypatch):
+    _configure(monkeypatch, max_in_flight=2)
+    active = []
+    peak = []
+
+    async def sweep_service(service):
+        active.append(service)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.remove(service)
+        return _sweep()
+
+    monkeypatch.setattr(collection_scheduler, "sweep_service", sweep_service)
+    scheduler = CollectionScheduler(AsyncIOScheduler())
+    services = [f"service-{i}" for i in range(5)]
+    for service in services:
+        scheduler.add_service(service)
+
+    async def run():
+        await asyncio.gather(*(scheduler.run_service(service) for service in services))
+
+    asyncio.run(run())
+    assert max(peak) == 2
+    assert all(stats["runs"] == 1 for stats in scheduler.get_stats()["services"])
+
+
+def test_record_skip_counts_only_service_jobs(monkeypatch):
+    _configure(monkeypatch)
+    scheduler = CollectionScheduler(AsyncIOScheduler())
+    scheduler.add_service("busy")
+
+    assert scheduler.record_skip(CollectionScheduler.job_id("busy"), "max_instances")
+    assert not scheduler.record_skip("rollup_compactor", "missed")
+    assert scheduler.get_stats()["services"][0]["skipped"] == {"max_instances": 1, "missed": 0, "lease_held": 0}
+
+
+class _StubCoordinator:
+    def __init__(self, replica_id, replicas, lease_free=True):
+        self.replica_id = replica_id
+        self.replicas = replicas
+        self.last_heartbeat = "now"
+        self.lease_free = lease_free
+
+    def owns(self, name):
+        return assign_owner(name, self.replicas) == self.replica_id
+
+    async def run_with_lease(self, name, func):
+        if not self.lease_free:
+            return False, None
+        return True, await func()
+
+    def get_stats(self):
+        return {"replica_id": self.replica_id, "replicas": self.replicas}
+
+
+def test_replicas_split_services_and_take_over_on_failure(monkeypatch):
+    _configure(monkeypatch)
+    services = [f"service-{i}" for i in range(40)]
+    monkeypatch.setattr(collection_scheduler, "fetch_services_async", lambda: asyncio.sleep(0, services))
+    monkeypatch.setattr(collection_scheduler, "initialize_trace_updates", lambda names: asyncio.sleep(0))
+    replicas = ["replica-a", "replica-b"]
+    schedulers = [CollectionScheduler(AsyncIOScheduler(), _StubCoordinator(r, list(replicas))) for r in replicas]
+    for scheduler in schedulers:
+        asyncio.run(scheduler.discover_services())
+
+    collected = [{stats["service"] for stats in scheduler.get_stats()["services"]} for scheduler in schedulers]
+    assert collected[0] and collected[1]
+    assert collected[0].isdisjoint(collected[1]) and collected[0] | collected[1] == set(services)
+
+    schedulers[0].coordinator.replicas = ["replica-a"]  # replica-b stopped heartbeating
+    schedulers[0].rebalance()
+    assert len(schedulers[0].get_stats()["services"]) == len(services)
+
+
+def test_run_service_skips_while_another_replica_holds_the_lease(monkeypatch):
+    _configure(monkeypatch)
+    sweeps = []
+    monkeypatch.setattr(collection_scheduler, "sweep_service", lambda service: asyncio.sleep(0, sweeps.append(service)))
+    scheduler = CollectionScheduler(AsyncIOScheduler(), _StubCoordinator("replica-a", ["replica-a"], lease_free=False))
+    scheduler.add_service("orders")
+
+    asyncio.run(scheduler.run_service("orders"))
+
+    stats = scheduler.get_stats()["services"][0]
+    assert not sweeps
+    assert (stats["runs"], stats["skipped"]["lease_held"], stats["running"]) == (0, 1, False)
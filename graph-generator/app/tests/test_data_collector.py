@@ -0,0 +1,285 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import data_collector
+from app.services.trace_filter import recent_traces
+
+
+@pytest.fixture(autouse=True)
+def clear_recent_traces():
+    recent_traces.clear()
+    yield
+    recent_traces.clear()
+
+
+def _install_mock_jaeger(handler):
+    data_collector._jaeger_client = httpx.AsyncClient(
+        base_url=data_collector.JAEGER_BASE_URL, transport=httpx.MockTransport(handler)
+    )
+    data_collector._jaeger_semaphore = asyncio.Semaphore(4)
+
+
+def test_fetch_traces_retries_transient_errors(monkeypatch):
+    monkeypatch.setattr(data_collector.settings, "COLLECTOR_BACKOFF_SECONDS", 0)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"data": [{"traceID": "t1"}]})
+
+    async def run():
+        _install_mock_jaeger(handler)
+        try:
+            return await data_collector.fetch_traces("service-a", 0, 10)
+        finally:
+            await data_collector.close_jaeger_client()
+
+    assert asyncio.run(run()) == [{"traceID": "t1"}]
+    assert len(calls) == 3
+    assert calls[-1].url.params["service"] == "service-a"
+
+
+def test_fetch_traces_does_not_retry_client_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400)
+
+    async def run():
+        _install_mock_jaeger(handler)
+        try:
+            return await data_collector.fetch_traces("service-a", 0, 10)
+        finally:
+            await data_collector.close_jaeger_client()
+
+    assert asyncio.run(run()) == []
+    assert len(calls) == 1
+
+
+def test_plan_windows_covers_range():
+    window_us = 300_000_000
+    windows = data_collector._plan_windows(0, 2 * window_us, window_us)
+    assert windows[0] == (0, window_us)
+    assert windows[-1][1] == 2 * window_us
+    assert len(windows) == 2
+    assert data_collector._plan_windows(0, 10 * window_us, window_us, max_windows=3)[-1] == (
+        2 * window_us + 2, 3 * window_us + 2
+    )
+
+
+def _jaeger_serving(trace_times):
+    """
+    Mock Jaeger /traces endpoint returning the newest `limit` traces that start in [start, end].
+    """
+    requests = []
+
+    def handler(request):
+        params = request.url.params
+        requests.append((int(params["start"]), int(params["end"])))
+        matching = [t for t in trace_times if int(params["start"]) <= t <= int(params["end"])]
+        newest = sorted(matching, reverse=True)[:int(params["limit"])]
+        return httpx.Response(200, json={"data": [{"traceID": str(t)} for t in newest]})
+    return handler, requests
+
+
+def test_fetch_window_traces_bisects_full_pages(monkeypatch):
+    monkeypatch.setattr(data_collector.settings, "COLLECTOR_MIN_WINDOW_SECONDS", 0.000001)
+    trace_times = list(range(0, 1000, 10))
+    handler, requests = _jaeger_serving(trace_times)
+
+    async def run():
+        _install_mock_jaeger(handler)
+        try:
+            return await data_collector.fetch_window_traces("service-a", 0, 999, limit=8)
+        finally:
+            await data_collector.close_jaeger_client()
+
+    leaves = asyncio.run(run())
+    fetched = sorted(int(trace["traceID"]) for _, _, traces in leaves for trace in traces)
+    assert fetched == trace_times
+    assert all(len(traces) < 8 for _, _, traces in leaves)
+    assert [leaf[0] for leaf in leaves] == sorted(leaf[0] for leaf in leaves)
+    assert len(requests) == 2 * len(leaves) - 1
+
+
+def test_next_window_shrinks_after_split_and_widens_when_sparse(monkeypatch):
+    monkeypatch.setattr(data_collector.settings, "COLLECTOR_MAX_WINDOW_SECONDS", 3600)
+    monkeypatch.setattr(data_collector.settings, "COLLECTOR_MIN_WINDOW_SECONDS", 0.00001)
+    split = [(0, 99, []), (100, 149, []), (150, 199, [])]
+    assert data_collector._next_window_us(200, split, limit=10) == 49
+    assert data_collector._next_window_us(60_000_000, [(0, 1, [{}] * 9)], limit=10) == 60_000_000
+    assert data_collector._next_window_us(60_000_000, [(0, 1, [])], limit=10) == 120_000_000
+    assert data_collector._next_window_us(3_000_000_000, [(0, 1, [])], limit=10) == 3_600_000_000
+
+
+class _FakeTraceUpdates:
+    def __init__(self, record):
+        self.record = record
+
+    async def find_one(self, query):
+        return dict(self.record)
+
+    async def update_one(self, query, update):
+        self.record.update(update["$set"])
+
+
+def test_sweep_advances_checkpoint_over_empty_windows_in_one_request(monkeypatch):
+    handler, requests = _jaeger_serving([])
+    now_us = int(data_collector.datetime.now(data_collector.timezone.utc).timestamp() * 1e6)
+    trace_updates = _FakeTraceUpdates({"last_fetched_end_time_us": now_us - 60_000_000, "window_us": 3_600_000_000})
+    monkeypatch.setattr(data_collector.db_manager, "async_trace_updates", trace_updates)
+
+    async def run():
+        _install_mock_jaeger(handler)
+        try:
+            return await data_collector.fetch_and_store_traces("service-a")
+        finally:
+            await data_collector.close_jaeger_client()
+
+    assert asyncio.run(run()) == 0
+    assert len(requests) == 1
+    assert trace_updates.record["last_fetched_end_time_us"] > now_us
+
+
+def test_sweep_keeps_checkpoint_when_store_fails(monkeypatch):
+    now_us = int(data_collector.datetime.now(data_collector.timezone.utc).timestamp() * 1e6)
+    start_us = now_us - 60_000_000
+    handler, _ = _jaeger_serving([start_us + 1_000_000])
+    trace_updates = _FakeTraceUpdates({"last_fetched_end_time_us": start_us, "window_us": 3_600_000_000})
+    monkeypatch.setattr(data_collector.db_manager, "async_trace_updates", trace_updates)
+
+    async def failing_store(service_name, traces):
+        raise data_collector.TraceStoreError("Mongo unavailable")
+
+    monkeypatch.setattr(data_collector, "store_traces", failing_store)
+
+    async def run():
+        _install_mock_jaeger(handler)
+        try:
+            return await data_collector.sweep_service("service-a")
+        finally:
+            await data_collector.close_jaeger_client()
+
+    sweep = asyncio.run(run())
+    assert sweep["checkpoint_us"] == start_us
+    assert trace_updates.record["last_fetched_end_time_us"] == start_us
+
+
+async def _reserve_from_one(count):
+    return 1
+
+
+async def _intern_services(names):
+    return {name: index for index, name in enumerate(sorted(names))}
+
+
+class _FakeBulkCollection:
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls.append((operations, ordered))
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_store_traces_issues_one_unordered_bulk_write(monkeypatch):
+    result = type("Result", (), {"upserted_count": 2, "matched_count": 1})()
+    collection = _FakeBulkCollection(result=result)
+    raw_collection = _FakeBulkCollection(result=result)
+    monkeypatch.setattr(data_collector.db_manager, "async_trace_spans", collection)
+    monkeypatch.setattr(data_collector.db_manager, "async_trace_collection", raw_collection)
+    monkeypatch.setattr(data_collector, "reserve_ingest_sequence", _reserve_from_one)
+    monkeypatch.setattr(data_collector, "intern_services_async", _intern_services)
+
+    traces = [{"traceID": "a"}, {"traceID": "b"}, {"traceID": "c"}, {"traceID": "a"}, {"spans": []}]
+    assert asyncio.run(data_collector.store_traces("service-a", traces)) == (2, 1)
+    operations, ordered = collection.calls[0]
+    assert len(collection.calls) == 1
+    assert ordered is False
+    assert len(operations) == 3
+    assert [op._doc["$setOnInsert"]["ingest_seq"] for op in operations] == [1, 2, 3]
+    assert len(raw_collection.calls) == 1
+
+
+def test_store_traces_counts_duplicate_key_errors_as_skipped(monkeypatch):
+    error = data_collector.errors.BulkWriteError({
+        "nUpserted": 1,
+        "nMatched": 0,
+        "writeErrors": [{"index": 1, "code": 11000, "errmsg": "E11000 duplicate key"}],
+    })
+    collection = _FakeBulkCollection(error=error)
+    monkeypatch.setattr(data_collector.db_manager, "async_trace_spans", collection)
+    monkeypatch.setattr(data_collector.settings, "STORE_RAW_TRACES", False)
+    monkeypatch.setattr(data_collector, "reserve_ingest_sequence", _reserve_from_one)
+    monkeypatch.setattr(data_collector, "intern_services_async", _intern_services)
+
+    assert asyncio.run(data_collector.store_traces("service-a", [{"traceID": "a"}, {"traceID": "b"}])) == (1, 1)
+
+
+def test_store_traces_raises_when_traces_were_not_written(monkeypatch):
+    error = data_collector.errors.BulkWriteError({
+        "nUpserted": 1,
+        "nMatched": 0,
+        "writeErrors": [{"index": 1, "code": 2, "errmsg": "bad value"}],
+    })
+    monkeypatch.setattr(data_collector.db_manager, "async_trace_spans", _FakeBulkCollection(error=error))
+    monkeypatch.setattr(data_collector.settings, "STORE_RAW_TRACES", False)
+    monkeypatch.setattr(data_collector, "reserve_ingest_sequence", _reserve_from_one)
+    monkeypatch.setattr(data_collector, "intern_services_async", _intern_services)
+
+    with pytest.raises(data_collector.TraceStoreError) as failure:
+        asyncio.run(data_collector.store_traces("service-a", [{"traceID": "a"}, {"traceID": "b"}]))
+    assert failure.value.inserted == 1
+    # Only the written trace is remembered, so "b" is retried
+    assert recent_traces.filter_new({"a": {"traceID": "a"}, "b": {"traceID": "b"}})[0].keys() == {"b"}
+
+    monkeypatch.setattr(data_collector.db_manager, "async_trace_spans", _FakeBulkCollection(
+        error=data_collector.errors.AutoReconnect("connection reset")
+    ))
+    with pytest.raises(data_collector.TraceStoreError):
+        asyncio.run(data_collector.store_traces("service-a", [{"traceID": "c"}]))
+
+
+def test_store_traces_drops_recently_stored_unchanged_traces(monkeypatch):
+    result = type("Result", (), {"upserted_count": 2, "matched_count": 0})()
+    collection = _FakeBulkCollection(result=result)
+    monkeypatch.setattr(data_collector.db_manager, "async_trace_spans", collection)
+    monkeypatch.setattr(data_collector.settings, "STORE_RAW_TRACES", False)
+    monkeypatch.setattr(data_collector, "reserve_ingest_sequence", _reserve_from_one)
+    monkeypatch.setattr(data_collector, "intern_services_async", _intern_services)
+
+    span = {"spanID": "s1"}
+    first = [{"traceID": "a", "spans": [span]}, {"traceID": "b", "spans": [span]}]
+    assert asyncio.run(data_collector.store_traces("service-a", first)) == (2, 0)
+
+    # "a" is unchanged and dropped; "b" grew and is written again
+    again = [{"traceID": "a", "spans": [span]}, {"traceID": "b", "spans": [span, {"spanID": "s2"}]}]
+    result.upserted_count, result.matched_count = 0, 1
+    assert asyncio.run(data_collector.store_traces("service-a", again)) == (0, 2)
+    operations, _ = collection.calls[-1]
+    assert [op._filter["traceID"] for op in operations] == ["b"]
+
+
+def test_store_traces_does_not_remember_traces_whose_raw_write_failed(monkeypatch):
+    result = type("Result", (), {"upserted_count": 2, "matched_count": 0})()
+    raw_error = data_collector.errors.BulkWriteError({
+        "writeErrors": [{"index": 0, "code": 2, "errmsg": "document too large"}],
+    })
+    monkeypatch.setattr(data_collector.db_manager, "async_trace_spans", _FakeBulkCollection(result=result))
+    monkeypatch.setattr(data_collector.db_manager, "async_trace_collection", _FakeBulkCollection(error=raw_error))
+    monkeypatch.setattr(data_collector.settings, "STORE_RAW_TRACES", True)
+    monkeypatch.setattr(data_collector, "reserve_ingest_sequence", _reserve_from_one)
+    monkeypatch.setattr(data_collector, "intern_services_async", _intern_services)
+
+    batch = [{"traceID": "a"}, {"traceID": "b"}]
+    assert asyncio.run(data_collector.store_traces("service-a", batch)) == (2, 0)
+    assert recent_traces.filter_new({trace["traceID"]: trace for trace in batch})[0].keys() == {"a"}
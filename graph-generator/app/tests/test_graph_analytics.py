@@ -0,0 +1,36 @@
+import networkx as nx
+from app.services.graph_analytics import compute_graph_analytics
+
+
+def _graph():
+    graph = nx.DiGraph()
+    graph.add_weighted_edges_from([
+        ("gateway", "orders", 40), ("gateway", "users", 10), ("orders", "payments", 20),
+        ("orders", "inventory", 15), ("inventory", "orders", 5), ("payments", "ledger", 20),
+        ("users", "ledger", 2),
+    ])
+    graph.add_node("batch")
+    return graph
+
+
+def test_metrics_match_networkx():
+    graph = _graph()
+    services = compute_graph_analytics(graph)["services"]
+    pagerank = nx.pagerank(graph)
+    betweenness = nx.betweenness_centrality(graph)
+
+    for service in graph:
+        metrics = services[service]
+        assert abs(metrics["pagerank"] - pagerank[service]) < 1e-12
+        assert abs(metrics["betweenness"] - betweenness[service]) < 1e-12
+        assert metrics["weighted_in_degree"] == graph.in_degree(service, weight="weight")
+        assert metrics["out_degree"] == graph.out_degree(service)
+        assert metrics["upstream"] == len(nx.ancestors(graph, service))
+        assert metrics["downstream"] == len(nx.descendants(graph, service))
+
+
+def test_critical_services_rank_by_blast_radius():
+    analytics = compute_graph_analytics(_graph())
+    assert analytics["critical_services"][:2] == ["ledger", "payments"]
+    assert analytics["services"]["ledger"]["upstream"] == 5
+    assert compute_graph_analytics(nx.DiGraph()) == {"services": {}, "critical_services": []}
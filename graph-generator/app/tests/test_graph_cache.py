@@ -0,0 +1,61 @@
+import networkx as nx
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers import graphs
+from app.services.graph_cache import GraphCache, etag_matches, format_etag
+
+client = TestClient(app)
+
+
+def test_graph_cache_rebuilds_only_on_version_change():
+    cache = GraphCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return len(builds)
+
+    assert cache.get("service", 1, build) == 1
+    assert cache.get("service", 1, build) == 1
+    assert cache.get("service", 2, build) == 2
+    assert len(builds) == 2
+
+
+def test_etag_matches_weak_and_lists():
+    etag = format_etag(3)
+    assert etag_matches(f'W/{etag}', etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert not etag_matches(format_etag(2), etag)
+    assert not etag_matches(None, etag)
+
+
+def test_fetch_dependency_graph_honors_if_none_match(monkeypatch):
+    version = {"value": 7}
+    reads = []
+
+    async def get_version():
+        return version["value"]
+
+    async def read_graph():
+        reads.append(1)
+        graph = nx.DiGraph()
+        graph.add_edge("gateway", "orders", weight=1)
+        return graph
+
+    monkeypatch.setattr(graphs, "get_graph_version_async", get_version)
+    monkeypatch.setattr(graphs, "read_graph_from_neo4j_async", read_graph)
+    monkeypatch.setattr(graphs, "graph_cache", GraphCache())
+
+    first = client.get("/api/graphs/")
+    assert first.status_code == 200
+    assert first.json()["graph"]["links"][0]["target"] == "orders"
+
+    etag = first.headers["ETag"]
+    assert client.get("/api/graphs/", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/graphs/").status_code == 200
+    assert len(reads) == 1
+
+    version["value"] = 8
+    assert client.get("/api/graphs/", headers={"If-None-Match": etag}).status_code == 200
+    assert len(reads) == 2
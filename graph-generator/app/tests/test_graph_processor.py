@@ -0,0 +1,193 @@
+import networkx as nx
+import pytest
+
+from app.services import graph_processor
+
+
+class _FakeSession:
+    def __init__(self):
+        self.transactions = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_write(self, work, *args):
+        self.transactions.append(args)
+
+
+class _FakeDriver:
+    def __init__(self):
+        self.session_obj = _FakeSession()
+
+    def session(self):
+        return self.session_obj
+
+
+def test_update_graph_in_neo4j_writes_edges_in_chunks(monkeypatch):
+    driver = _FakeDriver()
+    monkeypatch.setattr(graph_processor.db_manager, "neo4j_driver", driver)
+    bumps = []
+    monkeypatch.setattr(graph_processor, "mark_graph_write_pending", lambda: bumps.append(0))
+    monkeypatch.setattr(graph_processor, "bump_graph_version", lambda state=None: bumps.append(1) or len(bumps))
+    graph = nx.DiGraph()
+    for i in range(5):
+        graph.add_edge("gateway", f"service-{i}", weight=i + 1)
+
+    assert graph_processor.update_graph_in_neo4j(graph, batch_size=2) == 2
+
+    chunks = [rows for rows, sync_seq in driver.session_obj.transactions]
+    assert [len(rows) for rows in chunks] == [2, 2, 1]
+    assert chunks[0][0] == {"parent": "gateway", "child": "service-0", "weight": 1, "traces": 0, "latency_sketch": None}
+    assert bumps == [0, 1]
+
+
+class _FakeTransaction:
+    def __init__(self, stored):
+        self.stored = stored
+        self.merged_rows = None
+
+    def run(self, query, rows):
+        if query == graph_processor.READ_EDGE_SKETCHES_QUERY:
+            return [{"parent": row["parent"], "child": row["child"], "sketch": self.stored}
+                    for row in rows if self.stored]
+        self.merged_rows = rows
+        return self
+
+    def consume(self):
+        return None
+
+
+def test_merge_service_edges_combines_stored_latency_sketch():
+    stored = graph_processor.LatencySketch()
+    stored.add(1_000)
+    incoming = graph_processor.LatencySketch()
+    incoming.add(2_000)
+    tx = _FakeTransaction(stored.to_json())
+
+    graph_processor._merge_service_edges(
+        tx, [{"parent": "gateway", "child": "orders", "weight": 1, "latency_sketch": incoming}]
+    )
+
+    merged = graph_processor.LatencySketch.from_json(tx.merged_rows[0]["latency_sketch"])
+    assert merged.count == 2
+    assert (merged.min, merged.max) == (1_000, 2_000)
+
+
+def _synthetic_traces(count):
+    traces = []
+    for i in range(count):
+        services = [f"service-{(i + hop) % 7}" for hop in range(4)]
+        spans = [{"spanID": "0", "processID": "p0", "references": [], "duration": 1000 + i}]
+        for hop in range(1, 4):
+            spans.append({
+                "spanID": str(hop),
+                "processID": f"p{hop}",
+                "references": [{"refType": "CHILD_OF", "spanID": str(hop - 1)}],
+                "duration": (i * 37 + hop * 101) % 5000,
+            })
+        traces.append({
+            "processes": {f"p{hop}": {"serviceName": service} for hop, service in enumerate(services)},
+            "spans": spans,
+        })
+    return traces
+
+
+def _graph_snapshot(graph):
+    return [
+        (parent, child, data["weight"], data["traces"], data["latency_sketch"].to_dict())
+        for parent, child, data in graph.edges(data=True)
+    ]
+
+
+def test_parallel_build_is_identical_to_serial_build():
+    traces = _synthetic_traces(300)
+    serial = graph_processor.generate_weighted_graph_from_traces(traces)
+    parallel = graph_processor.generate_weighted_graph_in_parallel(iter(traces), workers=2, shard_size=37)
+    assert _graph_snapshot(parallel) == _graph_snapshot(serial)
+
+
+class _RecordingTransaction:
+    def __init__(self, log):
+        self.log = log
+
+    def run(self, query, **params):
+        self.log.append((query, params.get("rows")))
+        return self
+
+    def consume(self):
+        return None
+
+
+class _RecordingSession(_FakeSession):
+    def __init__(self):
+        super().__init__()
+        self.log = []
+
+    def run(self, query, **params):
+        self.log.append(("auto", query))
+        return _RecordingTransaction(self.log)
+
+    def execute_write(self, work, *args):
+        self.log.append(("begin", None))
+        work(_RecordingTransaction(self.log), *args)
+        self.log.append(("commit", None))
+
+
+def test_replace_graph_in_neo4j_stages_edges_then_swaps_in_one_transaction(monkeypatch):
+    driver = _FakeDriver()
+    driver.session_obj = _RecordingSession()
+    monkeypatch.setattr(graph_processor.db_manager, "neo4j_driver", driver)
+    bumps = []
+    monkeypatch.setattr(graph_processor, "mark_graph_write_pending", lambda: bumps.append(0))
+    monkeypatch.setattr(graph_processor, "bump_graph_version", lambda state=None: bumps.append(1) or len(bumps))
+    graph = nx.DiGraph()
+    for i in range(3):
+        graph.add_edge("gateway", f"service-{i}", weight=i + 1)
+
+    assert graph_processor.replace_graph_in_neo4j(graph, batch_size=2) == 2
+
+    log = driver.session_obj.log
+    assert log[0] == ("auto", graph_processor.CLEAR_STAGED_SERVICE_EDGES_QUERY)
+    staged = [rows for query, rows in log if query == graph_processor.STAGE_SERVICE_EDGES_QUERY]
+    assert [len(rows) for rows in staged] == [2, 1]
+    # The live CALLS edges are only touched in the final transaction
+    assert log[-4:] == [
+        ("begin", None),
+        (graph_processor.DELETE_SERVICE_EDGES_QUERY, None),
+        (graph_processor.PROMOTE_STAGED_SERVICE_EDGES_QUERY, None),
+        ("commit", None),
+    ]
+    assert bumps == [0, 1]
+
+
+class _FakeEdgeArchive:
+    def __init__(self, error_code=None):
+        self.error_code = error_code
+        self.operations = []
+
+    def find(self, query, projection):
+        return []
+
+    def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+        if self.error_code is not None:
+            raise graph_processor.BulkWriteError({"writeErrors": [{"index": 0, "code": self.error_code}]})
+
+
+def test_write_edge_archive_skips_edges_that_already_hold_the_batch(monkeypatch):
+    counters = {("gateway", "orders"): [3, 1, graph_processor.LatencySketch()]}
+    edge_archive = _FakeEdgeArchive(error_code=11000)
+    monkeypatch.setattr(graph_processor.db_manager, "edge_archive", edge_archive)
+
+    graph_processor.write_edge_archive(counters, "batch-1")  # Replayed batch: the duplicate key is expected
+
+    operation = edge_archive.operations[0]
+    assert operation._filter == {"parent": "gateway", "child": "orders", "archive_batch": {"$ne": "batch-1"}}
+    assert operation._doc == {"$inc": {"weight": 3, "traces": 1}, "$set": {"archive_batch": "batch-1"}}
+
+    monkeypatch.setattr(graph_processor.db_manager, "edge_archive", _FakeEdgeArchive(error_code=2))
+    with pytest.raises(graph_processor.BulkWriteError):
+        graph_processor.write_edge_archive(counters, "batch-2")
@@ -0,0 +1,170 @@
+import mongomock
+import pytest
+
+from app.core.config import settings
+from app.core.database import db_manager
+from app.services import graph_processor, graph_updater
+from app.services.operation_graph import OPERATION_EDGE_KEY
+from app.services.replica_coordinator import LeaseLostError
+from app.services.span_store import intern_services, project_trace_spans
+
+SYNC_COLLECTIONS = ("trace_spans", "trace_collection_updates", "edge_rollups", "operation_edges", "graph_deltas",
+                    "service_registry", "counters")
+
+
+class _Neo4jTransaction:
+    def __init__(self, edges):
+        self.edges = edges
+
+    def run(self, query, rows):
+        if query == graph_processor.MERGE_SERVICE_EDGES_QUERY:
+            for row in rows:
+                edge = self.edges.setdefault((row["parent"], row["child"]), {"weight": 0, "traces": 0})
+                if row["sync_seq"] is not None and edge.get("sync_seq") == row["sync_seq"]:
+                    continue
+                edge["weight"] += row["weight"]
+                edge["traces"] += row["traces"]
+                edge["sync_seq"] = row["sync_seq"]
+        return self
+
+    def consume(self):
+        return None
+
+    def __iter__(self):
+        return iter(())  # No stored latency sketches
+
+
+class _Neo4jDriver:
+    """
+    Commits each write transaction on its own, like Neo4j, and fails the `fail_at`-th one.
+    """
+
+    def __init__(self, fail_at=None):
+        self.edges = {}
+        self.fail_at = fail_at
+        self.transactions = 0
+
+    def session(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_write(self, work, *args):
+        self.transactions += 1
+        if self.transactions == self.fail_at:
+            raise RuntimeError("Neo4j unavailable")
+        work(_Neo4jTransaction(self.edges), *args)
+
+
+def _trace(trace_id, calls):
+    """
+    A trace whose first service calls down the given (parent, child) service pairs.
+    """
+    processes, spans, span_ids = {}, [], {}
+    for parent, child in [(None, calls[0][0]), *calls]:
+        process_id = f"p{len(processes)}"
+        processes.setdefault(process_id, {"serviceName": child})
+        span_ids[child] = f"s{len(spans)}"
+        spans.append({"spanID": span_ids[child], "processID": process_id, "operationName": "call",
+                      "startTime": 1_700_000_000_000_000, "duration": 10,
+                      "references": [{"refType": "CHILD_OF", "spanID": span_ids[parent]}] if parent else []})
+    return {"traceID": trace_id, "processes": processes, "spans": spans}
+
+
+def _install(monkeypatch, driver):
+    database = mongomock.MongoClient().db
+    for name in SYNC_COLLECTIONS:
+        monkeypatch.setattr(db_manager, name, database[name])
+    monkeypatch.setattr(db_manager, "neo4j_driver", driver)
+    monkeypatch.setattr(settings, "NEO4J_WRITE_BATCH_SIZE", 1)
+    database.edge_rollups.create_index([("bucket", 1), ("granularity", 1), ("parent", 1), ("child", 1)], unique=True)
+    database.operation_edges.create_index([(field, 1) for field in OPERATION_EDGE_KEY], unique=True)
+
+    traces = [
+        _trace("t1", [("gateway", "orders"), ("orders", "payments")]),
+        _trace("t2", [("gateway", "orders")]),
+        _trace("t3", [("gateway", "users")]),
+    ]
+    service_ids = intern_services({"gateway", "orders", "payments", "users"})
+    for seq, trace in enumerate(traces, start=1):
+        database.trace_spans.insert_one(
+            {**project_trace_spans(trace, service_ids), "traceID": trace["traceID"], "ingest_seq": seq,
+             "ingested_at_us": 0}
+        )
+    return database
+
+
+def _snapshot(database, driver):
+    return {
+        "rollups": sorted((doc["parent"], doc["child"], doc["calls"]) for doc in database.edge_rollups.find()),
+        "operation_edges": sorted(
+            (doc["parent_service"], doc["child_service"], doc["calls"], doc["traces"])
+            for doc in database.operation_edges.find()
+        ),
+        "graph": sorted((edge, data["weight"], data["traces"]) for edge, data in driver.edges.items()),
+        "last_synced_seq": graph_updater.get_last_synced_seq(),
+        "pending": graph_updater.get_sync_state().get(graph_updater.PENDING_SYNC_FIELD),
+    }
+
+
+def _clean_sync(monkeypatch):
+    driver = _Neo4jDriver()
+    database = _install(monkeypatch, driver)
+    assert graph_updater.sync_graph_incrementally(batch_size=2) == 3
+    return _snapshot(database, driver)
+
+
+def test_sync_replays_a_batch_that_failed_in_neo4j_once(monkeypatch):
+    expected = _clean_sync(monkeypatch)
+
+    driver = _Neo4jDriver(fail_at=2)  # After the first edge of the first batch was committed
+    database = _install(monkeypatch, driver)
+    with pytest.raises(RuntimeError):
+        graph_updater.sync_graph_incrementally(batch_size=2)
+    assert (graph_updater.get_last_synced_seq(), _snapshot(database, driver)["pending"]) == (0, 2)
+
+    assert graph_updater.sync_graph_incrementally(batch_size=2) == 3
+    assert _snapshot(database, driver) == expected
+
+
+def test_sync_replays_a_batch_written_before_its_checkpoint_once(monkeypatch):
+    expected = _clean_sync(monkeypatch)
+
+    driver = _Neo4jDriver()
+    database = _install(monkeypatch, driver)
+    bump = graph_processor.bump_graph_version
+
+    def crash_before_checkpoint(state=None):
+        monkeypatch.setattr(graph_processor, "bump_graph_version", bump)
+        raise RuntimeError("process died")
+
+    monkeypatch.setattr(graph_processor, "bump_graph_version", crash_before_checkpoint)
+    with pytest.raises(RuntimeError):
+        graph_updater.sync_graph_incrementally(batch_size=2)
+    assert graph_updater.get_last_synced_seq() == 0
+
+    assert graph_updater.sync_graph_incrementally(batch_size=2) == 3
+    assert _snapshot(database, driver) == expected
+
+
+def test_sync_stops_between_batches_once_the_lease_is_lost(monkeypatch):
+    expected = _clean_sync(monkeypatch)
+
+    driver = _Neo4jDriver()
+    database = _install(monkeypatch, driver)
+    checks = []
+
+    def lease_held():
+        checks.append(True)
+        return len(checks) == 1
+
+    with pytest.raises(LeaseLostError):
+        graph_updater.sync_graph_incrementally(batch_size=2, lease_held=lease_held)
+    assert (graph_updater.get_last_synced_seq(), _snapshot(database, driver)["pending"]) == (2, None)
+
+    assert graph_updater.sync_graph_incrementally(batch_size=2) == 1
+    assert _snapshot(database, driver) == expected
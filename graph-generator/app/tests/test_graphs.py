@@ -1,10 +1,29 @@
 from fastapi.testclient import TestClient
 from app.main import app
+from app.routers import graphs
 
 client = TestClient(app)
 
 
-def test_create_dependency_graph():
-    response = client.post("/api/graphs/")
+def _run_in_thread_with_lease(held):
+    async def run_in_thread_with_lease(name, func, *args, **kwargs):
+        return (True, func(*args, lease_held=lambda: True, **kwargs)) if held else (False, None)
+    return run_in_thread_with_lease
+
+
+def test_create_dependency_graph(monkeypatch):
+    monkeypatch.setattr(graphs.replica_coordinator, "run_in_thread_with_lease", _run_in_thread_with_lease(True))
+    monkeypatch.setattr(graphs, "sync_graph_incrementally", lambda lease_held: 5)
+    response = client.post("/api/graphs/create")
     assert response.status_code == 200
-    assert "graph" in response.json()
+    assert response.json() == {
+        "status": "success", "message": "Dependency graph updated successfully with 5 traces.",
+    }
+
+    monkeypatch.setattr(graphs, "sync_graph_incrementally", lambda lease_held: 0)
+    assert client.post("/api/graphs/create").json()["message"] == "No new traces to process."
+
+
+def test_create_dependency_graph_conflicts_while_another_replica_writes(monkeypatch):
+    monkeypatch.setattr(graphs.replica_coordinator, "run_in_thread_with_lease", _run_in_thread_with_lease(False))
+    assert client.post("/api/graphs/create").status_code == 409
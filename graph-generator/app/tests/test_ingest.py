@@ -0,0 +1,144 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.main import app
+from app.services import ingest
+from app.utils.json_stream import JsonArrayStream
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def fresh_queue(monkeypatch):
+    monkeypatch.setattr(ingest, "_queue", None)
+    monkeypatch.setattr(ingest.settings, "INGEST_BATCH_SIZE", 2)
+    monkeypatch.setattr(ingest.settings, "INGEST_QUEUE_MAX_BATCHES", 4)
+    monkeypatch.setattr(ingest.settings, "INGEST_ENQUEUE_TIMEOUT_SECONDS", 0.01)
+
+
+async def _chunks(payload, size=7):
+    for start in range(0, len(payload), size):
+        yield payload[start:start + size]
+
+
+def _drain():
+    queue = ingest.get_ingest_queue()
+    batches = []
+    while not queue.empty():
+        batches.append(queue.get_nowait())
+    return batches
+
+
+def test_json_array_stream_yields_items_across_chunk_boundaries():
+    payload = json.dumps({"total": 2, "data": [{"traceID": "a", "s": "}{\\"}, {"traceID": "b", "n": [{}]}]}).encode()
+    stream = JsonArrayStream(keys=("data",))
+    items = []
+    for start in range(len(payload)):
+        items += stream.feed(payload[start:start + 1])
+    items += stream.close()
+    assert [item["traceID"] for _, item in items] == ["a", "b"]
+    assert items[0][1]["s"] == "}{\\"
+
+    truncated = JsonArrayStream(keys=("data",))
+    truncated.feed(payload[:-5])
+    with pytest.raises(ValueError):
+        truncated.close()
+
+
+def test_enqueue_payload_batches_gzipped_jaeger_traces():
+    traces = [{"traceID": f"t{i}", "spans": []} for i in range(5)]
+    payload = gzip.compress(json.dumps({"data": traces}).encode())
+
+    async def run():
+        accepted = await ingest.enqueue_payload(_chunks(payload), "gzip")
+        return accepted, _drain()
+
+    accepted, batches = asyncio.run(run())
+    assert accepted == 5
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+
+def test_enqueue_payload_skips_malformed_traces_and_keeps_the_batch():
+    def trace(trace_id, span=None, process=None):
+        return {"traceID": trace_id, "spans": [span or {"spanID": "s1", "processID": "p1"}],
+                "processes": {"p1": process or {"serviceName": "gateway"}}}
+
+    traces = [trace("t1"), trace("bad-span", span={"processID": "p1"}), trace("t2"),
+              trace("bad-process", process={"tags": []}), {"spans": []}]
+    payload = json.dumps({"data": traces}).encode()
+
+    def rejected():
+        return REGISTRY.get_sample_value("ingest_rejected_total", {"reason": "invalid"}) or 0
+
+    async def run():
+        accepted = await ingest.enqueue_payload(_chunks(payload))
+        return accepted, _drain()
+
+    before = rejected()
+    accepted, batches = asyncio.run(run())
+    assert accepted == 2
+    assert [[trace["traceID"] for trace in batch] for batch in batches] == [["t1", "t2"]]
+    assert rejected() - before == 3
+
+
+def test_enqueue_payload_groups_otlp_spans_into_traces():
+    def resource(service, spans):
+        return {"resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                "scopeSpans": [{"spans": spans}]}
+
+    trace_id = "0af7651916cd43dd8448eb211c80319c"
+    payload = json.dumps({"resourceSpans": [
+        resource("frontend", [{"traceId": trace_id, "spanId": "b7ad6b7169203331", "name": "GET /",
+                               "startTimeUnixNano": "1000000", "endTimeUnixNano": "5000000"}]),
+        resource("backend", [{"traceId": trace_id, "spanId": "00f067aa0ba902b7", "parentSpanId": "b7ad6b7169203331",
+                              "name": "query", "startTimeUnixNano": "2000000", "endTimeUnixNano": "3000000",
+                              "status": {"code": 2}}]),
+    ]}).encode()
+
+    async def run():
+        accepted = await ingest.enqueue_payload(_chunks(payload))
+        return accepted, _drain()
+
+    accepted, batches = asyncio.run(run())
+    assert accepted == 1
+    trace = batches[0][0]
+    assert sorted(process["serviceName"] for process in trace["processes"].values()) == ["backend", "frontend"]
+    child = trace["spans"][1]
+    assert child["references"] == [{"refType": "CHILD_OF", "traceID": trace_id, "spanID": "b7ad6b7169203331"}]
+    assert (child["startTime"], child["duration"]) == (2000, 1000)
+    assert {"key": "error", "value": True} in child["tags"]
+
+
+def test_enqueue_payload_reports_accepted_traces_when_queue_fills(monkeypatch):
+    monkeypatch.setattr(ingest.settings, "INGEST_QUEUE_MAX_BATCHES", 1)
+    payload = json.dumps([{"traceID": f"t{i}"} for i in range(5)]).encode()
+
+    async def run():
+        with pytest.raises(ingest.IngestQueueFull) as raised:
+            await ingest.enqueue_payload(_chunks(payload))
+        return raised.value.accepted
+
+    assert asyncio.run(run()) == 2
+
+
+def test_ingest_route_rejects_with_429_when_queue_is_full(monkeypatch):
+    monkeypatch.setattr(ingest.settings, "INGEST_QUEUE_MAX_BATCHES", 1)
+    body = gzip.compress(json.dumps({"data": [{"traceID": "a"}]}).encode())
+    headers = {"Content-Encoding": "gzip", "Content-Type": "application/json"}
+
+    assert client.post("/api/ingest", content=b'{"data": [', headers={"Content-Type": "application/json"}).status_code == 400
+    assert client.post("/api/ingest", content=body, headers={"Content-Encoding": "br"}).status_code == 415
+
+    response = client.post("/api/ingest", content=body, headers=headers)
+    assert response.status_code == 202
+    assert response.json()["accepted"] == 1
+
+    # Nothing drains the queue in this test, so the next push is turned away
+    response = client.post("/api/ingest", content=body, headers=headers)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
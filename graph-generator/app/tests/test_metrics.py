@@ -0,0 +1,44 @@
+import asyncio
+import time
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.core import metrics
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_instrument_job_records_duration_and_overruns():
+    def sample(name):
+        return REGISTRY.get_sample_value(name, {"job": "test_job"}) or 0
+
+    async def slow_job():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    runs_before = sample("scheduler_job_seconds_count")
+    overruns_before = sample("scheduler_job_overruns_total")
+
+    assert asyncio.run(metrics.instrument_job("test_job", slow_job, interval_seconds=0.01)()) == "done"
+    assert metrics.instrument_job("test_job", lambda: 1, interval_seconds=60)() == 1
+
+    assert sample("scheduler_job_seconds_count") == runs_before + 2
+    assert sample("scheduler_job_overruns_total") == overruns_before + 1
+
+
+def test_ingest_lag_is_computed_at_scrape_time():
+    metrics.record_ingest_checkpoint("lag-service", int((time.time() - 120) * 1e6))
+    lag = REGISTRY.get_sample_value("ingest_lag_seconds", {"service": "lag-service"})
+    assert 119 < lag < 130
+
+    metrics.record_ingest_checkpoint("lag-service", int(time.time() * 1e6))
+    assert REGISTRY.get_sample_value("ingest_lag_seconds", {"service": "lag-service"}) < 10
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "jaeger_request_seconds" in response.text
+    assert "graph_build_seconds" in response.text
@@ -0,0 +1,73 @@
+import mongomock
+from networkx.readwrite import json_graph
+from app.services import operation_graph
+from app.services.operation_graph import OperationGraph
+from app.services.span_store import project_trace_spans
+
+SERVICE_IDS = {"gateway": 1, "orders": 2}
+SERVICE_NAMES = {service_id: name for name, service_id in SERVICE_IDS.items()}
+
+
+def _span(span_id, process_id, operation, parent=None, duration=10, error=False):
+    span = {"spanID": span_id, "processID": process_id, "operationName": operation, "startTime": 1_000_000,
+            "duration": duration, "references": []}
+    if parent:
+        span["references"].append({"refType": "CHILD_OF", "spanID": parent})
+    if error:
+        span["tags"] = [{"key": "error", "value": True}]
+    return span
+
+
+def _document(trace_id, spans):
+    trace = {"traceID": trace_id, "processes": {"p1": {"serviceName": "gateway"}, "p2": {"serviceName": "orders"}},
+             "spans": spans}
+    return project_trace_spans(trace, SERVICE_IDS)
+
+
+def _graph(monkeypatch):
+    monkeypatch.setattr(operation_graph, "get_service_names", lambda ids: {i: SERVICE_NAMES[i] for i in ids})
+    graph = OperationGraph()
+    graph.add_span_document(_document("t1", [
+        _span("a1", "p1", "GET /orders"),
+        _span("a2", "p1", "auth", parent="a1", duration=4),
+        _span("b1", "p2", "list", parent="a1", duration=30, error=True),
+        _span("b2", "p2", "list", parent="a1", duration=10),
+        _span("b3", "p2", "list", parent="b2"),  # Exact self-loop
+    ]))
+    graph.add_span_document(_document("t2", [
+        _span("a1", "p1", "GET /orders"),
+        _span("b1", "p2", "list", parent="a1", duration=20),
+    ]))
+    return graph
+
+
+def test_operation_edges_keep_intra_service_calls_and_count_per_trace(monkeypatch):
+    graph = _graph(monkeypatch)
+    assert (graph.node_count, graph.edge_count) == (3, 2)
+
+    links = {(link["source"], link["target"]): link for link in graph.to_node_link()["links"]}
+    assert links.keys() == {("gateway:GET /orders", "gateway:auth"), ("gateway:GET /orders", "orders:list")}
+    orders = links[("gateway:GET /orders", "orders:list")]
+    assert (orders["weight"], orders["traces"], orders["errors"], orders["mean_latency_us"]) == (3, 2, 1, 20)
+
+
+def test_networkx_agrees_with_node_link(monkeypatch):
+    graph = _graph(monkeypatch)
+    assert json_graph.node_link_data(graph.to_networkx(), edges="links") == graph.to_node_link()
+
+
+def test_edge_documents_round_trip_and_replayed_archive_batch_counts_once(monkeypatch):
+    graph = _graph(monkeypatch)
+    restored = OperationGraph()
+    for document in graph.edge_documents():
+        restored.add_edge_document(document)
+    assert restored.to_node_link() == graph.to_node_link()
+
+    archive = mongomock.MongoClient().db.operation_edge_archive
+    archive.create_index([(field, 1) for field in operation_graph.OPERATION_EDGE_KEY], unique=True)
+    operation_graph.increment_operation_edges(archive, graph, batch_id="b1")
+    operation_graph.increment_operation_edges(archive, graph, batch_id="b1")  # Replayed after a crash
+    operation_graph.increment_operation_edges(archive, graph, batch_id="b2")
+    archived = operation_graph.read_operation_edges(archive)
+    assert sorted(archived.calls) == sorted(2 * calls for calls in graph.calls)
+    assert sorted(archived.traces) == sorted(2 * traces for traces in graph.traces)
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.pagination import decode_cursor, encode_cursor, iter_keyset_async
+
+client = TestClient(app)
+
+
+def test_cursor_round_trip():
+    object_id = ObjectId()
+    assert decode_cursor(encode_cursor(object_id)) == object_id
+
+
+def test_decode_cursor_rejects_garbage():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_get_traces_rejects_invalid_cursor():
+    response = client.get("/api/traces", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+class _FakeAsyncCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, field, direction):
+        self.documents = sorted(self.documents, key=lambda document: document[field])
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length):
+        return [dict(document) for document in self.documents]
+
+
+class _FakeAsyncCollection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.finds = 0
+
+    def find(self, query, projection=None):
+        self.finds += 1
+        after = query.get("_id", {}).get("$gt")
+        return _FakeAsyncCursor([d for d in self.documents if after is None or d["_id"] > after])
+
+
+def test_iter_keyset_async_pages_in_id_order():
+    documents = [{"_id": ObjectId(), "n": n} for n in range(5)]
+    collection = _FakeAsyncCollection(list(reversed(documents)))
+
+    async def read_all():
+        # Consumers may strip `_id` while iterating
+        return [document.pop("_id") and document["n"] async for document in iter_keyset_async(collection, batch_size=2)]
+
+    assert asyncio.run(read_all()) == [0, 1, 2, 3, 4]
+    assert collection.finds == 3
@@ -0,0 +1,181 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from pymongo import errors
+
+from app.core.config import settings
+from app.core.database import db_manager
+from app.services.replica_coordinator import LeaseLostError, ReplicaCoordinator, ensure_lease_held
+
+
+class _AsyncCollection:
+    """
+    Awaitable facade over a mongomock collection, for the methods the coordinator calls.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.failures = 0  # Upcoming update_one calls that fail as if MongoDB were unreachable
+
+    async def update_one(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise errors.AutoReconnect("connection lost")
+        return self.collection.update_one(*args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return self.collection.delete_one(*args, **kwargs)
+
+
+def _leases(monkeypatch, lease_seconds=60):
+    leases = _AsyncCollection(mongomock.MongoClient().db.collection_leases)
+    monkeypatch.setattr(db_manager, "get_async_collection_leases_collection", lambda: leases)
+    monkeypatch.setattr(settings, "COLLECTOR_LEASE_SECONDS", lease_seconds)
+    return leases
+
+
+def test_acquire_contend_take_over_lapsed_and_release(monkeypatch):
+    leases = _leases(monkeypatch)
+    first, second = ReplicaCoordinator("replica-a"), ReplicaCoordinator("replica-b")
+
+    async def scenario():
+        assert await first.acquire("job:x")
+        assert await first.acquire("job:x")  # Renewal
+        assert not await second.acquire("job:x")  # The upsert collides with the live lease
+
+        leases.collection.update_one(
+            {"_id": "job:x"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+        assert await second.acquire("job:x")
+        await first.release("job:x")  # No longer the owner, so the lease stays
+        assert leases.collection.find_one({"_id": "job:x"})["owner"] == "replica-b"
+        await second.release("job:x")
+        assert leases.collection.find_one({"_id": "job:x"}) is None
+
+    asyncio.run(scenario())
+    assert (first.get_stats()["leases_acquired"], second.get_stats()["leases_contended"]) == (1, 1)
+    assert second.get_stats()["leases_held"] == []
+
+
+def test_run_with_lease_runs_once_and_releases(monkeypatch):
+    leases = _leases(monkeypatch)
+    first, second = ReplicaCoordinator("replica-a"), ReplicaCoordinator("replica-b")
+    calls = []
+
+    async def job():
+        calls.append(leases.collection.find_one({"_id": "job:x"})["owner"])
+        return "done"
+
+    async def scenario():
+        await second.acquire("job:x")
+        assert await first.run_with_lease("job:x", job) == (False, None)
+        await second.release("job:x")
+        return await first.run_with_lease("job:x", job)
+
+    assert asyncio.run(scenario()) == (True, "done")
+    assert calls == ["replica-a"]
+    assert leases.collection.find_one({"_id": "job:x"}) is None
+
+
+def test_run_with_lease_serializes_runs_in_one_process(monkeypatch):
+    _leases(monkeypatch)
+    coordinator = ReplicaCoordinator("replica-a")
+    running, overlapping = [], []
+
+    async def job():
+        overlapping.append(len(running))
+        running.append(True)
+        await asyncio.sleep(0.01)
+        running.pop()
+        return "done"
+
+    async def scenario():
+        return await asyncio.gather(*(coordinator.run_with_lease("job:x", job) for _ in range(3)))
+
+    # Sharing the lease, a second run would otherwise renew it and release it under the first
+    assert asyncio.run(scenario()) == [(True, "done")] * 3
+    assert overlapping == [0, 0, 0]
+
+
+def test_renewal_retries_mongodb_errors_while_the_lease_holds(monkeypatch):
+    leases = _leases(monkeypatch, lease_seconds=0.06)
+    coordinator = ReplicaCoordinator("replica-a")
+
+    async def job():
+        leases.failures = 1
+        await asyncio.sleep(0.1)
+        return "done"
+
+    assert asyncio.run(coordinator.run_with_lease("job:x", job)) == (True, "done")
+    assert leases.failures == 0
+    assert coordinator.get_stats()["leases_lost"] == 0
+
+
+def test_losing_the_lease_cancels_the_job(monkeypatch):
+    leases = _leases(monkeypatch, lease_seconds=0.06)
+    coordinator = ReplicaCoordinator("replica-a")
+    finished = []
+
+    async def job():
+        leases.collection.update_one({"_id": "job:x"}, {"$set": {
+            "owner": "replica-b", "expires_at": datetime.now(timezone.utc) + timedelta(seconds=60),
+        }})
+        await asyncio.sleep(1)
+        finished.append(True)
+
+    with pytest.raises(LeaseLostError):
+        asyncio.run(coordinator.run_with_lease("job:x", job))
+    assert not finished
+    assert coordinator.get_stats()["leases_lost"] == 1
+    assert leases.collection.find_one({"_id": "job:x"})["owner"] == "replica-b"
+
+
+def test_losing_the_lease_stops_the_worker_thread_between_batches(monkeypatch):
+    leases = _leases(monkeypatch, lease_seconds=0.06)
+    coordinator = ReplicaCoordinator("replica-a")
+    batches = []
+
+    def job(lease_held):
+        leases.collection.update_one({"_id": "job:x"}, {"$set": {
+            "owner": "replica-b", "expires_at": datetime.now(timezone.utc) + timedelta(seconds=60),
+        }})
+        for batch in range(100):
+            ensure_lease_held(lease_held)
+            batches.append(batch)
+            time.sleep(0.01)
+        return "done"
+
+    with pytest.raises(LeaseLostError):
+        asyncio.run(coordinator.run_in_thread_with_lease("job:x", job))
+    assert 0 < len(batches) < 100
+    assert coordinator.get_stats()["leases_lost"] == 1
+
+
+def test_cancelled_caller_keeps_the_lease_until_the_worker_thread_returns(monkeypatch):
+    leases = _leases(monkeypatch, lease_seconds=0.06)
+    coordinator = ReplicaCoordinator("replica-a")
+    started, owners = threading.Event(), []
+
+    def job(lease_held):
+        started.set()
+        while lease_held():
+            time.sleep(0.01)
+        time.sleep(0.1)  # Longer than the lease, so it lapses unless it is still renewed
+        lease = leases.collection.find_one({"_id": "job:x"})
+        owners.append((lease["owner"], lease["expires_at"].replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)))
+
+    async def scenario():
+        run = asyncio.ensure_future(coordinator.run_in_thread_with_lease("job:x", job))
+        await asyncio.to_thread(started.wait)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        return leases.collection.find_one({"_id": "job:x"})
+
+    assert asyncio.run(scenario()) is None
+    assert owners == [("replica-a", True)]
+    assert coordinator.get_stats()["leases_lost"] == 0
@@ -0,0 +1,129 @@
+from datetime import datetime, timezone
+
+from app.services import graph_updater, retention
+from app.services.span_store import expand_trace_spans
+
+
+class _FakeCursor(list):
+    def limit(self, count):
+        return _FakeCursor(self[:count])
+
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        if isinstance(condition, dict) and "$exists" in condition:
+            if (field in doc) != condition["$exists"]:
+                return False
+        elif isinstance(condition, dict) and "$in" in condition:
+            if doc.get(field) not in condition["$in"]:
+                return False
+        elif isinstance(condition, dict):
+            continue  # Range filters on start_time and ingest_seq; every test document qualifies
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class _FakeSpanStore:
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+        self.expired = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return _FakeCursor(dict(doc) for doc in self.documents if _matches(doc, query))
+
+    def update_many(self, query, update):
+        for doc in self.documents:
+            if _matches(doc, query):
+                doc.update(update["$set"])
+                if "expire_at" in update["$set"]:
+                    self.expired.append(doc["_id"])
+
+    def distinct(self, field, query):
+        return list({doc[field] for doc in self.documents if _matches(doc, query)})
+
+
+class _FakeStateCollection:
+    def __init__(self):
+        self.state = {}
+
+    def find_one(self, *args, **kwargs):
+        return dict(self.state)
+
+    def update_one(self, query, update, upsert=False):
+        self.state.update(update["$set"])
+
+
+def _span_document(index, start_time):
+    return {
+        "_id": index,
+        "traceID": f"t{index}",
+        "ingest_seq": index,
+        "start_time": start_time,
+        "ops": ["call"],
+        "spans": [{"i": 1, "v": 1, "o": 0}, {"i": 2, "p": 1, "v": 2, "o": 0, "s": 10, "d": 100}],
+    }
+
+
+def _install_archive(monkeypatch, archived):
+    monkeypatch.setattr(graph_updater, "expand_span_documents",
+                        lambda docs: [expand_trace_spans(doc, {1: "gateway", 2: "orders"}) for doc in docs])
+    monkeypatch.setattr(graph_updater, "write_edge_archive",
+                        lambda counters, batch_id: archived.append((batch_id, counters)))
+    monkeypatch.setattr(graph_updater, "write_operation_edge_archive", lambda graph, batch_id: None)
+
+
+def test_archive_folds_synced_traces_before_expiring_them(monkeypatch):
+    now = datetime(2024, 1, 10, 12, 30, tzinfo=timezone.utc)
+    trace_spans = _FakeSpanStore([_span_document(1, 0), _span_document(2, 0)])
+    state = _FakeStateCollection()
+    state.state["last_synced_seq"] = 2
+    archived = []
+    monkeypatch.setattr(retention.settings, "SPAN_STORE_RETENTION_HOURS", 24)
+    monkeypatch.setattr(retention.db_manager, "trace_spans", trace_spans)
+    monkeypatch.setattr(retention.db_manager, "trace_collection_updates", state)
+    _install_archive(monkeypatch, archived)
+
+    assert retention.archive_expiring_traces(batch_size=1, now=now) == 2
+
+    assert trace_spans.expired == [1, 2]
+    assert len({batch_id for batch_id, _ in archived}) == 2
+    assert [(edge, counts[:2]) for _, counters in archived for edge, counts in counters.items()] == [
+        (("gateway", "orders"), [1, 1]),
+        (("gateway", "orders"), [1, 1]),
+    ]
+    query = trace_spans.queries[0]
+    assert query["ingest_seq"] == {"$lte": 2}
+    assert query["archive_batch"] == {"$exists": False}
+    # The horizon is hour-aligned: 2024-01-09 12:00 UTC
+    assert query["start_time"]["$lt"] == state.state["archive_horizon_us"] == 1704801600 * 1_000_000
+
+
+def test_archive_finishes_an_interrupted_batch_first(monkeypatch):
+    now = datetime(2024, 1, 10, 12, 30, tzinfo=timezone.utc)
+    # Document 1 was stamped by a run that stopped before expiring it; its batch may or may
+    # not have reached the archive, which skips edges that already hold the batch id
+    pending = dict(_span_document(1, 0), archive_batch="interrupted")
+    trace_spans = _FakeSpanStore([pending, _span_document(2, 0)])
+    state = _FakeStateCollection()
+    state.state["last_synced_seq"] = 2
+    archived = []
+    monkeypatch.setattr(retention.settings, "SPAN_STORE_RETENTION_HOURS", 24)
+    monkeypatch.setattr(retention.db_manager, "trace_spans", trace_spans)
+    monkeypatch.setattr(retention.db_manager, "trace_collection_updates", state)
+    _install_archive(monkeypatch, archived)
+
+    assert retention.archive_expiring_traces(batch_size=10, now=now) == 2
+
+    assert archived[0][0] == "interrupted"
+    assert [sum(counts[1] for counts in counters.values()) for _, counters in archived] == [1, 1]
+    assert trace_spans.expired == [1, 2]
+
+
+def test_retention_disabled_with_zero_hours(monkeypatch):
+    monkeypatch.setattr(retention.settings, "SPAN_STORE_RETENTION_HOURS", 0)
+    monkeypatch.setattr(retention.settings, "RAW_TRACE_RETENTION_HOURS", 0)
+    assert retention.archive_expiring_traces() == 0
+    assert retention.expire_raw_traces() == 0
@@ -0,0 +1,25 @@
+from app.services.rollups import collect_edge_rollups
+
+
+def _trace(start_s, error=False):
+    return {
+        "processes": {"p1": {"serviceName": "gateway"}, "p2": {"serviceName": "orders"}},
+        "spans": [
+            {"spanID": "a", "processID": "p1", "references": [], "startTime": start_s * 1_000_000},
+            {
+                "spanID": "b",
+                "processID": "p2",
+                "references": [{"refType": "CHILD_OF", "spanID": "a"}],
+                "startTime": start_s * 1_000_000 + 500,
+                "tags": [{"key": "error", "type": "bool", "value": error}],
+            },
+        ],
+    }
+
+
+def test_collect_edge_rollups_buckets_by_minute_and_counts_errors():
+    counters = collect_edge_rollups([_trace(120), _trace(179, error=True), _trace(180)])
+    assert dict(counters) == {
+        (120, "gateway", "orders"): [2, 1],
+        (180, "gateway", "orders"): [1, 0],
+    }
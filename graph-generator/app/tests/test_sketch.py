@@ -0,0 +1,36 @@
+import random
+
+from app.utils.sketch import LatencySketch
+
+
+def test_quantiles_within_relative_accuracy():
+    values = sorted(random.Random(7).randint(1, 5_000_000) for _ in range(20_000))
+    sketch = LatencySketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    for q in (0.5, 0.95, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.011 * exact
+
+
+def test_merge_is_exact_and_order_independent():
+    rng = random.Random(3)
+    left, right, combined = LatencySketch(), LatencySketch(), LatencySketch()
+    for i in range(5_000):
+        value = rng.randint(0, 1_000_000)
+        (left if i % 2 else right).add(value)
+        combined.add(value)
+
+    assert left.merge(right).to_dict() == combined.to_dict()
+
+
+def test_bins_are_bounded_and_serialization_round_trips():
+    sketch = LatencySketch(max_bins=64)
+    for value in range(1, 1_000_000, 97):
+        sketch.add(value)
+
+    assert len(sketch.bins) <= 64
+    restored = LatencySketch.from_json(sketch.to_json())
+    assert restored.to_dict() == sketch.to_dict()
+    assert restored.quantile(0.99) == sketch.quantile(0.99)
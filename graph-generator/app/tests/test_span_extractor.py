@@ -0,0 +1,38 @@
+from app.services.graph_processor import generate_weighted_graph_from_traces
+from app.services.span_extractor import derive_trace_fields, iter_span_edges
+
+TRACE = {
+    "traceID": "t1",
+    "processes": {"p1": {"serviceName": "gateway"}, "p2": {"serviceName": "orders"}},
+    "spans": [
+        {"spanID": "c", "processID": "p2", "references": [{"refType": "CHILD_OF", "spanID": "b"}]},
+        {"spanID": "b", "processID": "p2", "references": [{"refType": "CHILD_OF", "spanID": "a"}]},
+        {"spanID": "a", "processID": "p1", "references": []},
+        {"spanID": "d", "processID": "p9", "references": [{"refType": "CHILD_OF", "spanID": "a"}]},
+        {"spanID": "e", "processID": "p2", "references": [{"refType": "CHILD_OF", "spanID": "missing"}]},
+    ],
+}
+
+
+def test_iter_span_edges_resolves_parents_out_of_order():
+    edges = [(parent, child, span["spanID"]) for parent, child, span in iter_span_edges(TRACE)]
+    assert edges == [("orders", "orders", "c"), ("gateway", "orders", "b"), ("gateway", None, "d")]
+
+
+def test_weighted_graph_skips_self_loops_and_unknown_services():
+    graph = generate_weighted_graph_from_traces([TRACE, TRACE])
+    assert [(parent, child, data["weight"]) for parent, child, data in graph.edges(data=True)] == [
+        ("gateway", "orders", 2)
+    ]
+
+
+def test_derive_trace_fields():
+    assert derive_trace_fields(TRACE) == {
+        "service_edges": [
+            {"parent": "gateway", "child": None},
+            {"parent": "gateway", "child": "orders"},
+            {"parent": "orders", "child": "orders"},
+        ],
+        "services": ["gateway", "orders"],
+        "start_time": None,
+    }
@@ -0,0 +1,51 @@
+from app.services.graph_processor import count_service_edges
+from app.services.rollups import collect_edge_rollups
+from app.services.span_extractor import get_longest_call_chain
+from app.services.span_store import expand_trace_spans, project_trace_spans
+
+SERVICE_IDS = {"gateway": 1, "orders": 2, "payments": 3}
+SERVICE_NAMES = {service_id: name for name, service_id in SERVICE_IDS.items()}
+
+TRACE = {
+    "traceID": "t1",
+    "processes": {
+        "p1": {"serviceName": "gateway", "tags": [{"key": "hostname", "value": "gw-1"}]},
+        "p2": {"serviceName": "orders", "tags": []},
+        "p3": {"serviceName": "payments", "tags": []},
+    },
+    "spans": [
+        {"spanID": "00000000000000b2", "processID": "p2", "operationName": "create", "startTime": 1_000_050,
+         "duration": 30, "references": [{"refType": "CHILD_OF", "spanID": "f0000000000000a1"}],
+         "tags": [{"key": "error", "value": True}], "logs": [{"timestamp": 1, "fields": []}]},
+        {"spanID": "f0000000000000a1", "processID": "p1", "operationName": "GET /orders", "startTime": 1_000_000,
+         "duration": 120, "references": [], "tags": [{"key": "span.kind", "value": "server"}]},
+        {"spanID": "c3", "processID": "p3", "operationName": "charge", "startTime": 1_000_070, "duration": 10,
+         "references": [{"refType": "CHILD_OF", "spanID": "00000000000000b2"}]},
+        {"spanID": "d4", "processID": "p9", "operationName": "create", "startTime": 1_000_090, "duration": 5,
+         "references": [{"refType": "FOLLOWS_FROM", "spanID": "c3"}]},
+    ],
+}
+
+
+def test_projection_drops_tags_and_logs_and_interns_services():
+    document = project_trace_spans(TRACE, SERVICE_IDS)
+    assert document["start_time"] == 1_000_000
+    assert document["parents"] == [1, 2]
+    assert document["ops"] == ["create", "GET /orders", "charge"]
+    assert document["spans"][0] == {"i": 0xB2, "p": 0xF0000000000000A1 - (1 << 64), "v": 2, "o": 0, "s": 50,
+                                    "d": 30, "e": True}
+    assert document["spans"][3] == {"i": "d4", "o": 0, "s": 90, "d": 5}
+
+
+def test_expanded_projection_builds_the_same_graph_and_rollups():
+    expanded = expand_trace_spans({"traceID": "t1", **project_trace_spans(TRACE, SERVICE_IDS)}, SERVICE_NAMES)
+
+    assert [span["spanID"] for span in expanded["spans"]] == [span["spanID"] for span in TRACE["spans"]]
+    original_edges = count_service_edges([TRACE])
+    expanded_edges = count_service_edges([expanded])
+    assert original_edges.keys() == expanded_edges.keys()
+    for edge, (weight, traces, sketch) in original_edges.items():
+        assert expanded_edges[edge][:2] == [weight, traces]
+        assert expanded_edges[edge][2].to_dict() == sketch.to_dict()
+    assert collect_edge_rollups([expanded]) == collect_edge_rollups([TRACE])
+    assert get_longest_call_chain(expanded) == get_longest_call_chain(TRACE)
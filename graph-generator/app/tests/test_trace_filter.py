@@ -0,0 +1,38 @@
+from app.services.trace_filter import ENTRY_OVERHEAD_BYTES, RecentTraceFilter
+
+
+def _trace(trace_id, spans=1):
+    return {"traceID": trace_id, "spans": [{}] * spans}
+
+
+def test_filter_drops_unchanged_and_passes_grown_traces():
+    recent = RecentTraceFilter(max_bytes=1 << 20)
+    recent.remember([("a", _trace("a", 2)), ("b", _trace("b", 2))])
+
+    pending, dropped = recent.filter_new({"a": _trace("a", 2), "b": _trace("b", 3), "c": _trace("c")})
+
+    assert list(pending) == ["b", "c"]
+    assert dropped == 1
+    stats = recent.get_stats()
+    assert (stats["hits"], stats["grown"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 1 / 3
+
+
+def test_filter_evicts_least_recently_seen_past_memory_ceiling():
+    recent = RecentTraceFilter(max_bytes=3 * (ENTRY_OVERHEAD_BYTES + 60))
+    recent.remember([(trace_id, _trace(trace_id)) for trace_id in ("a", "b", "c")])
+    recent.filter_new({"a": _trace("a")})  # Touch "a" so "b" is the oldest
+    recent.remember([("d", _trace("d"))])
+
+    stats = recent.get_stats()
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert stats["evictions"] == 1
+    pending, _ = recent.filter_new({trace_id: _trace(trace_id) for trace_id in ("a", "b", "c", "d")})
+    assert list(pending) == ["b"]
+
+
+def test_disabled_filter_passes_everything():
+    recent = RecentTraceFilter(max_bytes=0)
+    recent.remember([("a", _trace("a"))])
+    pending, dropped = recent.filter_new({"a": _trace("a")})
+    assert list(pending) == ["a"] and dropped == 0
@@ -1,10 +1,65 @@
+from bson import ObjectId
 from fastapi.testclient import TestClient
 from app.main import app
 
 client = TestClient(app)
 
 
-def test_collect_traces():
-    response = client.post("/api/traces/service-a")
-    assert response.status_code == 200
-    assert "traces_collected" in response.json()
+class _AsyncCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, key, direction):
+        self.documents = sorted(self.documents, key=lambda document: document[key])
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents
+
+
+class _AsyncSpanStore:
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        after = query.get("_id", {}).get("$gt", ObjectId(bytes(12)))
+        return _AsyncCursor([
+            dict(document) for document in self.documents
+            if document["_id"] > after and query["spans.v"] in [span["v"] for span in document["spans"]]
+        ])
+
+
+def test_traces_api_reads_the_span_store_without_raw_traces(monkeypatch):
+    from app.services import db_service
+
+    async def service_id(name):
+        return {"gateway": 1}.get(name)
+
+    async def expand(documents):
+        return [{"traceID": document["traceID"]} for document in documents]
+
+    span_store = _AsyncSpanStore([
+        {"_id": ObjectId(f"{index:024x}"), "traceID": f"t{index}", "spans": [{"i": 1, "v": 1 if index != 2 else 2}]}
+        for index in range(1, 5)
+    ])
+    monkeypatch.setattr(db_service.settings, "STORE_RAW_TRACES", False)
+    monkeypatch.setattr(db_service.db_manager, "async_trace_spans", span_store)
+    monkeypatch.setattr(db_service, "get_service_id_async", service_id)
+    monkeypatch.setattr(db_service, "expand_span_documents_async", expand)
+
+    page = client.get("/api/traces", params={"service": "gateway", "limit": 2}).json()
+    assert [trace["traceID"] for trace in page["traces"]] == ["t1", "t3"]
+    assert span_store.queries[0]["spans.v"] == 1
+    page = client.get("/api/traces", params={"service": "gateway", "cursor": page["next_cursor"]}).json()
+    assert [trace["traceID"] for trace in page["traces"]] == ["t4"]
+
+    response = client.get("/api/traces", params={"service": "gateway", "format": "ndjson"})
+    assert response.text.splitlines() == ['{"traceID": "t1"}', '{"traceID": "t3"}', '{"traceID": "t4"}']
+
+    assert client.get("/api/traces", params={"service": "unknown"}).json()["traces"] == []
@@ -1,3 +1,8 @@
 from app.utils.helpers import format_timestamp, calculate_weights
+from app.utils.pagination import encode_cursor, decode_cursor, iter_keyset, iter_keyset_async
+from app.utils.json_stream import JsonArrayStream
+from app.utils.interner import StringInterner
+from app.utils.sketch import LatencySketch
 
-__all__ = ["format_timestamp", "calculate_weights"]
+__all__ = ["format_timestamp", "calculate_weights", "encode_cursor", "decode_cursor", "iter_keyset", "iter_keyset_async",
+           "JsonArrayStream", "StringInterner", "LatencySketch"]
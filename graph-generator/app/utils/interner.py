@@ -0,0 +1,31 @@
+class StringInterner:
+    """
+    Two-way table between strings and dense integer ids, assigned in first-seen order.
+    Lets hot loops and array-backed structures carry small ints instead of repeated strings.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self.values = []
+
+    def intern(self, value):
+        """
+        Return the id of `value`, assigning the next free id on first sight.
+        """
+        value_id = self._ids.get(value)
+        if value_id is None:
+            value_id = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+    def get(self, value):
+        """
+        Return the id of `value`, or None if it was never interned.
+        """
+        return self._ids.get(value)
+
+    def __getitem__(self, value_id):
+        return self.values[value_id]
+
+    def __len__(self):
+        return len(self.values)
@@ -0,0 +1,106 @@
+import codecs
+import json
+import re
+
+# Outside items only quotes and brackets change the scanner state; strings are consumed whole
+_STRUCTURAL = re.compile(r'["{}\[\]]')
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+
+class JsonArrayStream:
+    """
+    Incrementally extract the object items of a JSON array from a byte stream.
+    The array is either the top-level value or the value of one of `keys` in a top-level
+    object, e.g. `{"data": [{...}, {...}]}`. Only the item currently being read is buffered,
+    so a large payload is decoded one item at a time instead of being loaded whole.
+    The envelope is scanned with regexes; each item is decoded by the C JSON decoder.
+    """
+
+    def __init__(self, keys=()):
+        self.keys = set(keys)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._depth = 0
+        self._started = False
+        self._last_key = None
+        self._array_key = None
+        self._array_depth = None
+        # Buffer length an incomplete item must reach before decoding it is retried; doubling
+        # it keeps a large item arriving in many chunks linear instead of quadratic
+        self._retry_length = 0
+
+    def feed(self, chunk):
+        """
+        Scan the next chunk of the body.
+        Returns:
+            list: (key, item) pairs completed by this chunk; key is None for a top-level array.
+        Raises:
+            ValueError: If the body is not valid UTF-8 or its brackets are unbalanced.
+        """
+        buffer = self._buffer + self._text.decode(chunk)
+        if len(buffer) < self._retry_length:
+            self._buffer = buffer
+            return []
+        items = []
+        pos = 0
+        while True:
+            match = _STRUCTURAL.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+            index = match.start()
+            char = buffer[index]
+            pos = index + 1
+
+            if char == '"':
+                string = _STRING.match(buffer, index)
+                if string is None:
+                    pos = index  # The string ends in a later chunk; rescan it then
+                    break
+                pos = string.end()
+                if self._depth == 1:
+                    self._last_key = buffer[index + 1:pos - 1]
+            elif char == "{" and self._depth == self._array_depth:
+                try:
+                    item, pos = self._json.raw_decode(buffer, index)
+                except json.JSONDecodeError:
+                    # Most likely incomplete; an invalid item surfaces as a truncated body in close()
+                    self._retry_length = 2 * (len(buffer) - index)
+                    pos = index
+                    break
+                self._retry_length = 0
+                items.append((self._array_key, item))
+            elif char in "{[":
+                if self._depth == 0:
+                    self._started = True
+                if char == "[" and self._array_depth is None:
+                    if self._depth == 0:
+                        self._array_key, self._array_depth = None, 1
+                    elif self._depth == 1 and self._last_key in self.keys:
+                        self._array_key, self._array_depth = self._last_key, 2
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth < 0:
+                    raise ValueError("Unbalanced JSON: unexpected closing bracket.")
+                if char == "]" and self._array_depth is not None and self._depth == self._array_depth - 1:
+                    self._array_depth = None
+
+        self._buffer = buffer[pos:]
+        return items
+
+    def close(self):
+        """
+        Finish the stream, decoding any item still held back for more data.
+        Returns:
+            list: (key, item) pairs completed at the end of the body.
+        Raises:
+            ValueError: If the body was empty, truncated or held an invalid item.
+        """
+        self._text.decode(b"", final=True)
+        self._retry_length = 0
+        items = self.feed(b"")
+        if not self._started or self._depth != 0 or self._buffer.strip():
+            raise ValueError("Truncated or invalid JSON body.")
+        return items
@@ -0,0 +1,78 @@
+import base64
+from bson import ObjectId
+from bson.errors import InvalidId
+
+
+def encode_cursor(object_id):
+    """
+    Encode a document `_id` as an opaque, URL-safe pagination cursor.
+    """
+    return base64.urlsafe_b64encode(ObjectId(object_id).binary).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by `encode_cursor`.
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (InvalidId, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def iter_keyset(collection, query=None, projection=None, batch_size=100, after=None):
+    """
+    Lazily iterate a collection in `_id` order using keyset (range) queries.
+    Every batch is a fresh indexed `_id > last_seen` query, so reading the whole
+    collection stays linear and no server cursor is held open between batches.
+    Args:
+        collection: PyMongo collection.
+        query (dict): Additional filter; must not constrain `_id`.
+        projection (dict): Fields to return; `_id` is always included.
+        batch_size (int): Documents per round trip.
+        after (ObjectId): Resume after this `_id`.
+    Yields:
+        dict: Documents in ascending `_id` order.
+    """
+    query = dict(query or {})
+    if projection is not None:
+        # `_id` drives the keyset, so it can never be projected out
+        projection = {field: value for field, value in projection.items() if field != "_id"} or None
+
+    while True:
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        batch = list(collection.find(query, projection).sort("_id", 1).limit(batch_size))
+        if not batch:
+            return
+        last_id = batch[-1]["_id"]  # Read before yielding; consumers may strip `_id`
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        after = last_id
+
+
+async def iter_keyset_async(collection, query=None, projection=None, batch_size=100, after=None):
+    """
+    Async counterpart of `iter_keyset` for an async PyMongo collection.
+    Yields:
+        dict: Documents in ascending `_id` order.
+    """
+    query = dict(query or {})
+    if projection is not None:
+        projection = {field: value for field, value in projection.items() if field != "_id"} or None
+
+    while True:
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        batch = await collection.find(query, projection).sort("_id", 1).limit(batch_size).to_list(None)
+        if not batch:
+            return
+        last_id = batch[-1]["_id"]
+        for document in batch:
+            yield document
+        if len(batch) < batch_size:
+            return
+        after = last_id
@@ -0,0 +1,108 @@
+import json
+import math
+
+
+class LatencySketch:
+    """
+    Mergeable quantile sketch with bounded relative error (DDSketch-style).
+    Values are counted in logarithmic buckets, so memory depends on the value range
+    and `max_bins`, never on how many values were added. Counts are integers, which
+    makes merging exact and independent of order.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=512):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, count=1):
+        """
+        Record `count` occurrences of a non-negative value.
+        """
+        if value <= 0:
+            self.zero_count += count
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + count
+            self._collapse()
+        self.count += count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """
+        Add another sketch with the same accuracy into this one.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy.")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """
+        Estimate the q-quantile (0 <= q <= 1), or None for an empty sketch.
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                estimate = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def _collapse(self):
+        # Fold the lowest buckets upwards; high percentiles keep their accuracy
+        excess = len(self.bins) - self.max_bins
+        if excess <= 0:
+            return
+        keys = sorted(self.bins)
+        target = keys[excess]
+        for key in keys[:excess]:
+            self.bins[target] += self.bins.pop(key)
+
+    def to_dict(self):
+        keys = sorted(self.bins)
+        return {
+            "a": self.relative_accuracy,
+            "m": self.max_bins,
+            "z": self.zero_count,
+            "k": keys,
+            "c": [self.bins[key] for key in keys],
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(relative_accuracy=data["a"], max_bins=data["m"])
+        sketch.bins = dict(zip(data["k"], data["c"]))
+        sketch.zero_count = data["z"]
+        sketch.count = sketch.zero_count + sum(data["c"])
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        return sketch
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, value):
+        return cls.from_dict(json.loads(value))
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark for span-to-edge extraction on synthetic wide and deep traces.
+
+Compares the former per-span linear parent search with the indexed extractor
+in app.services.span_extractor.
+
+Run from the graph-generator directory:
+    python -m benchmarks.bench_span_edges --spans 3000 --repeat 3
+"""
+import argparse
+import random
+import time
+
+from app.services.span_extractor import iter_span_edges
+
+
+def make_trace(span_count, shape, services=10):
+    """
+    Build a synthetic Jaeger trace.
+    "wide": every span is a child of the root. "deep": every span is a child of the previous one.
+    Spans are shuffled with a fixed seed since Jaeger does not return them in tree order.
+    """
+    processes = {f"p{i}": {"serviceName": f"service-{i}"} for i in range(services)}
+    spans = []
+    for i in range(span_count):
+        references = []
+        if i > 0:
+            parent = 0 if shape == "wide" else i - 1
+            references.append({"refType": "CHILD_OF", "spanID": f"s{parent}"})
+        spans.append({"spanID": f"s{i}", "processID": f"p{i % services}", "references": references})
+    random.Random(span_count).shuffle(spans)
+    return {"traceID": f"{shape}-{span_count}", "processes": processes, "spans": spans}
+
+
+def legacy_span_edges(trace):
+    """
+    The previous O(spans^2) resolution: a linear search of all spans for every parent.
+    """
+    process_to_service = {pid: details["serviceName"] for pid, details in trace.get("processes", {}).items()}
+    spans = trace.get("spans", [])
+    edges = []
+    for span in spans:
+        parent_span_id = None
+        for ref in span.get("references", []):
+            if ref["refType"] == "CHILD_OF":
+                parent_span_id = ref["spanID"]
+                break
+        if parent_span_id:
+            parent_span = next((s for s in spans if s["spanID"] == parent_span_id), None)
+            if parent_span and parent_span.get("processID") in process_to_service:
+                edges.append((process_to_service[parent_span["processID"]],
+                              process_to_service.get(span.get("processID")), span))
+    return edges
+
+
+def indexed_span_edges(trace):
+    return list(iter_span_edges(trace))
+
+
+def best_of(func, trace, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(trace)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spans", type=int, default=3000, help="Spans per synthetic trace")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is reported")
+    args = parser.parse_args()
+
+    for shape in ("wide", "deep"):
+        trace = make_trace(args.spans, shape)
+        assert legacy_span_edges(trace) == indexed_span_edges(trace), "extractors disagree"
+        legacy = best_of(legacy_span_edges, trace, args.repeat)
+        indexed = best_of(indexed_span_edges, trace, args.repeat)
+        print(f"{shape:>4} trace, {args.spans} spans: legacy {legacy * 1e3:9.2f} ms, "
+              f"indexed {indexed * 1e3:7.2f} ms, speedup {legacy / indexed:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Local stand-in for the Jaeger query API (`/api/services`, `/api/traces`).
+"""
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeJaeger:
+    """
+    Serve a fixed trace corpus over HTTP like Jaeger's query service.
+    `/api/traces` returns at most `limit` traces involving `service` whose root span starts
+    in [start, end], newest first, exactly like the real API truncates.
+    Use as a context manager; `base_url` is the value for JAEGER_BASE_URL.
+    """
+
+    def __init__(self, traces, latency_ms=0.0, host="127.0.0.1", port=0):
+        self.latency_s = latency_ms / 1000
+        self.requests = 0
+        self._index = {}
+        for trace in traces:
+            start = min(span["startTime"] for span in trace["spans"])
+            for service in {process["serviceName"] for process in trace["processes"].values()}:
+                self._index.setdefault(service, []).append((start, trace))
+        for entries in self._index.values():
+            entries.sort(key=lambda entry: entry[0])
+        self._starts = {service: [start for start, _ in entries] for service, entries in self._index.items()}
+
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+    def services(self):
+        return sorted(self._index)
+
+    def find_traces(self, service, start_us, end_us, limit):
+        starts = self._starts.get(service, [])
+        low = bisect.bisect_left(starts, start_us)
+        high = bisect.bisect_right(starts, end_us)
+        entries = self._index.get(service, [])[max(low, high - limit):high]
+        return [trace for _, trace in reversed(entries)]
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests += 1
+                if fake.latency_s:
+                    time.sleep(fake.latency_s)
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path == "/api/services":
+                    self._send({"data": fake.services()})
+                elif url.path == "/api/traces":
+                    self._send({"data": fake.find_traces(
+                        params.get("service"),
+                        int(params.get("start", 0)),
+                        int(params.get("end", 2 ** 63)),
+                        int(params.get("limit", 100)),
+                    )})
+                else:
+                    self.send_error(404)
+
+            def _send(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,266 @@
+"""
+In-process stand-ins for MongoDB (mongomock) and the Neo4j drivers, sync and async.
+"""
+import asyncio
+import time
+
+import bson
+import mongomock
+from pymongo.errors import OperationFailure
+
+from app.core.database import db_manager
+from app.services import graph_processor
+
+MONGO_COLLECTIONS = {
+    "trace_collection": "traces",
+    "trace_updates": "trace_updates",
+    "trace_collection_updates": "trace_collection_updates",
+    "counters": "counters",
+    "edge_rollups": "edge_rollups",
+    "edge_archive": "edge_archive",
+    "trace_spans": "trace_spans",
+    "service_registry": "service_registry",
+    "collector_replicas": "collector_replicas",
+    "collection_leases": "collection_leases",
+    "graph_deltas": "graph_deltas",
+    "operation_edges": "operation_edges",
+    "operation_edge_archive": "operation_edge_archive",
+}
+
+
+class FakeResult(list):
+    """
+    Iterable of dict records with the `consume()` call the app uses on write results.
+    """
+
+    def consume(self):
+        return None
+
+
+class FakeNeo4jDriver:
+    """
+    Minimal Neo4j driver that understands the graph writer's and reader's Cypher statements.
+    `latency_ms` is added to every transaction and auto-commit query to model network round trips.
+    """
+
+    def __init__(self, latency_ms=0.0):
+        self.latency_s = latency_ms / 1000
+        self.edges = {}
+        self.staged_edges = {}
+        self.round_trips = 0
+
+    def session(self, **kwargs):
+        return FakeNeo4jSession(self)
+
+    def verify_connectivity(self):
+        return None
+
+    def close(self):
+        return None
+
+    def execute(self, query, params):
+        if query == graph_processor.MERGE_SERVICE_EDGES_QUERY:
+            for row in params["rows"]:
+                edge = self.edges.setdefault((row["parent"], row["child"]), {"weight": 0, "traces": 0})
+                if row.get("sync_seq") is not None:
+                    if edge.get("sync_seq") == row["sync_seq"]:
+                        continue
+                    edge["sync_seq"] = row["sync_seq"]
+                edge["weight"] += row["weight"]
+                edge["traces"] += row.get("traces", 0)
+                if row.get("latency_sketch"):
+                    edge["latency_sketch"] = row["latency_sketch"]
+            return FakeResult()
+        if query == graph_processor.READ_EDGE_SKETCHES_QUERY:
+            return FakeResult(
+                {"parent": row["parent"], "child": row["child"], "sketch": self.edges[key]["latency_sketch"]}
+                for row in params["rows"]
+                for key in [(row["parent"], row["child"])]
+                if self.edges.get(key, {}).get("latency_sketch")
+            )
+        if query == graph_processor.READ_SERVICE_GRAPH_QUERY:
+            return FakeResult(
+                {"parent": parent, "child": child, "weight": edge["weight"], "traces": edge["traces"],
+                 "latency_sketch": edge.get("latency_sketch")}
+                for (parent, child), edge in self.edges.items()
+            )
+        if query == graph_processor.CLEAR_STAGED_SERVICE_EDGES_QUERY:
+            self.staged_edges.clear()
+            return FakeResult()
+        if query == graph_processor.STAGE_SERVICE_EDGES_QUERY:
+            for row in params["rows"]:
+                self.staged_edges[(row["parent"], row["child"])] = {
+                    "weight": row["weight"], "traces": row["traces"], "latency_sketch": row["latency_sketch"],
+                }
+            return FakeResult()
+        if query == graph_processor.DELETE_SERVICE_EDGES_QUERY:
+            self.edges.clear()
+            return FakeResult()
+        if query == graph_processor.PROMOTE_STAGED_SERVICE_EDGES_QUERY:
+            self.edges.update(self.staged_edges)
+            self.staged_edges.clear()
+            return FakeResult()
+        if query.lstrip().startswith("CREATE CONSTRAINT"):
+            return FakeResult()
+        raise NotImplementedError(f"FakeNeo4jDriver does not understand query: {query}")
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+
+class FakeNeo4jSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, parameters=None, **params):
+        self.driver._round_trip()
+        return self.driver.execute(query, {**(parameters or {}), **params})
+
+    def execute_write(self, work, *args, **kwargs):
+        self.driver._round_trip()
+        return work(FakeNeo4jTransaction(self.driver), *args, **kwargs)
+
+    execute_read = execute_write
+
+
+class FakeNeo4jTransaction:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, query, parameters=None, **params):
+        return self.driver.execute(query, {**(parameters or {}), **params})
+
+
+class AsyncCursorAdapter:
+    """
+    Async PyMongo cursor API (`sort`, `limit`, `to_list`, `async for`) over a mongomock cursor.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, count):
+        self.cursor = self.cursor.limit(count)
+        return self
+
+    async def to_list(self, length=None):
+        documents = list(self.cursor)
+        return documents if length is None else documents[:length]
+
+    async def __aiter__(self):
+        for document in self.cursor:
+            yield document
+
+
+class AsyncCollectionAdapter:
+    """
+    Async PyMongo collection API over a mongomock collection; every other method is awaited as-is.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursorAdapter(self.collection.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline, **kwargs):
+        return AsyncCursorAdapter(self.collection.aggregate(pipeline, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class FakeAsyncResult:
+    def __init__(self, records):
+        self.records = records
+
+    async def __aiter__(self):
+        for record in self.records:
+            yield record
+
+    async def consume(self):
+        return None
+
+
+class FakeAsyncNeo4jDriver:
+    """
+    Async driver API over the same edge state as a FakeNeo4jDriver.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def session(self, **kwargs):
+        return FakeAsyncNeo4jSession(self.driver)
+
+    async def verify_connectivity(self):
+        return None
+
+    async def close(self):
+        return None
+
+
+class FakeAsyncNeo4jSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def run(self, query, parameters=None, **params):
+        self.driver.round_trips += 1
+        if self.driver.latency_s:
+            await asyncio.sleep(self.driver.latency_s)
+        return FakeAsyncResult(self.driver.execute(query, {**(parameters or {}), **params}))
+
+
+def _database_command(database):
+    """
+    mongomock's `Database.command` raises NotImplementedError for most commands; answer
+    collStats from the documents themselves and fail the rest like a server would.
+    """
+    def command(command, *args, **kwargs):
+        if isinstance(command, dict) and "collStats" in command:
+            documents = list(database[command["collStats"]].find())
+            size = sum(len(bson.encode(document)) for document in documents)
+            return {"count": len(documents), "size": size, "storageSize": size, "totalIndexSize": 0}
+        raise OperationFailure(f"mongomock does not support the command {command!r}")
+    return command
+
+
+def install_fake_databases(neo4j_latency_ms=0.0):
+    """
+    Point the global DatabaseManager's sync and async clients at a fresh mongomock database
+    and a fake Neo4j driver.
+    Returns:
+        tuple: (mongomock database, FakeNeo4jDriver)
+    """
+    client = mongomock.MongoClient()
+    database = client["benchmark"]
+    database.command = _database_command(database)
+    db_manager.mongo_client = client
+    for attribute, name in MONGO_COLLECTIONS.items():
+        setattr(db_manager, attribute, database[name])
+        setattr(db_manager, f"async_{attribute}", AsyncCollectionAdapter(database[name]))
+    db_manager.neo4j_driver = FakeNeo4jDriver(latency_ms=neo4j_latency_ms)
+    db_manager.async_neo4j_driver = FakeAsyncNeo4jDriver(db_manager.neo4j_driver)
+    return database, db_manager.neo4j_driver
@@ -0,0 +1,267 @@
+"""
+Offline benchmark harness for the graph generator pipeline.
+
+Generates a synthetic trace corpus, serves it from a local fake Jaeger, and runs the
+collector, ingest, graph build, graph write, graph sync and read endpoints against
+in-process Mongo (mongomock) and Neo4j stand-ins. Results are written as JSON so
+runs can be compared over time.
+
+Run from the graph-generator directory:
+    pip install -r requirements.txt -r benchmarks/requirements.txt
+    python -m benchmarks.run --traces 2000 --output bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import bson
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services import data_collector, graph_processor
+from app.services.graph_cache import graph_cache
+from app.services.graph_updater import sync_graph_incrementally
+from app.services.operation_graph import setup_operation_graph_indexes
+from app.services.rollups import setup_rollup_indexes
+from app.services.span_store import setup_span_store_indexes
+from app.services.trace_filter import recent_traces
+from benchmarks.fake_jaeger import FakeJaeger
+from benchmarks.fakes import install_fake_databases
+from benchmarks.synthetic import SyntheticTraceGenerator
+
+
+def latency_summary(samples_s):
+    """
+    Summarize latency samples (seconds) in milliseconds.
+    """
+    ordered = sorted(samples_s)
+    if not ordered:
+        return {"count": 0}
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1e3, 3),
+        "p50_ms": round(percentile(0.50), 3),
+        "p95_ms": round(percentile(0.95), 3),
+        "p99_ms": round(percentile(0.99), 3),
+        "max_ms": round(ordered[-1] * 1e3, 3),
+    }
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def fresh_databases(args):
+    database, neo4j = install_fake_databases(neo4j_latency_ms=args.neo4j_latency_ms)
+    data_collector.setup_indexes()
+    setup_rollup_indexes()
+    setup_span_store_indexes()
+    setup_operation_graph_indexes()
+    graph_cache.clear()
+    recent_traces.clear()
+    return database, neo4j
+
+
+def bench_collection(corpus, corpus_start_us, services, args):
+    database, _ = fresh_databases(args)
+    with FakeJaeger(corpus, latency_ms=args.jaeger_latency_ms) as jaeger:
+        data_collector.JAEGER_BASE_URL = jaeger.base_url
+        database["trace_updates"].insert_many(
+            [{"service_name": service, "last_fetched_end_time_us": corpus_start_us - 1} for service in services]
+        )
+
+        async def sweep():
+            try:
+                await data_collector.fetch_and_store_traces_for_all_services()
+            finally:
+                await data_collector.close_jaeger_client()
+
+        _, elapsed = timed(asyncio.run, sweep())
+        stored = database["trace_spans"].count_documents({})
+        return {
+            "seconds": round(elapsed, 4),
+            "services": len(services),
+            "traces_generated": len(corpus),
+            "traces_stored": stored,
+            "jaeger_requests": jaeger.requests,
+            "traces_per_second": round(stored / elapsed, 1) if elapsed else None,
+        }
+
+
+async def ingest_corpus(corpus, batch_size):
+    """
+    Store the corpus in batches, returning the latency of each batch.
+    """
+    samples = []
+    for start in range(0, len(corpus), batch_size):
+        started = time.perf_counter()
+        await data_collector.store_traces("benchmark", corpus[start:start + batch_size])
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_ingest(corpus, args):
+    database, _ = fresh_databases(args)
+    results = {}
+    # ingest_duplicates_unfiltered re-ingests with an empty recently stored filter, so every
+    # duplicate costs an upsert; ingest_duplicates keeps the filter warm from the previous pass
+    for label in ("ingest", "ingest_duplicates_unfiltered", "ingest_duplicates"):
+        if label == "ingest_duplicates_unfiltered":
+            recent_traces.clear()
+        samples = asyncio.run(ingest_corpus(corpus, args.batch_size))
+        total = sum(samples)
+        results[label] = {
+            "seconds": round(total, 4),
+            "traces_per_second": round(len(corpus) / total, 1) if total else None,
+            "batch_latency": latency_summary(samples),
+        }
+    return results
+
+
+def bench_graph_build(corpus, args):
+    graph, elapsed = timed(graph_processor.generate_weighted_graph_from_traces, corpus)
+    results = {"graph_build": {
+        "seconds": round(elapsed, 4),
+        "traces_per_second": round(len(corpus) / elapsed, 1) if elapsed else None,
+        "edges": graph.number_of_edges(),
+    }}
+    if args.workers > 1:
+        parallel, elapsed = timed(
+            graph_processor.generate_weighted_graph_in_parallel, corpus, workers=args.workers, shard_size=args.shard_size
+        )
+        results["graph_build_parallel"] = {
+            "seconds": round(elapsed, 4),
+            "workers": args.workers,
+            "traces_per_second": round(len(corpus) / elapsed, 1) if elapsed else None,
+            "edges": parallel.number_of_edges(),
+        }
+    return results, graph
+
+
+def bench_graph_write(graph, args):
+    _, neo4j = fresh_databases(args)
+    _, elapsed = timed(graph_processor.update_graph_in_neo4j, graph)
+    return {
+        "seconds": round(elapsed, 4),
+        "edges": graph.number_of_edges(),
+        "round_trips": neo4j.round_trips,
+        "edges_per_second": round(graph.number_of_edges() / elapsed, 1) if elapsed else None,
+    }
+
+
+def bench_graph_sync(corpus, args):
+    database, _ = fresh_databases(args)
+    asyncio.run(ingest_corpus(corpus, args.batch_size))
+    synced, elapsed = timed(sync_graph_incrementally)
+    return {
+        "seconds": round(elapsed, 4),
+        "traces": synced,
+        "traces_per_second": round(synced / elapsed, 1) if elapsed else None,
+        "raw_bytes_per_trace": average_document_bytes(database["traces"]),
+        "span_store_bytes_per_trace": average_document_bytes(database["trace_spans"]),
+    }
+
+
+def average_document_bytes(collection):
+    sizes = [len(bson.encode(document)) for document in collection.find()]
+    return round(sum(sizes) / len(sizes)) if sizes else 0
+
+
+def bench_read_endpoints(parent_service, args):
+    """
+    Measure the read API against the data left by the graph sync stage.
+    """
+    client = TestClient(app)
+
+    def measure(path, params=None, headers=None, before=None):
+        samples, status = [], None
+        for _ in range(args.requests):
+            if before:
+                before()
+            started = time.perf_counter()
+            response = client.get(path, params=params, headers=headers)
+            samples.append(time.perf_counter() - started)
+            status = response.status_code
+        summary = latency_summary(samples)
+        summary["status"] = status
+        return summary
+
+    etag = client.get("/api/graphs/").headers.get("ETag")
+    return {
+        "traces_page": measure("/api/traces", params={"limit": 100}),
+        "traces_ndjson": measure("/api/traces", params={"format": "ndjson"}),
+        "traces_by_parent_service": measure(app.url_path_for("get_trace", service=parent_service)),
+        "graph_cold": measure("/api/graphs/", before=graph_cache.clear),
+        "graph_warm": measure("/api/graphs/"),
+        "graph_not_modified": measure("/api/graphs/", headers={"If-None-Match": etag}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=20, help="Services in the synthetic topology")
+    parser.add_argument("--fan-out", type=int, default=3, help="Downstream calls per span")
+    parser.add_argument("--depth", type=int, default=4, help="Maximum call depth")
+    parser.add_argument("--spans-per-trace", type=int, default=30, help="Spans per trace")
+    parser.add_argument("--traces", type=int, default=2000, help="Traces in the corpus")
+    parser.add_argument("--traces-per-second", type=float, default=20, help="Synthetic arrival rate")
+    parser.add_argument("--batch-size", type=int, default=100, help="Traces per ingest batch")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per read endpoint")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for the parallel graph build stage")
+    parser.add_argument("--shard-size", type=int, default=500, help="Traces per parallel build shard")
+    parser.add_argument("--jaeger-latency-ms", type=float, default=0.0, help="Latency added per Jaeger request")
+    parser.add_argument("--neo4j-latency-ms", type=float, default=0.0, help="Latency added per Neo4j round trip")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    settings.GRAPH_SYNC_SETTLE_SECONDS = 0
+    generator = SyntheticTraceGenerator(
+        services=args.services, fan_out=args.fan_out, depth=args.depth, spans_per_trace=args.spans_per_trace,
+        traces_per_second=args.traces_per_second, seed=args.seed,
+    )
+    now_us = int(datetime.now(timezone.utc).timestamp() * 1e6)
+    corpus_start_us = int(now_us - args.traces / args.traces_per_second * 1e6)
+    corpus, generate_s = timed(lambda: list(generator.generate(args.traces, corpus_start_us)))
+    services = sorted({process["serviceName"] for trace in corpus for process in trace["processes"].values()})
+
+    # The app logs with print; keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        stages = {"collection": bench_collection(corpus, corpus_start_us, services, args)}
+        stages.update(bench_ingest(corpus, args))
+        build_results, graph = bench_graph_build(corpus, args)
+        stages.update(build_results)
+        stages["graph_write"] = bench_graph_write(graph, args)
+        stages["graph_sync"] = bench_graph_sync(corpus, args)
+        stages["read_endpoints"] = bench_read_endpoints(generator.entry_services[0], args)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {**vars(args), "corpus_generation_seconds": round(generate_s, 4)},
+        "stages": stages,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+        print(f"Benchmark results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
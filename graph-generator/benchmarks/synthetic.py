@@ -0,0 +1,92 @@
+"""
+Configurable synthetic Jaeger trace generator for offline benchmarks.
+"""
+import random
+
+
+class SyntheticTraceGenerator:
+    """
+    Generate Jaeger-JSON traces over a fixed, seeded service topology.
+
+    Every trace starts at an entry service and fans out breadth-first: each span calls up to
+    `fan_out` downstream services, at most `depth` levels deep, until the trace has
+    `spans_per_trace` spans. Traces are spaced 1 / `traces_per_second` apart.
+    """
+
+    def __init__(self, services=20, fan_out=3, depth=4, spans_per_trace=30, traces_per_second=50,
+                 operations_per_service=5, error_rate=0.01, seed=42):
+        self.services = [f"service-{i:03d}" for i in range(services)]
+        self.fan_out = fan_out
+        self.depth = depth
+        self.spans_per_trace = spans_per_trace
+        self.traces_per_second = traces_per_second
+        self.operations_per_service = operations_per_service
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+
+        # Stable call topology: each service calls a fixed set of downstream services
+        self.callees = {
+            service: self.rng.sample(self.services, min(fan_out + 1, len(self.services)))
+            for service in self.services
+        }
+        self.entry_services = self.services[:max(1, len(self.services) // 10)]
+
+    def generate(self, count, start_us):
+        """
+        Yield `count` traces whose root spans start at `start_us` and are evenly spaced.
+        """
+        interval_us = 1_000_000 / self.traces_per_second
+        for index in range(count):
+            yield self.make_trace(index, int(start_us + index * interval_us))
+
+    def make_trace(self, index, start_us):
+        rng = self.rng
+        trace_id = f"{rng.getrandbits(64):016x}{index:016x}"
+        processes = {}
+        spans = []
+
+        def process_id(service):
+            for pid, process in processes.items():
+                if process["serviceName"] == service:
+                    return pid
+            pid = f"p{len(processes) + 1}"
+            processes[pid] = {"serviceName": service, "tags": [{"key": "hostname", "type": "string", "value": service}]}
+            return pid
+
+        def add_span(service, parent_span_id, level, span_start_us, duration_us):
+            span_id = f"{rng.getrandbits(64):016x}"
+            error = rng.random() < self.error_rate
+            spans.append({
+                "traceID": trace_id,
+                "spanID": span_id,
+                "operationName": f"{service}.op{rng.randrange(self.operations_per_service)}",
+                "references": [{"refType": "CHILD_OF", "traceID": trace_id, "spanID": parent_span_id}]
+                if parent_span_id else [],
+                "startTime": span_start_us,
+                "duration": duration_us,
+                "tags": [
+                    {"key": "span.kind", "type": "string", "value": "server"},
+                    {"key": "error", "type": "bool", "value": error},
+                ],
+                "logs": [],
+                "processID": process_id(service),
+                "warnings": None,
+            })
+            return span_id, level, service, span_start_us, duration_us
+
+        root = add_span(rng.choice(self.entry_services), None, 0, start_us, rng.randint(20_000, 200_000))
+        frontier = [root]
+        while frontier and len(spans) < self.spans_per_trace:
+            next_frontier = []
+            for span_id, level, service, span_start_us, duration_us in frontier:
+                if level >= self.depth:
+                    continue
+                for callee in rng.sample(self.callees[service], min(self.fan_out, len(self.callees[service]))):
+                    if len(spans) >= self.spans_per_trace:
+                        break
+                    child_start = span_start_us + rng.randint(0, max(1, duration_us // 4))
+                    child_duration = max(1, int(duration_us * rng.uniform(0.1, 0.6)))
+                    next_frontier.append(add_span(callee, span_id, level + 1, child_start, child_duration))
+            frontier = next_frontier
+
+        return {"traceID": trace_id, "spans": spans, "processes": processes, "warnings": None}
@@ -0,0 +1,57 @@
+# Backfill derived fields (service edges, services, start time) on traces stored before ingest computed them
+#
+# Usage (from the graph-generator directory):
+#     python -m scripts.backfill_trace_fields [--batch-size 500]
+import argparse
+import asyncio
+
+from pymongo import UpdateOne
+
+from app.core.database import db_manager
+from app.services.data_collector import setup_indexes
+from app.services.span_extractor import derive_trace_fields
+
+
+def backfill(batch_size):
+    """
+    Add `service_edges`, `services` and `start_time` to every trace document that lacks them.
+    Returns:
+        int: Number of documents updated.
+    """
+    trace_collection = db_manager.get_trace_collection()
+    missing = {"$or": [{"services": {"$exists": False}}, {"start_time": {"$exists": False}}]}
+    cursor = trace_collection.find(missing, {"processes": 1, "spans": 1}, batch_size=batch_size)
+
+    updated = 0
+    operations = []
+    for trace in cursor:
+        operations.append(UpdateOne({"_id": trace["_id"]}, {"$set": derive_trace_fields(trace)}))
+        if len(operations) >= batch_size:
+            updated += trace_collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+            print(f"Backfilled {updated} traces...")
+    if operations:
+        updated += trace_collection.bulk_write(operations, ordered=False).modified_count
+    return updated
+
+
+async def run(batch_size):
+    # One event loop for the whole run: the async Mongo client is bound to the loop that opened it
+    await db_manager.initialize_mongo()
+    try:
+        setup_indexes()
+        updated = await asyncio.to_thread(backfill, batch_size)
+        print(f"Backfill complete. Updated {updated} traces.")
+    finally:
+        await db_manager.close_mongo()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill derived fields on stored traces.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Documents per bulk write")
+    args = parser.parse_args()
+    asyncio.run(run(args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Project traces stored before the span store existed into the compact trace_spans collection
+#
+# Backfilled traces get ingest sequence number 0: incremental graph sync skips them (they are
+# already in the graph), while a full rebuild (POST /api/graphs/rebuild) includes them.
+#
+# Usage (from the graph-generator directory):
+#     python -m scripts.backfill_trace_spans [--batch-size 500]
+import argparse
+import asyncio
+
+from pymongo import UpdateOne
+
+from app.core.database import db_manager
+from app.services.span_extractor import get_process_services
+from app.services.span_store import BACKFILLED_INGEST_SEQ, intern_services, project_trace_spans, setup_span_store_indexes
+
+RAW_TRACE_PROJECTION = {
+    "_id": 0,
+    "traceID": 1,
+    "processes": 1,
+    "spans.spanID": 1,
+    "spans.processID": 1,
+    "spans.references": 1,
+    "spans.operationName": 1,
+    "spans.startTime": 1,
+    "spans.duration": 1,
+    "spans.tags": 1,
+}
+
+
+def backfill(batch_size):
+    """
+    Insert a span store document for every raw trace that does not have one yet.
+    Returns:
+        int: Number of span store documents inserted.
+    """
+    trace_collection = db_manager.get_trace_collection()
+    trace_spans = db_manager.get_trace_spans_collection()
+    cursor = trace_collection.find({}, RAW_TRACE_PROJECTION, batch_size=batch_size)
+
+    inserted = 0
+    operations = []
+    for trace in cursor:
+        service_ids = intern_services(set(get_process_services(trace).values()))
+        operations.append(UpdateOne({"traceID": trace["traceID"]}, {"$setOnInsert": {
+            **project_trace_spans(trace, service_ids),
+            "ingest_seq": BACKFILLED_INGEST_SEQ,
+            "ingested_at_us": 0,
+        }}, upsert=True))
+        if len(operations) >= batch_size:
+            inserted += trace_spans.bulk_write(operations, ordered=False).upserted_count
+            operations = []
+            print(f"Backfilled {inserted} traces...")
+    if operations:
+        inserted += trace_spans.bulk_write(operations, ordered=False).upserted_count
+    return inserted
+
+
+async def run(batch_size):
+    await db_manager.initialize_mongo()
+    try:
+        setup_span_store_indexes()
+        inserted = await asyncio.to_thread(backfill, batch_size)
+        print(f"Backfill complete. Inserted {inserted} span store documents.")
+    finally:
+        await db_manager.close_mongo()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the trace_spans store from raw traces.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Documents per bulk write")
+    args = parser.parse_args()
+    asyncio.run(run(args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
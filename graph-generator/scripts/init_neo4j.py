@@ -1 +1,17 @@
-# Initialize Neo4j schema
\ No newline at end of file
+# Initialize Neo4j schema
+#
+# Usage (from the graph-generator directory):
+#     python -m scripts.init_neo4j
+from app.core.database import db_manager
+
+
+def main():
+    db_manager.initialize_neo4j()
+    try:
+        db_manager.ensure_neo4j_schema()
+    finally:
+        db_manager.close_neo4j()
+
+
+if __name__ == "__main__":
+    main()